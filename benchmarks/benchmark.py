@@ -0,0 +1,294 @@
+#python benchmarks/benchmark.py --output results.json [--compare previous.json]
+
+from __future__ import division, print_function
+
+import sys
+import time
+import json
+import platform
+import argparse
+import timeit
+
+sys.path.append(".")
+sys.path.append("benchmarks")
+sys.path.append("tests")
+import stackimpact
+from stackimpact.metric import Metric, Breakdown
+from stackimpact.sample_recording import replay
+from test_server import TestServer
+from workloads import WORKLOADS, generate_stacks
+
+
+SERVER_PORT = 5020
+
+
+def measure(func, repeat):
+    # the minimum is the least disturbed by other activity on the host
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def measure_warm(func, repeat):
+    # the first run pays for imports, caches and memory growth
+    func()
+    return median(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def measure_interleaved(func, start, stop, repeat):
+    '''Returns the median times of func without and with profiling, from
+    alternating runs after a warm-up run of each, so that drift on the host
+    affects both equally.'''
+
+    def run_profiled():
+        start()
+        try:
+            return timeit.timeit(func, number=1)
+        finally:
+            stop()
+
+    func()
+    run_profiled()
+
+    off_times = []
+    on_times = []
+    for i in range(repeat):
+        # the order alternates too, a run may slow down the next one
+        if i % 2 == 0:
+            off_times.append(timeit.timeit(func, number=1))
+            on_times.append(run_profiled())
+        else:
+            on_times.append(run_profiled())
+            off_times.append(timeit.timeit(func, number=1))
+
+    return median(off_times), median(on_times)
+
+
+def start_agent():
+    stackimpact._agent = None
+    return stackimpact.start(
+        dashboard_address = 'http://localhost:' + str(SERVER_PORT),
+        agent_key = 'key1',
+        app_name = 'BenchmarkApp',
+        auto_profiling = False,
+        auto_destroy = False
+    )
+
+
+def generate_tree(num_nodes, fan_out=10):
+    root = Breakdown('Execution call graph', Breakdown.TYPE_CALLGRAPH)
+
+    count = 1
+    level = [root]
+    while count < num_nodes:
+        next_level = []
+        for parent in level:
+            for i in range(0, fan_out):
+                if count >= num_nodes:
+                    break
+                child = parent.find_or_add_child('func{0} (/app/module{1}.py:{2})'.format(count, count % 10, i))
+                child.set_type(Breakdown.TYPE_CALLSITE)
+                child.increment(0.01, 1)
+                next_level.append(child)
+                count += 1
+        level = next_level
+
+    return root
+
+
+def bench_profiler_overhead(agent, baseline, repeat):
+    profilers = [
+        ('cpu', agent.cpu_reporter.profiler),
+        ('allocation', agent.allocation_reporter.profiler),
+        ('block', agent.block_reporter.profiler),
+    ]
+
+    results = dict()
+
+    # the idle agent is compared with the baseline measured before it started
+    workload_results = dict()
+    for workload_name, workload in WORKLOADS:
+        t = measure_warm(workload, repeat)
+        workload_results[workload_name] = {
+            'time': t,
+            'overhead_percent': (t - baseline[workload_name]) / baseline[workload_name] * 100
+        }
+    results['idle_agent'] = workload_results
+
+    for profiler_name, profiler in profilers:
+        if not profiler.ready:
+            continue
+
+        def start():
+            profiler.reset()
+            profiler.start_profiler()
+
+        workload_results = dict()
+        for workload_name, workload in WORKLOADS:
+            off_time, on_time = measure_interleaved(workload, start, profiler.stop_profiler, repeat)
+            workload_results[workload_name] = {
+                'time': on_time,
+                'baseline_time': off_time,
+                'overhead_percent': (on_time - off_time) / off_time * 100
+            }
+
+        results[profiler_name] = workload_results
+
+    return results
+
+
+def bench_breakdown_insertion(num_stacks):
+    stacks = generate_stacks(num_stacks, 20, 1000)
+
+    def insert():
+        root = Breakdown('Execution call graph', Breakdown.TYPE_CALLGRAPH)
+        for stack in stacks:
+            node = root
+            for frame_name in stack:
+                node = node.find_or_add_child(frame_name)
+            node.increment(0.01, 1)
+
+    t = measure(insert, 3)
+
+    return {
+        'stacks': num_stacks,
+        'time': t,
+        'stacks_per_second': num_stacks / t
+    }
+
+
+def bench_build_profile(agent, sizes):
+    profiler = agent.cpu_reporter.profiler
+
+    results = dict()
+    for size in sizes:
+        profiler.profile = generate_tree(size)
+        start = time.time()
+        profile = profiler.build_profile(10)[0]['profile']
+        build_time = time.time() - start
+
+        profile = generate_tree(size)
+        start = time.time()
+        profile.to_dict()
+        to_dict_time = time.time() - start
+
+        profile = None
+        profiler.reset()
+
+        results[str(size)] = {
+            'build_profile_time': build_time,
+            'to_dict_time': to_dict_time
+        }
+
+    return results
+
+
+def bench_message_queue_flush(agent, sizes):
+    results = dict()
+    for size in sizes:
+        server = TestServer(SERVER_PORT)
+        server.start()
+
+        metric = Metric(agent, Metric.TYPE_PROFILE, Metric.CATEGORY_CPU_PROFILE, Metric.NAME_MAIN_THREAD_CPU_USAGE, Metric.UNIT_PERCENT)
+        metric.create_measurement(Metric.TRIGGER_TIMER, 100, None, generate_tree(size))
+        agent.message_queue.add('metric', metric.to_dict())
+
+        start = time.time()
+        agent.message_queue.flush(timeout=60)
+        flush_time = time.time() - start
+
+        server.join()
+        server.server.server_close()
+
+        results[str(size)] = {
+            'flush_time': flush_time,
+            'payload_size': len(server.get_request_data())
+        }
+
+    return results
+
+
+def bench_replay(agent, recording):
+    reported = []
+    def add(topic, message, ack_func=None):
+        reported.append(message)
+
+    add_func = agent.message_queue.add
+    agent.message_queue.add = add
+    try:
+        stats = replay(agent, recording)
+    finally:
+        agent.message_queue.add = add_func
+
+    stats['samples_per_second'] = stats['samples'] / stats['update_time'] if stats['update_time'] > 0 else None
+    stats['profiles'] = len(reported)
+
+    return stats
+
+
+def compare(results, previous, path=''):
+    for key, value in results.items():
+        if key not in previous:
+            continue
+
+        if isinstance(value, dict):
+            compare(value, previous[key], path + key + '.')
+        elif key.endswith('time') and previous[key] > 0:
+            change = (value - previous[key]) / previous[key] * 100
+            print('{0:<70} {1:>10.4f} {2:>10.4f} {3:>+8.1f}%'.format(path + key, previous[key], value, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='StackImpact agent benchmarks')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results file')
+    parser.add_argument('--compare', help='JSON results file of a previous run to compare with')
+    parser.add_argument('--repeat', type=int, default=5, help='number of workload runs per measurement')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='profile sizes in nodes')
+    parser.add_argument('--recording', help='sample recording file to replay')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    # the baseline is measured before the agent patches anything
+    baseline = dict()
+    for workload_name, workload in WORKLOADS:
+        baseline[workload_name] = measure_warm(workload, args.repeat)
+
+    agent = start_agent()
+    try:
+        results = {
+            'agent_version': agent.AGENT_VERSION,
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': int(time.time()),
+            'baseline': baseline,
+            'profiler_overhead': bench_profiler_overhead(agent, baseline, args.repeat),
+            'breakdown_insertion': bench_breakdown_insertion(100000),
+            'build_profile': bench_build_profile(agent, sizes),
+            'message_queue_flush': bench_message_queue_flush(agent, sizes)
+        }
+
+        if args.recording:
+            results['replay'] = bench_replay(agent, args.recording)
+    finally:
+        agent.destroy()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Results written to ' + args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print('{0:<70} {1:>10} {2:>10} {3:>9}'.format('', 'previous', 'current', 'change'))
+        compare(results, previous)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+from __future__ import division
+
+import sys
+import time
+import threading
+import random
+
+try:
+    # python 2
+    import Queue as queue
+except ImportError:
+    # python 3
+    import queue
+
+
+def cpu_recursion():
+    def fib(n):
+        if n < 2:
+            return n
+        return fib(n - 1) + fib(n - 2)
+
+    for i in range(0, 5):
+        fib(22)
+
+
+def allocation_churn():
+    retained = []
+    for i in range(0, 100000):
+        obj = {'id': i, 'name': 'object' + str(i), 'values': [i] * 10}
+        if i % 10 == 0:
+            retained.append(obj)
+        if len(retained) > 500:
+            retained = retained[250:]
+
+
+def thread_pool_blocking():
+    tasks = queue.Queue()
+
+    def worker():
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            time.sleep(task)
+
+    workers = [threading.Thread(target=worker) for i in range(0, 4)]
+    for t in workers:
+        t.start()
+
+    for i in range(0, 100):
+        tasks.put(0.005)
+    for t in workers:
+        tasks.put(None)
+
+    for t in workers:
+        t.join()
+
+
+def exception_heavy():
+    def parse(value):
+        if value % 3 == 0:
+            raise ValueError('invalid value: ' + str(value))
+        return value
+
+    for i in range(0, 100000):
+        try:
+            parse(i)
+        except ValueError:
+            sys.exc_info()
+
+
+WORKLOADS = [
+    ('cpu_recursion', cpu_recursion),
+    ('allocation_churn', allocation_churn),
+    ('thread_pool_blocking', thread_pool_blocking),
+    ('exception_heavy', exception_heavy),
+]
+
+
+def generate_stacks(num_stacks, depth, num_funcs, seed=1):
+    '''Returns random stacks of frame names, root first, drawn from
+    num_funcs functions in 10 files.'''
+
+    rnd = random.Random(seed)
+
+    stacks = []
+    for i in range(0, num_stacks):
+        stack = []
+        for d in range(0, depth):
+            f = rnd.randint(0, num_funcs - 1)
+            stack.append('func{0} (/app/module{1}.py:{2})'.format(f, f % 10, f * 7 % 500))
+        stacks.append(stack)
+
+    return stacks
@@ -0,0 +1,79 @@
+from __future__ import division, print_function, absolute_import
+
+import os
+import sys
+import json
+import signal
+import argparse
+
+from .capture import CaptureController, DEFAULT_SOCKET_PATH, socket_path_for, request_capture, request_history
+
+
+def capture(args):
+    if args.signal:
+        # the agent captures a CPU profile with default settings
+        os.kill(args.pid, signal.SIGUSR1)
+        print('Sent SIGUSR1 to process {0}'.format(args.pid))
+        return
+
+    socket_path = args.socket or socket_path_for(DEFAULT_SOCKET_PATH, args.pid)
+    print(request_capture(socket_path, args.type, args.seconds, args.format))
+
+
+def history(args):
+    query = {
+        'query': args.query,
+        'limit': args.limit
+    }
+    for key in ('category', 'name', 'minutes', 'since', 'until', 'window_id'):
+        value = getattr(args, key)
+        if value is not None:
+            query[key] = value
+
+    socket_path = args.socket or socket_path_for(DEFAULT_SOCKET_PATH, args.pid)
+    print(json.dumps(request_history(socket_path, query), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m stackimpact')
+    subparsers = parser.add_subparsers(dest='command')
+
+    capture_parser = subparsers.add_parser('capture', help='capture a profile of a running process')
+    capture_parser.add_argument('--pid', type=int, required=True)
+    capture_parser.add_argument('--seconds', type=float, default=CaptureController.DEFAULT_SECONDS)
+    capture_parser.add_argument('--type', default='cpu', help='cpu, allocation or block')
+    capture_parser.add_argument('--format', default='json', help='json, pprof, folded, speedscope or svg')
+    capture_parser.add_argument('--socket', help='capture socket of the process, if not the default')
+    capture_parser.add_argument('--signal', action='store_true', help='trigger a capture with SIGUSR1 instead')
+
+    history_parser = subparsers.add_parser('history', help='query the profile history of a running process')
+    history_parser.add_argument('--pid', type=int, required=True)
+    history_parser.add_argument('--query', default='merged', help='merged, profiles, top or metrics')
+    history_parser.add_argument('--category', help='e.g. cpu-profile (default for profiles), memory-profile or block-profile')
+    history_parser.add_argument('--name', help='profile or metric name')
+    history_parser.add_argument('--minutes', type=float, help='windows of the last minutes')
+    history_parser.add_argument('--since', type=int, help='windows ending at or after this timestamp')
+    history_parser.add_argument('--until', type=int, help='windows ending at or before this timestamp')
+    history_parser.add_argument('--window-id', help='measurement id of a window, for top queries')
+    history_parser.add_argument('--limit', type=int, default=20)
+    history_parser.add_argument('--socket', help='capture socket of the process, if not the default')
+
+    args = parser.parse_args()
+
+    commands = {
+        'capture': capture,
+        'history': history
+    }
+    if args.command in commands:
+        try:
+            commands[args.command](args)
+        except Exception as e:
+            print(args.command.capitalize() + ' failed: ' + str(e), file=sys.stderr)
+            sys.exit(1)
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
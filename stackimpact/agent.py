@@ -19,10 +19,18 @@ from .config import Config
 from .config_loader import ConfigLoader
 from .message_queue import MessageQueue
 from .frame_cache import FrameCache
+from .overhead_governor import OverheadGovernor
+from .sample_recording import SampleRecorder
+from .capture import CaptureController
+from .profile_history import ProfileHistory
+from .anomaly_triggers import AnomalyTriggers
 from .reporters.process_reporter import ProcessReporter
 from .reporters.profile_reporter import ProfileReporter, ProfilerConfig
 from .reporters.error_reporter import ErrorReporter
+from .reporters.gc_reporter import GCReporter
+from .reporters.heap_reporter import HeapReporter
 from .reporters.span_reporter import SpanReporter
+from .reporters.overhead_reporter import OverheadReporter
 from .profilers.cpu_profiler import CPUProfiler
 from .profilers.allocation_profiler import AllocationProfiler
 from .profilers.block_profiler import BlockProfiler
@@ -62,6 +70,9 @@ class Agent(object):
         self.profiler_active = False
         self.span_active = False
 
+        # one profile capture at a time, by signal, socket or trigger
+        self.capture_lock = threading.Lock()
+
         self.main_thread_func = None
 
         self.run_ts = None
@@ -72,7 +83,15 @@ class Agent(object):
         self.frame_cache = FrameCache(self)
         self.process_reporter = ProcessReporter(self)
         self.error_reporter = ErrorReporter(self)
+        self.gc_reporter = GCReporter(self)
+        self.heap_reporter = HeapReporter(self)
         self.span_reporter = SpanReporter(self)
+        self.overhead_reporter = OverheadReporter(self)
+        self.overhead_governor = OverheadGovernor(self)
+        self.capture_controller = CaptureController(self)
+        self.profile_history = ProfileHistory(self)
+        self.anomaly_triggers = AnomalyTriggers(self)
+        self.sample_recorder = None
 
         config = ProfilerConfig()
         config.log_prefix = 'CPU profiler'
@@ -111,6 +130,14 @@ class Agent(object):
             return self.options[name]
 
 
+    def has_profile_budget(self):
+        '''Returns True if reported profiles are pruned to max_profile_nodes
+        or max_profile_bytes. The profilers then keep the nodes below their
+        fixed thresholds and the budget decides what is dropped.'''
+
+        return self.get_option('max_profile_nodes') is not None or self.get_option('max_profile_bytes') is not None
+
+
     def start(self, **kwargs):
         if not min_version(2, 7) and not min_version(3, 4):
             raise Exception('Supported Python versions 2.6 or higher and 3.4 or higher')
@@ -125,22 +152,7 @@ class Agent(object):
         if self.agent_started:
             return
 
-        self.options = kwargs
-
-        if 'auto_profiling' not in self.options:
-            self.options['auto_profiling'] = True
-
-        if 'dashboard_address' not in self.options:
-            self.options['dashboard_address'] = self.SAAS_DASHBOARD_ADDRESS
-
-        if 'agent_key' not in self.options:
-            raise Exception('missing option: agent_key')
-
-        if 'app_name' not in self.options:
-            raise Exception('missing option: app_name')
-
-        if 'host_name' not in self.options:
-            self.options['host_name'] = socket.gethostname()
+        self.set_options(kwargs)
 
         self.run_id = generate_uuid()
         self.run_ts = timestamp()
@@ -149,12 +161,21 @@ class Agent(object):
         self.message_queue.start()
         self.frame_cache.start()
 
+        if self.get_option('sample_recording_file'):
+            self.sample_recorder = SampleRecorder(self.get_option('sample_recording_file'))
+            self.sample_recorder.open()
+
         self.cpu_reporter.setup()
         self.allocation_reporter.setup()
         self.block_reporter.setup()
         self.span_reporter.setup()
         self.error_reporter.setup()
+        self.gc_reporter.setup()
+        self.heap_reporter.setup()
         self.process_reporter.setup()
+        self.overhead_reporter.setup()
+
+        self.capture_controller.start()
 
         # execute main_thread_func in main thread on signal
         def _signal_handler(signum, frame):
@@ -178,7 +199,7 @@ class Agent(object):
                     return
 
                 try:
-                    self.message_queue.flush()
+                    self.message_queue.flush(timeout=self.message_queue.FLUSH_TIMEOUT)
                     self.destroy()
                 except Exception:
                     self.exception()
@@ -193,10 +214,78 @@ class Agent(object):
                 register_signal(signal.SIGHUP, _exit_handler, once = True)
 
 
+        # reinitialize the agent in child processes, e.g. pre-forked workers
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
         self.agent_started = True
         self.log('Agent started')
 
 
+    def set_options(self, options):
+        self.options = options
+
+        if 'auto_profiling' not in self.options:
+            self.options['auto_profiling'] = True
+
+        if 'dashboard_address' not in self.options:
+            self.options['dashboard_address'] = self.SAAS_DASHBOARD_ADDRESS
+
+        if 'agent_key' not in self.options:
+            raise Exception('missing option: agent_key')
+
+        if 'app_name' not in self.options:
+            raise Exception('missing option: app_name')
+
+        if 'host_name' not in self.options:
+            self.options['host_name'] = socket.gethostname()
+
+
+    def _after_fork_in_child(self):
+        if not self.agent_started or self.agent_destroyed:
+            return
+
+        try:
+            self.after_fork()
+        except Exception:
+            self.exception()
+
+
+    def after_fork(self):
+        # only the forking thread exists in the child process; timers and
+        # signal timers are gone and locks may have been held at fork time
+        self.run_id = generate_uuid()
+        self.run_ts = timestamp()
+
+        self.profiler_active = False
+        self.span_active = False
+        self.capture_lock = threading.Lock()
+        self.main_thread_func = None
+
+        # the recording file belongs to the parent process
+        self.sample_recorder = None
+
+        self.config.after_fork()
+        self.message_queue.after_fork()
+        self.config_loader.after_fork()
+
+        self.cpu_reporter.after_fork()
+        self.allocation_reporter.after_fork()
+        self.block_reporter.after_fork()
+        self.span_reporter.after_fork()
+        self.error_reporter.after_fork()
+        self.gc_reporter.after_fork()
+        self.heap_reporter.after_fork()
+        self.process_reporter.after_fork()
+        self.overhead_reporter.after_fork()
+        self.overhead_governor.after_fork()
+        self.anomaly_triggers.after_fork()
+        self.capture_controller.after_fork()
+        self.profile_history.after_fork()
+
+        self.log('Agent reinitialized in child process')
+
+
     def enable(self):
         if not self.config.is_agent_enabled():
             self.cpu_reporter.start()
@@ -204,7 +293,12 @@ class Agent(object):
             self.block_reporter.start()
             self.span_reporter.start()
             self.error_reporter.start()
+            self.gc_reporter.start()
+            self.heap_reporter.start()
             self.process_reporter.start()
+            self.overhead_reporter.start()
+            self.overhead_governor.start()
+            self.anomaly_triggers.start()
             self.config.set_agent_enabled(True)
 
 
@@ -215,7 +309,12 @@ class Agent(object):
             self.block_reporter.stop()
             self.span_reporter.stop()
             self.error_reporter.stop()
+            self.gc_reporter.stop()
+            self.heap_reporter.stop()
             self.process_reporter.stop()
+            self.overhead_reporter.stop()
+            self.overhead_governor.stop()
+            self.anomaly_triggers.stop()
             self.config.set_agent_enabled(False)
 
 
@@ -249,10 +348,14 @@ class Agent(object):
             self.span_reporter.record_span(name, duration)
 
             if not self.get_option('auto_profiling'):
-                self.config_loader.load(True)
-                if selected_reporter:
-                    selected_reporter.report(True);
-                self.message_queue.flush(True)
+                # keep config loading, reporting and uploading off the application thread
+                def report_func():
+                    self.config_loader.load(True)
+                    if selected_reporter:
+                        selected_reporter.report(True);
+                    self.message_queue.flush(True)
+
+                self.message_queue.submit(report_func)
 
             self.span_active = False
 
@@ -320,15 +423,29 @@ class Agent(object):
         self.allocation_reporter.stop()
         self.block_reporter.stop()
         self.error_reporter.stop()
+        self.gc_reporter.stop()
+        self.heap_reporter.stop()
         self.span_reporter.stop()
         self.process_reporter.stop()
+        self.overhead_reporter.stop()
+        self.overhead_governor.stop()
+        self.anomaly_triggers.stop()
+        self.capture_controller.stop()
 
         self.cpu_reporter.destroy()
         self.allocation_reporter.destroy()
         self.block_reporter.destroy()
         self.error_reporter.destroy()
+        self.gc_reporter.destroy()
+        self.heap_reporter.destroy()
         self.span_reporter.destroy()
         self.process_reporter.destroy()
+        self.overhead_reporter.destroy()
+        self.profile_history.destroy()
+
+        if self.sample_recorder:
+            self.sample_recorder.close()
+            self.sample_recorder = None
 
         self.agent_destroyed = True
         self.log('Agent destroyed')
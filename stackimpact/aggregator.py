@@ -0,0 +1,334 @@
+from __future__ import division, print_function, absolute_import
+
+import os
+import sys
+import json
+import socket
+import signal
+import threading
+import argparse
+
+from .aggregator_client import read_all
+from .metric import Metric, Breakdown
+from .utils import timestamp, generate_uuid
+
+
+def evaluate_p95(sketches):
+    # each sample stands for count / len(samples) recorded values
+    weighted = []
+    total_weight = 0
+    for samples, count in sketches:
+        if not samples:
+            continue
+
+        weight = max(count, len(samples)) / len(samples)
+        for value in samples:
+            weighted.append((value, weight))
+        total_weight += weight * len(samples)
+
+    if not weighted:
+        return None
+
+    weighted.sort(key=lambda s: s[0])
+
+    threshold = total_weight * 0.95
+    cumulative_weight = 0
+    for value, weight in weighted:
+        cumulative_weight += weight
+        if cumulative_weight >= threshold:
+            return value
+
+    return weighted[-1][0]
+
+
+class Aggregator(object):
+    '''Receives profiles and metrics from the agents of the same application
+    running on the host over a Unix domain socket and uploads them merged
+    every AGGREGATION_INTERVAL. Profiles are merged node by node, counters
+    are summed, for state metrics the last value of each process is summed
+    and span p95 values are evaluated from the combined span samples.
+    Agents get the agent configuration from the aggregator.'''
+
+    AGGREGATION_INTERVAL = 60
+    CONFIG_LOAD_INTERVAL = 120
+    CONNECTION_TIMEOUT = 5
+
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.started = False
+        self.socket_path = None
+        self.server_socket = None
+        self.accept_thread = None
+        self.aggregate_timer = None
+        self.config_timer = None
+        self.config = {}
+        self.metrics_lock = threading.Lock()
+        self.profiles = None
+        self.counters = None
+        self.states = None
+        self.spans = None
+
+        self.reset()
+
+
+    def reset(self):
+        self.profiles = dict()
+        self.counters = dict()
+        self.states = dict()
+        self.spans = dict()
+
+
+    def start(self, socket_path, **kwargs):
+        if self.started:
+            return
+
+        self.agent.set_options(kwargs)
+        self.agent.run_id = generate_uuid()
+        self.agent.run_ts = timestamp()
+        self.agent.message_queue.start()
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(socket_path)
+        self.server_socket.listen(128)
+        self.socket_path = socket_path
+        self.started = True
+
+        self.accept_thread = threading.Thread(target=self.accept_connections, args=(self.server_socket,))
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+
+        self.aggregate_timer = self.agent.schedule(self.AGGREGATION_INTERVAL, self.AGGREGATION_INTERVAL, self.aggregate)
+        self.config_timer = self.agent.schedule(0, self.CONFIG_LOAD_INTERVAL, self.load_config)
+
+        self.agent.log('Aggregator started on ' + socket_path)
+
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+
+        self.aggregate_timer.cancel()
+        self.aggregate_timer = None
+
+        self.config_timer.cancel()
+        self.config_timer = None
+
+        try:
+            # wakes up the accepting thread
+            self.server_socket.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+
+        try:
+            self.server_socket.close()
+            os.remove(self.socket_path)
+        except Exception:
+            self.agent.exception()
+
+        self.aggregate()
+        self.agent.message_queue.flush(timeout=self.agent.message_queue.FLUSH_TIMEOUT)
+        self.agent.message_queue.stop()
+
+        self.agent.log('Aggregator stopped')
+
+
+    def load_config(self):
+        try:
+            self.config = self.agent.message_queue.sink.load_config()
+        except Exception:
+            self.agent.log('Error loading config')
+            self.agent.exception()
+
+
+    def accept_connections(self, server_socket):
+        while self.started:
+            try:
+                conn, _ = server_socket.accept()
+            except Exception:
+                if self.started:
+                    self.agent.exception()
+                continue
+
+            self.handle_connection(conn)
+
+
+    def handle_connection(self, conn):
+        try:
+            conn.settimeout(self.CONNECTION_TIMEOUT)
+
+            request = json.loads(read_all(conn).decode('utf-8'))
+            response = self.handle_request(request)
+
+            conn.sendall(json.dumps(response).encode('utf-8'))
+        except Exception:
+            self.agent.exception()
+        finally:
+            conn.close()
+
+
+    def handle_request(self, request):
+        if request['type'] == 'config':
+            return self.config
+        elif request['type'] == 'upload':
+            self.add_messages(request['process_id'], request['payload']['messages'])
+
+        return {}
+
+
+    def add_messages(self, process_id, messages):
+        with self.metrics_lock:
+            for message in messages:
+                if message['topic'] == 'metric':
+                    self.add_metric(process_id, message['content'])
+                elif message['topic'] == 'span':
+                    self.add_span(message['content'])
+
+
+    def add_metric(self, process_id, metric_map):
+        measurement_map = metric_map.get('measurement')
+        if not measurement_map:
+            return
+
+        key = metric_map['id']
+        value = measurement_map['value']
+
+        if metric_map['type'] == Metric.TYPE_PROFILE:
+            breakdown = None
+            if measurement_map['breakdown']:
+                breakdown = Breakdown.from_dict(measurement_map['breakdown'])
+
+            entry = self.profiles.get(key)
+            if entry is None:
+                self.profiles[key] = {
+                    'metric': metric_map,
+                    'value': value,
+                    'breakdown': breakdown
+                }
+            else:
+                entry['value'] += value
+                if entry['breakdown'] and breakdown:
+                    entry['breakdown'].merge(breakdown)
+                elif breakdown:
+                    entry['breakdown'] = breakdown
+
+        elif metric_map['type'] == Metric.TYPE_COUNTER:
+            entry = self.counters.get(key)
+            if entry is None:
+                self.counters[key] = {
+                    'metric': metric_map,
+                    'value': value
+                }
+            else:
+                entry['value'] += value
+
+        else:
+            entry = self.states.get(key)
+            if entry is None:
+                entry = {
+                    'metric': metric_map,
+                    'values': dict()
+                }
+                self.states[key] = entry
+            entry['values'][process_id] = value
+
+
+    def add_span(self, span_map):
+        sketches = self.spans.get(span_map['name'])
+        if sketches is None:
+            sketches = []
+            self.spans[span_map['name']] = sketches
+        sketches.append((span_map['samples'], span_map['count']))
+
+
+    def aggregate(self):
+        with self.metrics_lock:
+            profiles = self.profiles
+            counters = self.counters
+            states = self.states
+            spans = self.spans
+            self.reset()
+
+        for entry in profiles.values():
+            breakdown_map = None
+            if entry['breakdown']:
+                breakdown_map = entry['breakdown'].to_dict()
+            self.add_metric_message(entry['metric'], entry['value'], breakdown_map)
+
+        for entry in counters.values():
+            self.add_metric_message(entry['metric'], entry['value'], None)
+
+        for entry in states.values():
+            self.add_metric_message(entry['metric'], sum(entry['values'].values()), None)
+
+        for name, sketches in spans.items():
+            p95 = evaluate_p95(sketches)
+            if p95 is not None:
+                metric = Metric(self.agent, Metric.TYPE_STATE, Metric.CATEGORY_SPAN, name, Metric.UNIT_MILLISECOND)
+                metric.create_measurement(Metric.TRIGGER_TIMER, p95, 60)
+                self.agent.message_queue.add('metric', metric.to_dict())
+
+
+    def add_metric_message(self, metric_map, value, breakdown_map):
+        measurement_map = dict(metric_map['measurement'])
+        measurement_map['id'] = generate_uuid()
+        measurement_map['value'] = value
+        measurement_map['breakdown'] = breakdown_map
+        measurement_map['timestamp'] = timestamp()
+
+        metric_map = dict(metric_map)
+        metric_map['measurement'] = measurement_map
+
+        self.agent.message_queue.add('metric', metric_map)
+
+
+def main():
+    from .agent import Agent
+
+    parser = argparse.ArgumentParser(description='StackImpact local profile aggregator')
+    parser.add_argument('--socket', required=True, help='Unix domain socket path')
+    parser.add_argument('--agent-key', required=True)
+    parser.add_argument('--app-name', required=True)
+    parser.add_argument('--app-version')
+    parser.add_argument('--app-environment')
+    parser.add_argument('--host-name')
+    parser.add_argument('--dashboard-address')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+
+    options = {
+        'agent_key': args.agent_key,
+        'app_name': args.app_name,
+        'debug': args.debug
+    }
+    if args.app_version:
+        options['app_version'] = args.app_version
+    if args.app_environment:
+        options['app_environment'] = args.app_environment
+    if args.host_name:
+        options['host_name'] = args.host_name
+    if args.dashboard_address:
+        options['dashboard_address'] = args.dashboard_address
+
+    aggregator = Aggregator(Agent())
+    aggregator.start(args.socket, **options)
+
+    stop_event = threading.Event()
+    def _stop(signum, frame):
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while not stop_event.is_set():
+        stop_event.wait(1)
+
+    aggregator.stop()
+
+
+if __name__ == '__main__':
+    main()
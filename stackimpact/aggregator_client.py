@@ -0,0 +1,49 @@
+import os
+import json
+import socket
+
+from .json_encoder import iterencode
+
+
+BUFFER_SIZE = 64 * 1024
+
+
+def read_all(sock):
+    chunks = []
+    while True:
+        data = sock.recv(BUFFER_SIZE)
+        if not data:
+            break
+        chunks.append(data)
+
+    return b''.join(chunks)
+
+
+class AggregatorClient(object):
+    TIMEOUT = 5
+
+
+    def __init__(self, agent):
+        self.agent = agent
+
+
+    def request(self, request_type, payload=None):
+        req = {
+            'type':       request_type,
+            'process_id': os.getpid(),
+            'run_id':     self.agent.run_id,
+            'payload':    payload
+        }
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.TIMEOUT)
+        try:
+            sock.connect(self.agent.get_option('aggregator_socket'))
+
+            for chunk in iterencode(req, BUFFER_SIZE):
+                sock.sendall(chunk.encode('utf-8'))
+            sock.shutdown(socket.SHUT_WR)
+
+            return json.loads(read_all(sock).decode('utf-8'))
+        finally:
+            sock.close()
@@ -0,0 +1,295 @@
+from __future__ import division
+
+import time
+import math
+import threading
+import collections
+
+from .runtime import runtime_info, read_cpu_time
+from .procfs import read_stat
+
+
+class Trigger(object):
+    '''A condition on a process metric which, when it holds, starts a capture
+    of the given profiler. Conditions are:
+      cpu_usage  CPU usage above `above` percent for `for_seconds` seconds.
+      rss_growth RSS growth above `above` MB per minute over the last
+                 `for_seconds` seconds.
+      span_p99   99th percentile duration of the span `span` above `above`
+                 milliseconds over the last `for_seconds` seconds.'''
+
+    METRICS = ('cpu_usage', 'rss_growth', 'span_p99')
+    PROFILERS = ('cpu', 'allocation', 'block')
+    DEFAULT_FOR_SECONDS = {
+        'cpu_usage': 10,
+        'rss_growth': 60,
+        'span_p99': 30
+    }
+    DEFAULT_DURATION = 10
+    DEFAULT_COOLDOWN = 300
+    MIN_SPAN_SAMPLES = 20
+
+
+    def __init__(self, spec):
+        self.metric = spec.get('metric')
+        if self.metric not in self.METRICS:
+            raise Exception('Unsupported trigger metric: ' + str(self.metric))
+
+        if spec.get('above') is None:
+            raise Exception('Missing trigger threshold: above')
+        self.above = spec['above']
+
+        self.profiler = spec.get('profiler', 'cpu')
+        if self.profiler not in self.PROFILERS:
+            raise Exception('Unsupported trigger profiler: ' + str(self.profiler))
+
+        self.span = spec.get('span')
+        if self.metric == 'span_p99' and not self.span:
+            raise Exception('Missing trigger span name: span')
+
+        self.for_seconds = spec.get('for_seconds', self.DEFAULT_FOR_SECONDS[self.metric])
+        self.duration = spec.get('duration', self.DEFAULT_DURATION)
+        self.cooldown = spec.get('cooldown', self.DEFAULT_COOLDOWN)
+
+        self.since = None
+        self.last_fired = None
+
+
+    def description(self):
+        if self.metric == 'span_p99':
+            return 'span_p99({0}) > {1}'.format(self.span, self.above)
+        else:
+            return '{0} > {1}'.format(self.metric, self.above)
+
+
+    def check(self, value, now):
+        '''Returns True when the trigger should fire for the value of its
+        metric at time now. Values of windowed metrics are evaluated over
+        the window already; cpu_usage has to stay above the threshold.'''
+
+        if value is None or value <= self.above:
+            self.since = None
+            return False
+
+        if self.metric == 'cpu_usage':
+            if self.since is None:
+                self.since = now
+            if now - self.since < self.for_seconds:
+                return False
+
+        if self.last_fired is not None and now - self.last_fired < self.cooldown:
+            return False
+
+        self.since = None
+        self.last_fired = now
+        return True
+
+
+class AnomalyTriggers(object):
+    '''Samples process metrics every profile_trigger_interval seconds and
+    captures profiles, outside of the profiling schedule, when one of the
+    profile_triggers conditions holds. Only the metrics used by the
+    configured triggers are read.'''
+
+    DEFAULT_INTERVAL = 1
+
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.started = False
+        self.check_timer = None
+        self.triggers = None
+        self.span_lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        self.last_cpu_time = None
+        self.last_cpu_ts = None
+        self.rss_samples = collections.deque()
+        self.rss_window = 0
+        self.span_samples = dict()
+        self.span_windows = dict()
+
+
+    def after_fork(self):
+        was_started = self.started
+
+        self.started = False
+        self.check_timer = None
+        self.span_lock = threading.Lock()
+
+        if was_started:
+            self.start()
+
+
+    def start(self):
+        if runtime_info.OS_WIN:
+            return
+
+        specs = self.agent.get_option('profile_triggers')
+        if not specs:
+            return
+
+        if self.started:
+            return
+        self.started = True
+
+        self.triggers = []
+        for spec in specs:
+            try:
+                self.triggers.append(Trigger(spec))
+            except Exception as e:
+                self.agent.log('Ignoring profile trigger: ' + str(e))
+
+        self.reset()
+
+        # samples are kept for the longest window of the triggers using them
+        with self.span_lock:
+            for trigger in self.triggers:
+                if trigger.metric == 'rss_growth':
+                    self.rss_window = max(self.rss_window, trigger.for_seconds)
+                elif trigger.metric == 'span_p99':
+                    self.span_samples[trigger.span] = collections.deque()
+                    self.span_windows[trigger.span] = max(self.span_windows.get(trigger.span, 0), trigger.for_seconds)
+
+        interval = self.agent.get_option('profile_trigger_interval', self.DEFAULT_INTERVAL)
+        self.check_timer = self.agent.schedule(interval, interval, self.check)
+
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+
+        self.check_timer.cancel()
+        self.check_timer = None
+
+
+    def record_span(self, name, duration):
+        # called on application threads, only spans with triggers are kept
+        samples = self.span_samples.get(name)
+        if samples is None:
+            return
+
+        with self.span_lock:
+            samples.append((time.time(), duration * 1000))
+
+
+    def read_cpu_usage(self, now):
+        cpu_time = read_cpu_time()
+
+        cpu_usage = None
+        if self.last_cpu_time is not None and now > self.last_cpu_ts:
+            cpu_usage = (cpu_time - self.last_cpu_time) / ((now - self.last_cpu_ts) * 1e9) * 100
+            cpu_usage = cpu_usage / self.agent.process_reporter.available_cpus()
+
+        self.last_cpu_time = cpu_time
+        self.last_cpu_ts = now
+
+        return cpu_usage
+
+
+    def sample_rss(self, now):
+        stat = read_stat()
+        if stat is None:
+            return False
+
+        samples = self.rss_samples
+        samples.append((now, stat['rss']))
+        while len(samples) > 1 and samples[1][0] <= now - self.rss_window:
+            samples.popleft()
+
+        return True
+
+
+    def read_rss_growth(self, now, window):
+        samples = self.rss_samples
+        if not samples:
+            return None
+        current_rss = samples[-1][1]
+
+        # the last sample at or before the start of the window
+        first_ts, first_rss = samples[0]
+        for ts, rss in samples:
+            if ts > now - window:
+                break
+            first_ts, first_rss = ts, rss
+
+        if now - first_ts < window * 0.9:
+            return None
+
+        # KB per second to MB per minute
+        return (current_rss - first_rss) / (now - first_ts) * 60 / 1024
+
+
+    def read_span_p99(self, name, now, window):
+        samples = self.span_samples.get(name)
+
+        with self.span_lock:
+            while samples and samples[0][0] < now - self.span_windows[name]:
+                samples.popleft()
+            durations = sorted(d for ts, d in samples if ts >= now - window)
+
+        if len(durations) < Trigger.MIN_SPAN_SAMPLES:
+            return None
+
+        return durations[int(math.ceil(len(durations) * 0.99)) - 1]
+
+
+    def check(self):
+        now = time.time()
+
+        rss_sampled = False
+        if self.rss_window > 0:
+            rss_sampled = self.sample_rss(now)
+
+        # triggers of a metric with the same window share the value
+        values = dict()
+        for trigger in self.triggers:
+            if trigger.metric == 'cpu_usage':
+                # for_seconds is how long the usage has to stay high, the
+                # usage is read once per check
+                key = ('cpu_usage',)
+                if key not in values:
+                    values[key] = self.read_cpu_usage(now)
+            elif trigger.metric == 'rss_growth':
+                key = ('rss_growth', trigger.for_seconds)
+                if key not in values:
+                    values[key] = self.read_rss_growth(now, trigger.for_seconds) if rss_sampled else None
+            else:
+                key = ('span_p99', trigger.span, trigger.for_seconds)
+                if key not in values:
+                    values[key] = self.read_span_p99(trigger.span, now, trigger.for_seconds)
+            value = values[key]
+
+            if trigger.check(value, now):
+                self.fire(trigger, value)
+
+
+    def fire(self, trigger, value):
+        if not self.agent.capture_lock.acquire(False):
+            self.agent.log('Profile trigger ' + trigger.description() + ': capture in progress.')
+            return
+
+        reporters = {
+            'cpu': self.agent.cpu_reporter,
+            'allocation': self.agent.allocation_reporter,
+            'block': self.agent.block_reporter
+        }
+        reporter = reporters[trigger.profiler]
+
+        self.agent.log('Profile trigger {0} fired with value {1:.2f}.'.format(trigger.description(), value))
+
+        def _capture():
+            try:
+                reporter.capture_report(trigger.duration, trigger.description())
+            except Exception:
+                self.agent.exception()
+            finally:
+                self.agent.capture_lock.release()
+
+        # a capture does not keep the process from exiting
+        t = threading.Thread(target=_capture)
+        t.daemon = True
+        t.start()
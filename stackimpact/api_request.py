@@ -7,7 +7,9 @@ import socket
 from io import BytesIO
 
 from .utils import timestamp, base64_encode
-from .runtime import runtime_info
+from .runtime import runtime_info, min_version, perf_counter_ns
+from .metric import Metric
+from .json_encoder import iterencode, gzip_stream
 
 
 if runtime_info.PYTHON_2:
@@ -21,9 +23,14 @@ else:
 
 
 class APIRequest(object):
+    COMPRESSION_LEVEL = 6
+    BUFFER_SIZE = 64 * 1024
+
+
     def __init__(self, agent):
         self.agent = agent   
 
+
     def post(self, endpoint, payload):
         agent_key_64 = base64_encode(self.agent.get_option('agent_key') + ':').replace('\n', '')
         headers = {
@@ -33,13 +40,51 @@ class APIRequest(object):
             'Content-Encoding': 'gzip'
         }
 
+        req_body = self.build_body(payload)
+
+        start = perf_counter_ns()
+
+        compression_level = self.agent.get_option('upload_compression_level', self.COMPRESSION_LEVEL)
+        req_body_gzip = self.measure_encoding(gzip_stream(
+            iterencode(req_body, self.BUFFER_SIZE),
+            compression_level,
+            self.BUFFER_SIZE))
+
+        # urllib sends iterable request bodies with chunked transfer encoding
+        if not min_version(3, 6):
+            req_body_gzip = b''.join(req_body_gzip)
+            if runtime_info.PYTHON_2:
+                req_body_gzip = bytearray(req_body_gzip)
+
+        request = Request(
+            url = self.agent.get_option('dashboard_address') + '/agent/v1/' + endpoint,
+            data = req_body_gzip,
+            headers = headers)
+
+        response = urlopen(request, timeout = 20)
+
+        result_data = response.read()
+
+        if response.info():
+            content_type = response.info().get('Content-Encoding')
+            if content_type == 'gzip':
+                result_data = gzip.GzipFile('', 'r', 0, BytesIO(result_data)).read()
+
+        response.close()
+
+        self.agent.overhead_reporter.record_time(Metric.NAME_AGENT_UPLOAD_LATENCY, endpoint, start)
+
+        return json.loads(result_data.decode('utf-8'))
+
+
+    def build_body(self, payload):
         host_name = 'undefined'
         try:
             host_name = socket.gethostname()
         except Exception:
             self.agent.exception()
 
-        req_body = {
+        return {
             'runtime_type':    'python',
             'runtime_version': '{0.major}.{0.minor}.{0.micro}'.format(sys.version_info),
             'runtime_path':    sys.prefix,
@@ -55,34 +100,28 @@ class APIRequest(object):
             'payload':         payload,
         }
 
-        gzip_out = BytesIO()
-        with gzip.GzipFile(fileobj=gzip_out, mode="w") as out_file:
-          out_file.write(json.dumps(req_body).encode('utf-8'))
-          out_file.close()
 
-        gzip_out_val = gzip_out.getvalue()
-        if isinstance(gzip_out_val, str):
-            req_body_gzip = bytearray(gzip_out.getvalue())
-        else:
-            req_body_gzip = gzip_out.getvalue()
+    def measure_encoding(self, chunks):
+        # the stream is consumed while sending, so only the time spent
+        # producing chunks is counted as encoding time
+        encoding_time = 0
+        size = 0
 
-        request = Request(
-            url = self.agent.get_option('dashboard_address') + '/agent/v1/' + endpoint,
-            data = req_body_gzip,
-            headers = headers)
+        chunks = iter(chunks)
+        while True:
+            start = perf_counter_ns()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            encoding_time += perf_counter_ns() - start
+            size += len(chunk)
 
-        response = urlopen(request, timeout = 20)
+            yield chunk
 
-        result_data = response.read()
-
-        if response.info():
-            content_type = response.info().get('Content-Encoding')
-            if content_type == 'gzip':
-                result_data = gzip.GzipFile('', 'r', 0, BytesIO(result_data)).read()
-
-        response.close()
-
-        return json.loads(result_data.decode('utf-8'))
+        overhead_reporter = self.agent.overhead_reporter
+        overhead_reporter.record(Metric.NAME_AGENT_ENCODING_TIME, 'JSON and gzip', encoding_time / 1e6)
+        overhead_reporter.record(Metric.NAME_AGENT_UPLOAD_SIZE, 'Compressed', size)
 
 
 def python_version():
@@ -0,0 +1,325 @@
+from __future__ import division
+
+import os
+import json
+import socket
+import signal
+import tempfile
+import threading
+
+from .runtime import runtime_info, register_signal
+from .metric import Metric
+from .aggregator_client import read_all
+from .utils import timestamp
+
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'stackimpact-{pid}.sock')
+
+
+def socket_path_for(path, pid):
+    return path.replace('{pid}', str(pid))
+
+
+class CaptureController(object):
+    '''Runs on-demand profile captures, triggered by SIGUSR1 when the
+    capture_signal option is set, or by requests on the Unix domain socket
+    given by the capture_socket option (True for DEFAULT_SOCKET_PATH).
+    Captures are written to the capture_dir directory. The socket also
+    answers profile history queries.'''
+
+    DEFAULT_SECONDS = 10
+    MAX_SECONDS = 300
+    MAX_CONNECTIONS = 8
+    CONNECTION_TIMEOUT = 5
+    FORMATS = {
+        'json': 'json',
+        'pprof': 'pb.gz',
+        'folded': 'folded',
+        'speedscope': 'speedscope.json',
+        'svg': 'svg'
+    }
+
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.started = False
+        self.socket_path = None
+        self.server_socket = None
+        self.accept_thread = None
+        self.connection_slots = threading.BoundedSemaphore(self.MAX_CONNECTIONS)
+        self.signal_registered = False
+        self.prev_signal_handler = None
+
+
+    def start(self):
+        if runtime_info.OS_WIN:
+            return
+
+        if self.started:
+            return
+        self.started = True
+
+        if self.agent.get_option('capture_signal') and not self.signal_registered:
+            def _signal_handler(signum, frame):
+                if not self.started:
+                    return False
+
+                # the capture takes a while, so it is not run in the handler
+                self.capture_async('cpu', self.DEFAULT_SECONDS, 'json')
+                return True
+
+            self.prev_signal_handler = signal.getsignal(signal.SIGUSR1)
+            register_signal(signal.SIGUSR1, _signal_handler)
+            self.signal_registered = True
+
+        socket_option = self.agent.get_option('capture_socket')
+        if socket_option:
+            path = DEFAULT_SOCKET_PATH if socket_option is True else socket_option
+            self.listen(socket_path_for(path, os.getpid()))
+
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+
+        if self.signal_registered:
+            try:
+                signal.signal(signal.SIGUSR1, self.prev_signal_handler)
+                self.signal_registered = False
+                self.prev_signal_handler = None
+            except Exception:
+                # only possible in the main thread, the handler ignores
+                # signals while the controller is stopped
+                self.agent.exception()
+
+        if self.server_socket:
+            try:
+                # wakes up the accepting thread
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+
+            try:
+                self.server_socket.close()
+                os.remove(self.socket_path)
+            except Exception:
+                self.agent.exception()
+
+            self.server_socket = None
+            self.accept_thread = None
+
+
+    def after_fork(self):
+        # the socket is named after the parent process and the accepting
+        # thread does not exist in the child process
+        was_started = self.started
+
+        self.started = False
+        self.server_socket = None
+        self.accept_thread = None
+        self.connection_slots = threading.BoundedSemaphore(self.MAX_CONNECTIONS)
+
+        if was_started:
+            self.start()
+
+
+    def listen(self, socket_path):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(socket_path)
+        self.server_socket.listen(8)
+        self.socket_path = socket_path
+
+        self.accept_thread = threading.Thread(target=self.accept_connections, args=(self.server_socket,))
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+
+        self.agent.log('Capture socket listening on ' + socket_path)
+
+
+    def accept_connections(self, server_socket):
+        while self.started:
+            try:
+                conn, _ = server_socket.accept()
+            except Exception:
+                if self.started:
+                    self.agent.exception()
+                continue
+
+            if not self.connection_slots.acquire(False):
+                self.reject_connection(conn)
+                continue
+
+            # a capture keeps its connection for up to MAX_SECONDS, so each
+            # connection is handled in its own thread
+            t = threading.Thread(target=self.handle_connection, args=(conn,))
+            t.daemon = True
+            t.start()
+
+
+    def reject_connection(self, conn):
+        try:
+            conn.settimeout(self.CONNECTION_TIMEOUT)
+            conn.sendall(json.dumps({'error': 'Too many connections'}).encode('utf-8'))
+        except Exception:
+            pass
+        finally:
+            conn.close()
+
+
+    def handle_connection(self, conn):
+        try:
+            conn.settimeout(self.CONNECTION_TIMEOUT)
+            request = json.loads(read_all(conn).decode('utf-8'))
+
+            # the client waits for the capture
+            conn.settimeout(None)
+            try:
+                response = self.handle_request(request)
+            except Exception as e:
+                response = {'error': str(e)}
+
+            conn.sendall(json.dumps(response).encode('utf-8'))
+        except Exception:
+            self.agent.exception()
+        finally:
+            conn.close()
+            self.connection_slots.release()
+
+
+    def handle_request(self, request):
+        typ = request.get('type', 'capture')
+
+        if typ == 'capture':
+            path = self.capture(
+                request.get('profiler', 'cpu'),
+                request.get('seconds', self.DEFAULT_SECONDS),
+                request.get('format', 'json'))
+            return {'path': path}
+        elif typ == 'history':
+            if not self.agent.profile_history.enabled():
+                raise Exception('Profile history is not enabled')
+            return {'result': self.agent.profile_history.query(request)}
+        else:
+            raise Exception('Unsupported request type: ' + str(typ))
+
+
+    def capture_async(self, profiler_type, seconds, output_format):
+        def _capture():
+            try:
+                path = self.capture(profiler_type, seconds, output_format)
+                self.agent.log('Capture written to ' + path)
+            except Exception:
+                self.agent.exception()
+
+        t = threading.Thread(target=_capture)
+        t.daemon = True
+        t.start()
+
+
+    def capture(self, profiler_type, seconds, output_format='json'):
+        if not self.started or self.agent.agent_destroyed:
+            raise Exception('Agent is not started')
+
+        reporters = {
+            'cpu': self.agent.cpu_reporter,
+            'allocation': self.agent.allocation_reporter,
+            'block': self.agent.block_reporter
+        }
+        if profiler_type not in reporters:
+            raise Exception('Unsupported profiler: ' + str(profiler_type))
+
+        if output_format not in self.FORMATS:
+            raise Exception('Unsupported format: ' + str(output_format))
+
+        seconds = min(max(float(seconds), 0.1), self.MAX_SECONDS)
+
+        if not self.agent.capture_lock.acquire(False):
+            raise Exception('Another capture is in progress')
+
+        reporter = reporters[profiler_type]
+        try:
+            profile_data = reporter.capture(seconds)
+        finally:
+            self.agent.capture_lock.release()
+
+        if not profile_data:
+            raise Exception('Profiler is not available or active')
+
+        data = profile_data[0]
+        reporter.prune_profile(data['profile'])
+        metric = Metric(self.agent, Metric.TYPE_PROFILE, data['category'], data['name'], data['unit'])
+        metric.create_measurement(Metric.TRIGGER_API, data['profile'].measurement, data['unit_interval'], data['profile'])
+
+        capture_dir = self.agent.get_option('capture_dir', tempfile.gettempdir())
+        path = os.path.join(capture_dir, 'stackimpact-{0}-{1}-{2}.{3}'.format(
+            os.getpid(), profiler_type, timestamp(), self.FORMATS[output_format]))
+
+        self.write(path, metric.to_dict(), output_format)
+
+        return path
+
+
+    def write(self, path, metric_map, output_format):
+        if output_format == 'pprof':
+            from .pprof import write_profile
+            with open(path, 'wb') as f:
+                write_profile(f, metric_map)
+            return
+
+        with open(path, 'w') as f:
+            if output_format == 'json':
+                json.dump(metric_map, f)
+            elif output_format == 'folded':
+                from .export import write_folded
+                write_folded(f, metric_map)
+            elif output_format == 'speedscope':
+                from .export import write_speedscope
+                write_speedscope(f, metric_map)
+            else:
+                from .flamegraph import write_flamegraph
+                write_flamegraph(f, metric_map)
+
+
+def send_request(socket_path, request, timeout):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+
+        sock.sendall(json.dumps(request).encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+
+        response = json.loads(read_all(sock).decode('utf-8'))
+    finally:
+        sock.close()
+
+    if 'error' in response:
+        raise Exception(response['error'])
+
+    return response
+
+
+def request_capture(socket_path, profiler_type, seconds, output_format):
+    '''Asks the agent listening on socket_path for a capture and returns the
+    path of the written file.'''
+
+    request = {
+        'type': 'capture',
+        'profiler': profiler_type,
+        'seconds': seconds,
+        'format': output_format
+    }
+    return send_request(socket_path, request, seconds + 60)['path']
+
+
+def request_history(socket_path, query):
+    '''Sends a profile history query, see ProfileHistory.query(), to the
+    agent listening on socket_path and returns the result.'''
+
+    request = dict(query)
+    request['type'] = 'history'
+    return send_request(socket_path, request, 30)['result']
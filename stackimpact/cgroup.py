@@ -0,0 +1,223 @@
+from __future__ import division
+
+import os
+
+from .procfs import read_file
+
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+PROC_CGROUP = '/proc/self/cgroup'
+
+# cgroup v1 reports no limit as a large page-aligned number
+V1_UNLIMITED_MEMORY = 1 << 60
+
+
+def read_int(path):
+    data = read_file(path)
+    if data is None:
+        return None
+
+    try:
+        return int(data.strip())
+    except ValueError:
+        return None
+
+
+def parse_keyed(data):
+    '''Parses "key value" lines, as in cpu.stat, into a map of integers.'''
+
+    fields = dict()
+    for line in data.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            try:
+                fields[parts[0]] = int(parts[1])
+            except ValueError:
+                pass
+
+    return fields
+
+
+def parse_pressure(data):
+    '''Parses a PSI file, e.g. memory.pressure, into a map of the "some" and
+    "full" lines, each a map of avg10, avg60, avg300 and total.'''
+
+    pressure = dict()
+    for line in data.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+
+        values = dict()
+        for part in parts[1:]:
+            key, _, value = part.partition('=')
+            try:
+                values[key] = float(value)
+            except ValueError:
+                pass
+        pressure[parts[0]] = values
+
+    return pressure
+
+
+class Cgroup(object):
+    '''Reads the CPU and memory limits and usage of the cgroup of the
+    process, for cgroup v1 and v2 hierarchies. Values which are not
+    available are returned as None.'''
+
+    def __init__(self, version, cpu_dir, memory_dir):
+        self.version = version
+        self.cpu_dir = cpu_dir
+        self.memory_dir = memory_dir
+
+
+    def cpu_quota(self):
+        '''Returns the CPU quota in CPUs, or None if not limited.'''
+
+        if not self.cpu_dir:
+            return None
+
+        if self.version == 2:
+            data = read_file(os.path.join(self.cpu_dir, 'cpu.max'))
+            if not data:
+                return None
+            parts = data.split()
+            if len(parts) < 2 or parts[0] == 'max':
+                return None
+            quota, period = int(parts[0]), int(parts[1])
+        else:
+            quota = read_int(os.path.join(self.cpu_dir, 'cpu.cfs_quota_us'))
+            period = read_int(os.path.join(self.cpu_dir, 'cpu.cfs_period_us'))
+            if quota is None or period is None or quota < 0:
+                return None
+
+        if period <= 0:
+            return None
+
+        return quota / period
+
+
+    def cpu_throttling(self):
+        '''Returns the number of enforcement periods, throttled periods and
+        the throttled time in nanoseconds, as a map.'''
+
+        if not self.cpu_dir:
+            return None
+
+        data = read_file(os.path.join(self.cpu_dir, 'cpu.stat'))
+        if not data:
+            return None
+        fields = parse_keyed(data)
+
+        if self.version == 2:
+            throttled_time = fields.get('throttled_usec')
+            if throttled_time is not None:
+                throttled_time *= 1000
+        else:
+            throttled_time = fields.get('throttled_time')
+
+        if 'nr_periods' not in fields:
+            return None
+
+        return {
+            'periods': fields['nr_periods'],
+            'throttled_periods': fields.get('nr_throttled', 0),
+            'throttled_time': throttled_time or 0
+        }
+
+
+    def memory_current(self):
+        '''Returns the memory usage of the cgroup in bytes.'''
+
+        if not self.memory_dir:
+            return None
+
+        if self.version == 2:
+            return read_int(os.path.join(self.memory_dir, 'memory.current'))
+        else:
+            return read_int(os.path.join(self.memory_dir, 'memory.usage_in_bytes'))
+
+
+    def memory_max(self):
+        '''Returns the memory limit of the cgroup in bytes, or None if not
+        limited.'''
+
+        if not self.memory_dir:
+            return None
+
+        if self.version == 2:
+            # "max" if not limited
+            return read_int(os.path.join(self.memory_dir, 'memory.max'))
+        else:
+            limit = read_int(os.path.join(self.memory_dir, 'memory.limit_in_bytes'))
+            if limit is None or limit >= V1_UNLIMITED_MEMORY:
+                return None
+            return limit
+
+
+    def pressure(self, resource):
+        '''Returns the pressure stall information of the cgroup for cpu,
+        memory or io, only available with cgroup v2.'''
+
+        if self.version != 2:
+            return None
+
+        directory = self.memory_dir if resource == 'memory' else self.cpu_dir
+        if not directory:
+            return None
+
+        data = read_file(os.path.join(directory, resource + '.pressure'))
+        if not data:
+            return None
+
+        return parse_pressure(data)
+
+
+def v1_dir(root, controllers, path):
+    for name in sorted(os.listdir(root)):
+        if controllers & set(name.split(',')):
+            mount_dir = os.path.join(root, name)
+            # in containers the cgroup path is relative to the host
+            # hierarchy and the cgroup of the container is mounted as root
+            cgroup_dir = os.path.join(mount_dir, path.lstrip('/'))
+            if os.path.isdir(cgroup_dir):
+                return cgroup_dir
+            return mount_dir
+
+    return None
+
+
+def detect(root=CGROUP_ROOT, proc_cgroup=PROC_CGROUP):
+    '''Returns a Cgroup for the cgroup of the process, or None if cgroups
+    are not available.'''
+
+    data = read_file(proc_cgroup)
+    if not data or not os.path.isdir(root):
+        return None
+
+    paths = dict()
+    for line in data.splitlines():
+        parts = line.split(':', 2)
+        if len(parts) == 3:
+            paths[parts[1]] = parts[2]
+
+    try:
+        if os.path.exists(os.path.join(root, 'cgroup.controllers')):
+            # unified hierarchy, one "0::<path>" line
+            path = paths.get('', '/')
+            cgroup_dir = os.path.join(root, path.lstrip('/'))
+            if not os.path.isdir(cgroup_dir):
+                cgroup_dir = root
+            return Cgroup(2, cgroup_dir, cgroup_dir)
+
+        cpu_path = memory_path = '/'
+        for controllers, path in paths.items():
+            names = set(controllers.split(','))
+            if 'cpu' in names:
+                cpu_path = path
+            if 'memory' in names:
+                memory_path = path
+
+        return Cgroup(1, v1_dir(root, set(['cpu']), cpu_path), v1_dir(root, set(['memory']), memory_path))
+    except Exception:
+        return None
@@ -8,6 +8,10 @@ class Config(object):
         self.config_lock = threading.Lock()
 
 
+    def after_fork(self):
+        self.config_lock = threading.Lock()
+
+
     def set_agent_enabled(self, val):
         with self.config_lock:
             self.agent_enabled = val
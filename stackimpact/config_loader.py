@@ -1,4 +1,3 @@
-from .api_request import APIRequest
 from .utils import timestamp
 
 
@@ -24,6 +23,13 @@ class ConfigLoader(object):
             self.load_timer = None
 
 
+    def after_fork(self):
+        # the timer thread does not exist in the child process
+        if self.load_timer:
+            self.load_timer = None
+            self.start()
+
+
     def load(self, with_interval=False):
         now = timestamp()
         if with_interval and self.last_load_ts > now - self.LOAD_INTERVAL:
@@ -31,10 +37,12 @@ class ConfigLoader(object):
     
         self.last_load_ts = now;
 
+        sink = self.agent.message_queue.sink
+        if not sink:
+            return
 
         try:
-            api_request = APIRequest(self.agent)
-            config = api_request.post('config', {})
+            config = sink.load_config()
 
             # agent_enabled yes|no
             if 'agent_enabled' in config:
@@ -53,22 +61,30 @@ class ConfigLoader(object):
                 self.agent.cpu_reporter.start()
                 self.agent.allocation_reporter.start()
                 self.agent.block_reporter.start()
-                self.agent.tf_reporter.start()
+                self.agent.heap_reporter.start()
             else:
                 self.agent.cpu_reporter.stop()
                 self.agent.allocation_reporter.stop()
                 self.agent.block_reporter.stop()
-                self.agent.tf_reporter.stop()
+                self.agent.heap_reporter.stop()
 
             if self.agent.config.is_agent_enabled():        
                 self.agent.error_reporter.start()
+                self.agent.gc_reporter.start()
                 self.agent.span_reporter.start()
                 self.agent.process_reporter.start()
+                self.agent.overhead_reporter.start()
+                self.agent.overhead_governor.start()
+                self.agent.anomaly_triggers.start()
                 self.agent.log('Agent activated')
             else:
                 self.agent.error_reporter.stop()
+                self.agent.gc_reporter.stop()
                 self.agent.span_reporter.stop()
                 self.agent.process_reporter.stop()
+                self.agent.overhead_reporter.stop()
+                self.agent.overhead_governor.stop()
+                self.agent.anomaly_triggers.stop()
                 self.agent.log('Agent deactivated')
 
 
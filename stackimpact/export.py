@@ -0,0 +1,171 @@
+from __future__ import division, print_function
+
+import os
+import json
+import argparse
+
+from .metric import Metric
+from .string_table import FRAME_NAME_REGEXP, CALLSITE_NAME_REGEXP
+
+
+def value_key(metric_map):
+    '''Returns the node field holding the value of a profile and its unit.
+    CPU profile measurements are percentages, so sample counts are used.'''
+
+    category = metric_map['category']
+    if category == Metric.CATEGORY_CPU_PROFILE:
+        return 'num_samples', 'samples'
+    elif category in (Metric.CATEGORY_BLOCK_PROFILE, Metric.CATEGORY_GC_PROFILE):
+        return 'measurement', 'milliseconds'
+    elif category == Metric.CATEGORY_MEMORY_PROFILE:
+        return 'measurement', 'bytes'
+    elif category == Metric.CATEGORY_HEAP_PROFILE:
+        return 'measurement', 'objects'
+    else:
+        return 'measurement', 'none'
+
+
+def iterate_stacks(node_map, key):
+    '''Yields (stack, self_value) for each node of a Breakdown.to_dict() tree
+    below the root, with the stack as a list of node names, root first. The
+    self value is the node value not accounted for by its children.'''
+
+    stack = [(child_map, []) for child_map in reversed(node_map['children'])]
+    while stack:
+        node_map, parent_names = stack.pop()
+
+        names = parent_names + [node_map['name']]
+
+        self_value = node_map[key]
+        for child_map in reversed(node_map['children']):
+            self_value -= child_map[key]
+            stack.append((child_map, names))
+
+        yield names, max(self_value, 0)
+
+
+def write_folded(f, metric_map):
+    '''Writes a profile as folded stacks, one "frame1;frame2;... value" line
+    per stack, as read by flamegraph.pl and other tools.'''
+
+    key, _ = value_key(metric_map)
+
+    for names, value in iterate_stacks(metric_map['measurement']['breakdown'], key):
+        value = int(round(value))
+        if value > 0:
+            f.write(';'.join(name.replace(';', ':') for name in names) + ' ' + str(value) + '\n')
+
+
+def speedscope_frame(name):
+    match = FRAME_NAME_REGEXP.match(name)
+    if match:
+        return {'name': match.group(1), 'file': match.group(2), 'line': int(match.group(3))}
+
+    match = CALLSITE_NAME_REGEXP.match(name)
+    if match:
+        return {'name': name, 'file': match.group(1), 'line': int(match.group(2))}
+
+    return {'name': name}
+
+
+def speedscope_profile(metric_map):
+    '''Returns a profile as a speedscope file format map.'''
+
+    breakdown_map = metric_map['measurement']['breakdown']
+    key, unit = value_key(metric_map)
+
+    scale = 1
+    if metric_map['category'] == Metric.CATEGORY_CPU_PROFILE and breakdown_map['metadata'].get('sampling_interval'):
+        scale = breakdown_map['metadata']['sampling_interval'] * 1e9
+        unit = 'nanoseconds'
+    if unit not in ('milliseconds', 'nanoseconds', 'bytes'):
+        unit = 'none'
+
+    frames = []
+    frame_index = dict()
+    samples = []
+    weights = []
+    for names, value in iterate_stacks(breakdown_map, key):
+        if value <= 0:
+            continue
+
+        sample = []
+        for name in names:
+            i = frame_index.get(name)
+            if i is None:
+                i = len(frames)
+                frames.append(speedscope_frame(name))
+                frame_index[name] = i
+            sample.append(i)
+
+        samples.append(sample)
+        weights.append(value * scale)
+
+    total = sum(weights)
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {
+            'frames': frames
+        },
+        'profiles': [{
+            'type': 'sampled',
+            'name': metric_map['name'],
+            'unit': unit,
+            'startValue': 0,
+            'endValue': total,
+            'samples': samples,
+            'weights': weights
+        }],
+        'name': metric_map['name'],
+        'activeProfileIndex': 0,
+        'exporter': 'stackimpact'
+    }
+
+
+def write_speedscope(f, metric_map):
+    json.dump(speedscope_profile(metric_map), f, separators=(',', ':'))
+
+
+def main():
+    from .flamegraph import write_flamegraph
+    from .sinks.file_sink import read_records
+
+    parser = argparse.ArgumentParser(description='Export profiles written by the file sink')
+    parser.add_argument('input', help='file written by the file sink')
+    parser.add_argument('--input-format', default='json', help='json or binary')
+    parser.add_argument('--format', default='svg', help='folded, speedscope or svg')
+    parser.add_argument('--category', help='only export profiles of this category, e.g. cpu-profile')
+    parser.add_argument('--output-dir', default='.')
+    args = parser.parse_args()
+
+    writers = {
+        'folded': (write_folded, 'folded'),
+        'speedscope': (write_speedscope, 'speedscope.json'),
+        'svg': (write_flamegraph, 'svg')
+    }
+    if args.format not in writers:
+        parser.error('unsupported format: ' + args.format)
+    write_func, extension = writers[args.format]
+
+    for record in read_records(args.input, args.input_format):
+        metric_map = record['content']
+        if record['topic'] != 'metric' or metric_map.get('type') != Metric.TYPE_PROFILE:
+            continue
+
+        measurement_map = metric_map.get('measurement')
+        if not measurement_map or not measurement_map.get('breakdown'):
+            continue
+
+        if args.category and metric_map['category'] != args.category:
+            continue
+
+        path = os.path.join(args.output_dir, '{0}.{1}.{2}.{3}'.format(
+            metric_map['category'], measurement_map['timestamp'], measurement_map['id'][0:8], extension))
+        with open(path, 'w') as f:
+            write_func(f, metric_map)
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from __future__ import division
+
+import zlib
+
+from .export import value_key
+
+try:
+    # python 3
+    from html import escape
+except ImportError:
+    # python 2
+    from cgi import escape
+
+
+FRAME_HEIGHT = 16
+FONT_SIZE = 11
+CHAR_WIDTH = 6.5 # approximate width of a character at FONT_SIZE
+PADDING = 10
+TITLE_HEIGHT = 30
+
+
+def frame_color(name):
+    # stable warm colors, as in flamegraph.pl
+    h = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+    r = 205 + h % 50
+    g = (h >> 8) % 230
+    b = (h >> 16) % 55
+    return 'rgb({0},{1},{2})'.format(r, g, b)
+
+
+def visible_nodes(node_map, key, scale, min_width):
+    '''Yields (node_map, depth, x, width) for the nodes wider than min_width
+    pixels, parents before children, without recursion. Children of a node
+    are laid out left to right in name order.'''
+
+    stack = [(node_map, 0, 0.0)]
+    while stack:
+        node_map, depth, x = stack.pop()
+
+        width = node_map[key] * scale
+        if width < min_width:
+            continue
+
+        yield node_map, depth, x, width
+
+        child_x = x
+        children = sorted(node_map['children'], key=lambda c: c['name'])
+        layout = []
+        for child_map in children:
+            layout.append((child_map, depth + 1, child_x))
+            child_x += child_map[key] * scale
+        stack.extend(reversed(layout))
+
+
+def write_flamegraph(f, metric_map, width=1200, min_width=0.5):
+    '''Writes a profile as a self-contained SVG flame graph. Frames narrower
+    than min_width pixels, and so their subtrees, are not drawn. The layout
+    is computed while writing, one frame at a time.'''
+
+    breakdown_map = metric_map['measurement']['breakdown']
+    key, unit = value_key(metric_map)
+
+    total = breakdown_map[key]
+    if total <= 0:
+        total = sum(c[key] for c in breakdown_map['children']) or 1
+    scale = (width - 2 * PADDING) / total
+
+    # the height depends on the depth of the drawn frames
+    max_depth = 0
+    for _, depth, _, _ in visible_nodes(breakdown_map, key, scale, min_width):
+        if depth > max_depth:
+            max_depth = depth
+    height = TITLE_HEIGHT + (max_depth + 1) * FRAME_HEIGHT + 2 * PADDING
+
+    f.write('<?xml version="1.0" standalone="no"?>\n')
+    f.write('<svg version="1.1" width="{0}" height="{1}" viewBox="0 0 {0} {1}" xmlns="http://www.w3.org/2000/svg">\n'.format(width, height))
+    f.write('<style>text {{ font-family: Verdana, sans-serif; font-size: {0}px; }} rect {{ stroke: white; stroke-width: 0.5; }}</style>\n'.format(FONT_SIZE))
+    f.write('<rect x="0" y="0" width="{0}" height="{1}" fill="rgb(250,250,250)" style="stroke: none"/>\n'.format(width, height))
+    f.write('<text x="{0}" y="20" text-anchor="middle" style="font-size: 15px">{1}</text>\n'.format(width / 2, escape(metric_map['name'])))
+
+    bottom = height - PADDING
+    for node_map, depth, x, w in visible_nodes(breakdown_map, key, scale, min_width):
+        name = node_map['name']
+        value = node_map[key]
+        y = bottom - (depth + 1) * FRAME_HEIGHT
+
+        f.write('<g><title>{0} ({1:g} {2}, {3:.2f}%)</title>'.format(escape(name), value, unit, value / total * 100))
+        f.write('<rect x="{0:.2f}" y="{1}" width="{2:.2f}" height="{3}" fill="{4}"/>'.format(
+            PADDING + x, y, w, FRAME_HEIGHT - 1, frame_color(name) if depth > 0 else 'rgb(200,200,200)'))
+
+        max_chars = int((w - 6) / CHAR_WIDTH)
+        if max_chars >= 3:
+            label = name if len(name) <= max_chars else name[0:max_chars - 2] + '..'
+            f.write('<text x="{0:.2f}" y="{1}">{2}</text>'.format(PADDING + x + 3, y + FRAME_HEIGHT - 4, escape(label)))
+        f.write('</g>\n')
+
+    f.write('</svg>\n')
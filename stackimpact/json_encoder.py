@@ -0,0 +1,145 @@
+from __future__ import division
+
+import zlib
+import json
+
+from .runtime import runtime_info
+from .metric import Breakdown
+
+try:
+    from json.encoder import encode_basestring_ascii
+except ImportError:
+    encode_basestring_ascii = json.dumps
+
+if runtime_info.PYTHON_2:
+    string_types = (str, unicode)
+    integer_types = (int, long)
+else:
+    string_types = (str,)
+    integer_types = (int,)
+
+
+BUFFER_SIZE = 64 * 1024
+INFINITY = float('inf')
+
+
+def encode_scalar(o):
+    if isinstance(o, string_types):
+        return encode_basestring_ascii(o)
+    elif o is None:
+        return 'null'
+    elif o is True:
+        return 'true'
+    elif o is False:
+        return 'false'
+    elif isinstance(o, integer_types):
+        return str(int(o))
+    elif isinstance(o, float):
+        if o != o:
+            return 'NaN'
+        elif o == INFINITY:
+            return 'Infinity'
+        elif o == -INFINITY:
+            return '-Infinity'
+        return repr(o)
+
+    raise TypeError('Object of type {0} is not JSON serializable'.format(type(o).__name__))
+
+
+def breakdown_items(node):
+    yield 'name', node.name
+    yield 'metadata', node.metadata
+    yield 'measurement', node.measurement
+    yield 'num_samples', node.num_samples
+    yield 'children', list(node.children.values())
+
+
+def iterencode(obj, buffer_size=BUFFER_SIZE):
+    '''Encodes obj as JSON and yields the output in strings of roughly
+    buffer_size characters. Breakdown objects are encoded in place, the same
+    way Breakdown.to_dict() would represent them, without building the
+    intermediate dictionaries. The object graph is walked iteratively.'''
+
+    buf = []
+    buf_len = 0
+
+    # each stack entry is [items_iterator, is_object, is_first]
+    stack = []
+    value = obj
+
+    while True:
+        if isinstance(value, dict):
+            token = '{'
+            stack.append([iter(value.items()), True, True])
+        elif isinstance(value, Breakdown):
+            token = '{'
+            stack.append([breakdown_items(value), True, True])
+        elif isinstance(value, (list, tuple)):
+            token = '['
+            stack.append([iter(value), False, True])
+        else:
+            token = encode_scalar(value)
+
+        buf.append(token)
+        buf_len += len(token)
+
+        while stack:
+            entry = stack[-1]
+            try:
+                item = next(entry[0])
+            except StopIteration:
+                stack.pop()
+                token = '}' if entry[1] else ']'
+                buf.append(token)
+                buf_len += 1
+                continue
+
+            prefix = '' if entry[2] else ','
+            entry[2] = False
+
+            if entry[1]:
+                key, value = item
+                if not isinstance(key, string_types):
+                    key = str(key)
+                token = prefix + encode_basestring_ascii(key) + ':'
+            else:
+                value = item
+                token = prefix
+
+            buf.append(token)
+            buf_len += len(token)
+            break
+
+        if buf_len >= buffer_size:
+            yield ''.join(buf)
+            buf = []
+            buf_len = 0
+
+        if not stack:
+            break
+
+    if buf:
+        yield ''.join(buf)
+
+
+def gzip_stream(chunks, level=zlib.Z_DEFAULT_COMPRESSION, buffer_size=BUFFER_SIZE):
+    '''Compresses string chunks into gzip format and yields compressed bytes
+    in blocks of at least buffer_size, except for the last one.'''
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    out = []
+    out_len = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            out.append(data)
+            out_len += len(data)
+
+            if out_len >= buffer_size:
+                yield b''.join(out)
+                out = []
+                out_len = 0
+
+    out.append(compressor.flush())
+    yield b''.join(out)
@@ -1,14 +1,26 @@
 import sys
 import threading
-import copy
+import time
 
-from .api_request import APIRequest
+from .sinks.dashboard_sink import DashboardSink
+from .sinks.aggregator_sink import AggregatorSink
+from .sinks.file_sink import FileSink
+from .sinks.stdout_sink import StdoutSink
+from .string_table import StringTable, encode_metric
+from .runtime import runtime_info
 from .utils import timestamp, base64_encode
 
+if runtime_info.PYTHON_2:
+    from Queue import Queue, Full
+else:
+    from queue import Queue, Full
+
 
 class MessageQueue(object):
     FLUSH_INTERVAL = 5;
+    FLUSH_TIMEOUT = 5
     MESSAGE_TTL = 10 * 60
+    MAX_PENDING_UPLOADS = 5
 
 
     def __init__(self, agent):
@@ -18,9 +30,56 @@ class MessageQueue(object):
         self.flush_timer = None
         self.backoff_seconds = 0
         self.last_flush_ts = 0
+        self.upload_queue = None
+        self.upload_thread = None
+        self.upload_stop = None
+        self.pending_uploads = 0
+        self.pending_cond = threading.Condition()
+        self.dropped_uploads = 0
+        self.string_table = StringTable()
+        self.sink = None
+
+
+    def create_sink(self):
+        sink = self.agent.get_option('sink')
+
+        if sink is None:
+            if self.agent.get_option('aggregator_socket'):
+                return AggregatorSink(self.agent)
+            else:
+                return DashboardSink(self.agent)
+        elif sink == 'dashboard':
+            return DashboardSink(self.agent)
+        elif sink == 'file':
+            if not self.agent.get_option('sink_file'):
+                raise Exception('missing option: sink_file')
+
+            return FileSink(
+                self.agent,
+                self.agent.get_option('sink_file'),
+                self.agent.get_option('sink_format', 'json'),
+                self.agent.get_option('sink_max_bytes'),
+                self.agent.get_option('sink_backup_count'),
+                self.agent.get_option('sink_fsync_interval'))
+        elif sink == 'stdout':
+            return StdoutSink(self.agent)
+        elif hasattr(sink, 'upload'):
+            # custom sink object
+            return sink
+        else:
+            raise Exception('Unsupported sink: ' + str(sink))
 
 
     def start(self):
+        if not self.sink:
+            self.sink = self.create_sink()
+
+        self.upload_queue = Queue(self.MAX_PENDING_UPLOADS)
+        self.upload_stop = threading.Event()
+        self.upload_thread = threading.Thread(target=self.process_uploads, args=(self.upload_queue, self.sink, self.upload_stop))
+        self.upload_thread.daemon = True
+        self.upload_thread.start()
+
         if self.agent.get_option('auto_profiling'):
             self.flush_timer = self.agent.schedule(self.FLUSH_INTERVAL, self.FLUSH_INTERVAL, self.flush)
 
@@ -29,13 +88,52 @@ class MessageQueue(object):
         if self.flush_timer:
             self.flush_timer.cancel()
             self.flush_timer = None
-            
 
-    def add(self, topic, message):
+        if self.upload_queue:
+            # the upload thread closes the sink and exits when it reaches
+            # None; if the queue is full, it does so after the current
+            # upload and the queued ones are dropped. The sink is never
+            # closed here, it may be in use by an upload
+            try:
+                self.upload_queue.put_nowait(None)
+            except Full:
+                self.upload_stop.set()
+            self.upload_queue = None
+            self.upload_thread = None
+            self.upload_stop = None
+
+        self.sink = None
+
+
+    def after_fork(self):
+        # drop messages of the parent process and replace the timer, the
+        # upload thread and locks, which may have been held at fork time
+        was_started = self.upload_queue is not None
+
+        self.queue = []
+        self.queue_lock = threading.Lock()
+        self.flush_timer = None
+        self.upload_queue = None
+        self.upload_thread = None
+        self.upload_stop = None
+        self.pending_uploads = 0
+        self.pending_cond = threading.Condition()
+        self.backoff_seconds = 0
+        self.last_flush_ts = 0
+        self.string_table = StringTable()
+        # sinks are created again, e.g. for the process id in the file name
+        self.sink = None
+
+        if was_started:
+            self.start()
+
+
+    def add(self, topic, message, ack_func=None):
         entry = {
             'topic': topic,
             'content': message,
-            'added_at': timestamp()
+            'added_at': timestamp(),
+            'ack_func': ack_func
         }
 
         with self.queue_lock:
@@ -45,17 +143,91 @@ class MessageQueue(object):
         self.agent.log(message)
 
 
-    def flush(self, with_interval=False):
+    def submit(self, func):
+        # never blocks the caller; if too many uploads are in flight, the
+        # job is dropped
+        upload_queue = self.upload_queue
+        if not upload_queue:
+            return False
+
+        with self.pending_cond:
+            self.pending_uploads += 1
+
+        try:
+            upload_queue.put_nowait(func)
+            return True
+        except Full:
+            with self.pending_cond:
+                self.pending_uploads -= 1
+                self.pending_cond.notify_all()
+            self.dropped_uploads += 1
+            self.agent.log('Upload queue is full, dropping job')
+            return False
+
+
+    def wait(self, timeout):
+        deadline = time.time() + timeout
+
+        with self.pending_cond:
+            while self.pending_uploads > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.pending_cond.wait(remaining)
+
+        return True
+
+
+    def close_sink(self, sink):
+        try:
+            sink.close()
+        except Exception:
+            self.agent.exception()
+
+
+    def process_uploads(self, upload_queue, sink, upload_stop):
+        while True:
+            func = upload_queue.get()
+            if func is None or upload_stop.is_set():
+                self.close_sink(sink)
+                return
+
+            try:
+                func()
+            except Exception:
+                self.agent.exception()
+
+            with self.pending_cond:
+                self.pending_uploads -= 1
+                self.pending_cond.notify_all()
+
+
+    def flush(self, with_interval=False, timeout=None):
+        outgoing = self.read_outgoing(with_interval)
+
+        if outgoing:
+            # uploads queued before stop() still go to the sink they were made for
+            sink = self.sink
+            if not self.submit(lambda: self.upload(outgoing, sink)):
+                self.agent.log('Dropped {0} messages'.format(len(outgoing)))
+
+        if timeout is not None:
+            return self.wait(timeout)
+
+        return True
+
+
+    def read_outgoing(self, with_interval):
         if len(self.queue) == 0:
-            return
+            return None
 
         now = timestamp()
         if with_interval and self.last_flush_ts > now - self.FLUSH_INTERVAL:
-            return
+            return None
 
         # flush only if backoff time is elapsed
         if self.last_flush_ts + self.backoff_seconds > now:
-            return
+            return None
 
         # expire old messages
         with self.queue_lock:
@@ -67,27 +239,57 @@ class MessageQueue(object):
             outgoing = self.queue
             self.queue = []
 
-        # remove added_at
-        outgoing_copy = copy.deepcopy(outgoing)
-        for m in outgoing_copy:
-            del m['added_at']
+        self.last_flush_ts = now
+
+        return outgoing
+
+
+    def upload(self, outgoing, sink):
+        string_table = None
+        # custom sinks do not have to define STATEFUL
+        if self.agent.get_option('compact_payload') and getattr(sink, 'STATEFUL', False):
+            if self.agent.get_option('compact_payload_session'):
+                string_table = self.string_table
+            else:
+                string_table = StringTable()
+
+        # remove added_at without copying message content
+        if string_table:
+            outgoing_messages = [{'topic': m['topic'], 'content': encode_metric(m['content'], string_table)} for m in outgoing]
+        else:
+            outgoing_messages = [{'topic': m['topic'], 'content': m['content']} for m in outgoing]
 
         payload = {
-            'messages': outgoing_copy
+            'messages': outgoing_messages
         }
 
-        self.last_flush_ts = now
+        if string_table:
+            payload['string_table'] = string_table.to_dict()
 
         try:
-            api_request = APIRequest(self.agent)
-            api_request.post('upload', payload)
+            response = sink.upload(payload)
+
+            if string_table:
+                string_table.commit()
+                if isinstance(response, dict) and response.get('string_table_reset') == 'yes':
+                    string_table.reset()
 
             # reset backoff
             self.backoff_seconds = 0
+
+            for m in outgoing:
+                if m['ack_func']:
+                    try:
+                        m['ack_func']()
+                    except Exception:
+                        self.agent.exception()
         except Exception:
-            self.agent.log('Error uploading messages to dashboard, backing off next upload')
+            self.agent.log('Error uploading messages, backing off next upload')
             self.agent.exception()
 
+            if string_table:
+                string_table.rollback()
+
             self.queue_lock.acquire()
             self.queue[:0] = outgoing
             self.queue_lock.release()
@@ -97,4 +299,3 @@ class MessageQueue(object):
                 self.backoff_seconds = 10
             elif self.backoff_seconds * 2 < 60:
                 self.backoff_seconds *= 2
-
@@ -3,6 +3,7 @@ from __future__ import division
 import threading
 import random
 import math
+import heapq
 
 from .utils import timestamp, generate_uuid, generate_sha1
 
@@ -17,11 +18,15 @@ class Metric(object):
     CATEGORY_MEMORY = 'memory'
     CATEGORY_GC = 'gc'
     CATEGORY_RUNTIME = 'runtime'
+    CATEGORY_IO = 'io'
     CATEGORY_SPAN = 'span'
     CATEGORY_CPU_PROFILE = 'cpu-profile'
     CATEGORY_MEMORY_PROFILE = 'memory-profile'
     CATEGORY_BLOCK_PROFILE = 'block-profile'
     CATEGORY_ERROR_PROFILE = 'error-profile'
+    CATEGORY_GC_PROFILE = 'gc-profile'
+    CATEGORY_HEAP_PROFILE = 'heap-profile'
+    CATEGORY_AGENT = 'agent'
 
     NAME_CPU_TIME = 'CPU time'
     NAME_CPU_USAGE = 'CPU usage'
@@ -29,16 +34,53 @@ class Metric(object):
     NAME_MAX_RSS = 'Max RSS'
     NAME_CURRENT_RSS = 'Current RSS'
     NAME_VM_SIZE = 'VM Size'
+    NAME_ANON_RSS = 'Anonymous RSS'
+    NAME_FILE_RSS = 'File-backed RSS'
+    NAME_SHMEM_RSS = 'Shared memory RSS'
+    NAME_PSS = 'PSS'
+    NAME_SWAP = 'Swap'
+    NAME_VOLUNTARY_CTX_SWITCHES = 'Voluntary context switches'
+    NAME_INVOLUNTARY_CTX_SWITCHES = 'Involuntary context switches'
+    NAME_BYTES_READ = 'Bytes read'
+    NAME_BYTES_WRITTEN = 'Bytes written'
+    NAME_STORAGE_BYTES_READ = 'Storage bytes read'
+    NAME_STORAGE_BYTES_WRITTEN = 'Storage bytes written'
+    NAME_READ_SYSCALLS = 'Read syscalls'
+    NAME_WRITE_SYSCALLS = 'Write syscalls'
+    NAME_OPEN_FDS = 'Open file descriptors'
+    NAME_CPU_QUOTA = 'CPU quota'
+    NAME_THROTTLED_PERIODS = 'Throttled periods'
+    NAME_THROTTLED_TIME = 'Throttled time'
+    NAME_CPU_PRESSURE = 'CPU pressure'
+    NAME_CGROUP_MEMORY_USAGE = 'Cgroup memory usage'
+    NAME_CGROUP_MEMORY_LIMIT = 'Cgroup memory limit'
+    NAME_MEMORY_PRESSURE = 'Memory pressure'
     NAME_GC_COUNT = 'Uncollected objects'
     NAME_GC_COLLECTIONS = 'Collections'
     NAME_GC_COLLECTED = 'Collected objects'
     NAME_GC_UNCOLLECTABLE = 'Uncollectable objects'
+    NAME_GC_GEN0_PAUSE_TIME = 'Generation 0 pause time'
+    NAME_GC_GEN1_PAUSE_TIME = 'Generation 1 pause time'
+    NAME_GC_GEN2_PAUSE_TIME = 'Generation 2 pause time'
+    NAME_GC_PAUSES = 'Long GC pauses'
     NAME_THREAD_COUNT = 'Active threads'
+    NAME_THREAD_CPU_USAGE = 'Thread CPU usage'
     NAME_UNCOLLECTED_ALLOCATIONS = 'Uncollected allocations'
+    NAME_LEAKING_ALLOCATIONS = 'Leaking allocations'
+    NAME_HEAP_OBJECTS = 'Heap objects'
+    NAME_HEAP_GROWTH = 'Heap object growth'
     NAME_BLOCKING_CALL_TIMES = 'Blocking call times'
     NAME_HANDLED_EXCEPTIONS = 'Handled exceptions'
     NAME_TF_OPERATION_TIMES = 'TensorFlow operation times'
     NAME_TF_OPERATION_ALLOCATION_RATE = 'TensorFlow operation allocation rate'
+    NAME_AGENT_SAMPLING_TIME = 'Sampling time'
+    NAME_AGENT_DROPPED_SAMPLES = 'Dropped samples'
+    NAME_AGENT_PROFILE_BUILD_TIME = 'Profile build time'
+    NAME_AGENT_PROFILE_NODES = 'Profile nodes'
+    NAME_AGENT_ENCODING_TIME = 'Upload encoding time'
+    NAME_AGENT_UPLOAD_LATENCY = 'Upload latency'
+    NAME_AGENT_UPLOAD_SIZE = 'Upload size'
+    NAME_AGENT_QUEUED_MESSAGES = 'Queued messages'
     
     UNIT_NONE = ''
     UNIT_MILLISECOND = 'millisecond'
@@ -74,7 +116,7 @@ class Metric(object):
         return self.measurement != None
 
 
-    def create_measurement(self, trigger, value, duration = None, breakdown = None):
+    def create_measurement(self, trigger, value, duration = None, breakdown = None, rollup = None):
         ready = True
 
         if self.typ == Metric.TYPE_COUNTER:
@@ -94,7 +136,8 @@ class Metric(object):
                 value,
                 duration,
                 breakdown,
-                timestamp())
+                timestamp(),
+                rollup)
 
 
     def to_dict(self):
@@ -116,13 +159,14 @@ class Metric(object):
 
 
 class Measurement:
-    def __init__(self, id, trigger, value, duration, breakdown, timestamp):
+    def __init__(self, id, trigger, value, duration, breakdown, timestamp, rollup = None):
         self.id = id
         self.trigger = trigger
         self.value = value
         self.duration = duration
         self.breakdown = breakdown
         self.timestamp = timestamp
+        self.rollup = rollup
 
     def to_dict(self):
         breakdown_map = None
@@ -138,9 +182,58 @@ class Measurement:
             'timestamp': self.timestamp,
         }
 
+        if self.rollup:
+            measurement_map['rollup'] = self.rollup.to_dict()
+
         return measurement_map
 
 
+class Rollup:
+    '''Summarizes the samples of a metric over a report interval as min,
+    max, average and last value, and a histogram of HISTOGRAM_BUCKETS
+    equal-width buckets between min and max.'''
+
+    HISTOGRAM_BUCKETS = 8
+
+    def __init__(self):
+        self.samples = []
+
+
+    def add(self, value):
+        self.samples.append(value)
+
+
+    def count(self):
+        return len(self.samples)
+
+
+    def to_dict(self):
+        samples = self.samples
+        if not samples:
+            return None
+
+        min_value = min(samples)
+        max_value = max(samples)
+
+        histogram = [0] * self.HISTOGRAM_BUCKETS
+        width = (max_value - min_value) / self.HISTOGRAM_BUCKETS
+        for value in samples:
+            if width > 0:
+                i = min(int((value - min_value) / width), self.HISTOGRAM_BUCKETS - 1)
+            else:
+                i = 0
+            histogram[i] += 1
+
+        return {
+            'count': len(samples),
+            'min': min_value,
+            'max': max_value,
+            'avg': sum(samples) / len(samples),
+            'last': samples[-1],
+            'histogram': histogram
+        }
+
+
 class Breakdown:
 
     TYPE_CALLGRAPH = 'callgraph'
@@ -150,6 +243,7 @@ class Breakdown:
     TYPE_ERROR = 'error'
 
     RESERVOIR_SIZE = 1000
+    NODE_SIZE_OVERHEAD = 80 # approximate serialized node size without the name
 
     def __init__(self, name, typ = None):
         self.name = name
@@ -218,6 +312,32 @@ class Breakdown:
         return child
 
 
+    def merge(self, other, weight = 1):
+        self.measurement += other.measurement * weight
+        self.num_samples += other.num_samples
+
+        for name, other_child in other.children.items():
+            child = self.find_child(name)
+            if child == None:
+                child = Breakdown(name, other_child.type)
+                child.metadata = dict(other_child.metadata)
+                self.add_child(child)
+            child.merge(other_child, weight)
+
+
+    @staticmethod
+    def from_dict(node_map):
+        node = Breakdown(node_map['name'])
+        node.metadata = dict(node_map['metadata'])
+        node.measurement = node_map['measurement']
+        node.num_samples = node_map['num_samples']
+
+        for child_map in node_map['children']:
+            node.add_child(Breakdown.from_dict(child_map))
+
+        return node
+
+
     def filter(self, from_level, min_measurement, max_measurement):
         self.filter_level(1, from_level, min_measurement,  max_measurement)
 
@@ -231,6 +351,76 @@ class Breakdown:
                 child.filter_level(current_level + 1, from_level, min_measurement, max_measurement)
 
 
+    def prune(self, max_nodes=None, max_bytes=None):
+        # keeps the heaviest nodes, visiting children of already kept nodes
+        # in descending measurement order until the node limit is reached;
+        # nodes over the byte limit are skipped, smaller ones may still fit.
+        # Since measurements are propagated, totals of kept nodes stay exact
+        kept = set([id(self)])
+        kept_nodes = 1
+        kept_bytes = self.NODE_SIZE_OVERHEAD + len(self.name)
+
+        skipped = False
+
+        heap = []
+        counter = 0
+        for child in self.children.values():
+            heapq.heappush(heap, (-child.measurement, counter, child))
+            counter += 1
+
+        while heap:
+            _, _, node = heapq.heappop(heap)
+
+            node_bytes = self.NODE_SIZE_OVERHEAD + len(node.name)
+            if max_nodes is not None and kept_nodes + 1 > max_nodes:
+                break
+            if max_bytes is not None and kept_bytes + node_bytes > max_bytes:
+                skipped = True
+                if kept_bytes + self.NODE_SIZE_OVERHEAD > max_bytes:
+                    break
+                continue
+
+            kept.add(id(node))
+            kept_nodes += 1
+            kept_bytes += node_bytes
+
+            for child in node.children.values():
+                heapq.heappush(heap, (-child.measurement, counter, child))
+                counter += 1
+
+        if not heap and not skipped:
+            return 0
+
+        pruned_nodes = 0
+        pruned_measurement = 0
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for name in list(node.children.keys()):
+                child = node.children[name]
+                if id(child) in kept:
+                    stack.append(child)
+                else:
+                    pruned_nodes += child.count_nodes()
+                    pruned_measurement += child.measurement
+                    del node.children[name]
+
+        self.add_metadata('pruned_nodes', pruned_nodes)
+        self.add_metadata('pruned_measurement', pruned_measurement)
+
+        return pruned_nodes
+
+
+    def count_nodes(self):
+        count = 1
+
+        for name, child in self.children.items():
+            count += child.count_nodes()
+
+        return count
+
+
     def depth(self):
         max_depth = 0
         
@@ -0,0 +1,119 @@
+from __future__ import division
+
+from .runtime import runtime_info, read_cpu_time
+
+
+class OverheadGovernor(object):
+    '''Keeps the CPU time spent by the agent under the max_cpu_overhead
+    option, a percentage of the CPU time of the process. When the budget is
+    exceeded, sampling intervals are doubled and spans are shortened by the
+    same factor, up to MAX_FACTOR; if that is not enough, profiling windows
+    are skipped. The factor is lowered again when the overhead falls below
+    half of the budget.'''
+
+    UPDATE_INTERVAL = 10
+    MAX_FACTOR = 16
+    MIN_SPAN_DURATION = 1
+
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.started = False
+        self.update_timer = None
+        self.factor = 1
+        self.skip = False
+        self.overhead = None
+        self.last_agent_time = None
+        self.last_process_time = None
+
+
+    def reset(self):
+        self.factor = 1
+        self.skip = False
+        self.overhead = None
+        self.last_agent_time = None
+        self.last_process_time = None
+
+
+    def start(self):
+        if self.agent.get_option('max_cpu_overhead') is None:
+            return
+
+        if not self.agent.get_option('auto_profiling'):
+            return
+
+        if runtime_info.OS_WIN:
+            return
+
+        if self.started:
+            return
+        self.started = True
+
+        self.reset()
+
+        self.update_timer = self.agent.schedule(self.UPDATE_INTERVAL, self.UPDATE_INTERVAL, self.update)
+
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+
+        self.update_timer.cancel()
+        self.update_timer = None
+
+        self.reset()
+
+
+    def after_fork(self):
+        was_started = self.started
+
+        self.started = False
+        self.update_timer = None
+        self.reset()
+
+        if was_started:
+            self.start()
+
+
+    def update(self):
+        agent_time = self.agent.overhead_reporter.cpu_time # milliseconds
+        process_time = read_cpu_time() / 1e6 # milliseconds
+
+        if self.last_process_time is not None:
+            process_time_delta = process_time - self.last_process_time
+            if process_time_delta > 0:
+                self.overhead = (agent_time - self.last_agent_time) / process_time_delta * 100
+                self.adjust(self.overhead, float(self.agent.get_option('max_cpu_overhead')))
+
+        self.last_agent_time = agent_time
+        self.last_process_time = process_time
+
+
+    def adjust(self, overhead, budget):
+        if overhead > budget:
+            if self.factor < self.MAX_FACTOR:
+                self.factor = min(self.factor * 2, self.MAX_FACTOR)
+                self.agent.log('Overhead governor: CPU overhead {0:.2f}%, sampling interval factor raised to {1}.'.format(overhead, self.factor))
+            elif not self.skip:
+                self.skip = True
+                self.agent.log('Overhead governor: CPU overhead {0:.2f}%, skipping profiling windows.'.format(overhead))
+        elif overhead < budget / 2:
+            if self.skip:
+                self.skip = False
+                self.agent.log('Overhead governor: CPU overhead {0:.2f}%, resuming profiling windows.'.format(overhead))
+            elif self.factor > 1:
+                self.factor = max(self.factor // 2, 1)
+                self.agent.log('Overhead governor: CPU overhead {0:.2f}%, sampling interval factor lowered to {1}.'.format(overhead, self.factor))
+
+
+    def sampling_interval(self, interval):
+        return interval * self.factor
+
+
+    def span_duration(self, duration):
+        return max(duration / self.factor, min(duration, self.MIN_SPAN_DURATION))
+
+
+    def should_skip(self):
+        return self.skip
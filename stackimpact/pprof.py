@@ -0,0 +1,245 @@
+from __future__ import division
+
+import gzip
+
+from .metric import Metric
+from .string_table import FRAME_NAME_REGEXP, CALLSITE_NAME_REGEXP
+
+
+# profile.proto field numbers
+PROFILE_SAMPLE_TYPE = 1
+PROFILE_SAMPLE = 2
+PROFILE_LOCATION = 4
+PROFILE_FUNCTION = 5
+PROFILE_STRING_TABLE = 6
+PROFILE_TIME_NANOS = 9
+PROFILE_DURATION_NANOS = 10
+PROFILE_PERIOD_TYPE = 11
+PROFILE_PERIOD = 12
+PROFILE_DEFAULT_SAMPLE_TYPE = 14
+
+VALUE_TYPE_TYPE = 1
+VALUE_TYPE_UNIT = 2
+
+SAMPLE_LOCATION_ID = 1
+SAMPLE_VALUE = 2
+
+LOCATION_ID = 1
+LOCATION_LINE = 4
+
+LINE_FUNCTION_ID = 1
+LINE_LINE = 2
+
+FUNCTION_ID = 1
+FUNCTION_NAME = 2
+FUNCTION_SYSTEM_NAME = 3
+FUNCTION_FILENAME = 4
+
+WIRE_VARINT = 0
+WIRE_BYTES = 2
+
+
+class ProtoWriter(object):
+    '''Minimal protocol buffers encoder for the messages of profile.proto.'''
+
+    def __init__(self):
+        self.buf = bytearray()
+
+
+    def write_varint(self, value):
+        buf = self.buf
+        while value > 0x7f:
+            buf.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buf.append(value)
+
+
+    def write_tag(self, field, wire_type):
+        self.write_varint((field << 3) | wire_type)
+
+
+    def write_int(self, field, value):
+        # default values are not written
+        if value:
+            self.write_tag(field, WIRE_VARINT)
+            self.write_varint(value)
+
+
+    def write_bytes(self, field, data):
+        self.write_tag(field, WIRE_BYTES)
+        self.write_varint(len(data))
+        self.buf.extend(data)
+
+
+    def write_string(self, field, s):
+        self.write_bytes(field, s.encode('utf-8'))
+
+
+    def write_packed(self, field, values):
+        packed = ProtoWriter()
+        for value in values:
+            packed.write_varint(value)
+        self.write_bytes(field, packed.buf)
+
+
+    def write_message(self, field, message):
+        self.write_bytes(field, message.buf)
+
+
+def split_name(name):
+    '''Returns (function, filename, line) of a call graph node name.'''
+
+    match = FRAME_NAME_REGEXP.match(name)
+    if match:
+        return match.group(1), match.group(2), int(match.group(3))
+
+    match = CALLSITE_NAME_REGEXP.match(name)
+    if match:
+        return name, match.group(1), int(match.group(2))
+
+    return name, '', 0
+
+
+def sample_types(metric_map):
+    '''Returns the pprof sample types as (type, unit) pairs, the period
+    type and a function returning the sample values of a node from its
+    self measurement and self sample count.'''
+
+    category = metric_map['category']
+    breakdown_map = metric_map['measurement']['breakdown']
+
+    if category in (Metric.CATEGORY_CPU_PROFILE, Metric.CATEGORY_BLOCK_PROFILE):
+        interval_ns = int(breakdown_map['metadata'].get('sampling_interval', 0) * 1e9)
+        if category == Metric.CATEGORY_CPU_PROFILE:
+            # measurements are percentages, the sample count is exact
+            return ([('samples', 'count'), ('cpu', 'nanoseconds')], ('cpu', 'nanoseconds'), interval_ns,
+                lambda measurement, num_samples: [num_samples, num_samples * interval_ns])
+        else:
+            # blocking time in milliseconds per second
+            return ([('samples', 'count'), ('delay', 'nanoseconds')], ('delay', 'nanoseconds'), interval_ns,
+                lambda measurement, num_samples: [num_samples, int(measurement * 1e6)])
+
+    if category == Metric.CATEGORY_MEMORY_PROFILE:
+        # allocations per second not collected at the end of the span
+        return ([('inuse_objects', 'count'), ('inuse_space', 'bytes')], ('space', 'bytes'), 0,
+            lambda measurement, num_samples: [num_samples, int(measurement)])
+
+    return ([('samples', 'count'), (category, metric_map['unit'] or 'count')], None, 0,
+        lambda measurement, num_samples: [num_samples, int(measurement)])
+
+
+def encode_profile(metric_map):
+    '''Encodes the call graph of a profile metric, as returned by
+    Metric.to_dict(), in the pprof profile.proto format. Each node with a
+    self value, i.e. a value not accounted for by its children, becomes a
+    sample with the node stack as locations.'''
+
+    measurement_map = metric_map['measurement']
+    breakdown_map = measurement_map['breakdown']
+
+    types, period_type, period, values_func = sample_types(metric_map)
+
+    strings = ['']
+    string_ids = {'': 0}
+    def ref(s):
+        i = string_ids.get(s)
+        if i is None:
+            i = len(strings)
+            strings.append(s)
+            string_ids[s] = i
+        return i
+
+    profile = ProtoWriter()
+
+    for typ, unit in types:
+        value_type = ProtoWriter()
+        value_type.write_int(VALUE_TYPE_TYPE, ref(typ))
+        value_type.write_int(VALUE_TYPE_UNIT, ref(unit))
+        profile.write_message(PROFILE_SAMPLE_TYPE, value_type)
+
+    location_ids = dict()
+    locations = ProtoWriter()
+    functions = ProtoWriter()
+    function_ids = dict()
+
+    def location_id(name):
+        loc_id = location_ids.get(name)
+        if loc_id is None:
+            func_name, filename, lineno = split_name(name)
+
+            func_key = (func_name, filename)
+            func_id = function_ids.get(func_key)
+            if func_id is None:
+                func_id = len(function_ids) + 1
+                function_ids[func_key] = func_id
+
+                function = ProtoWriter()
+                function.write_int(FUNCTION_ID, func_id)
+                function.write_int(FUNCTION_NAME, ref(func_name))
+                function.write_int(FUNCTION_SYSTEM_NAME, ref(func_name))
+                function.write_int(FUNCTION_FILENAME, ref(filename))
+                functions.write_message(PROFILE_FUNCTION, function)
+
+            loc_id = len(location_ids) + 1
+            location_ids[name] = loc_id
+
+            line = ProtoWriter()
+            line.write_int(LINE_FUNCTION_ID, func_id)
+            line.write_int(LINE_LINE, lineno)
+
+            location = ProtoWriter()
+            location.write_int(LOCATION_ID, loc_id)
+            location.write_message(LOCATION_LINE, line)
+            locations.write_message(PROFILE_LOCATION, location)
+
+        return loc_id
+
+    # depth-first, without recursion; the root node is not a frame
+    stack = [(child_map, []) for child_map in breakdown_map['children']]
+    while stack:
+        node_map, parent_ids = stack.pop()
+
+        ids = [location_id(node_map['name'])] + parent_ids
+
+        self_measurement = node_map['measurement']
+        self_samples = node_map['num_samples']
+        for child_map in node_map['children']:
+            self_measurement -= child_map['measurement']
+            self_samples -= child_map['num_samples']
+            stack.append((child_map, ids))
+
+        values = values_func(max(self_measurement, 0), max(self_samples, 0))
+        if any(values):
+            sample = ProtoWriter()
+            sample.write_packed(SAMPLE_LOCATION_ID, ids)
+            sample.write_packed(SAMPLE_VALUE, values)
+            profile.write_message(PROFILE_SAMPLE, sample)
+
+    profile.buf.extend(locations.buf)
+    profile.buf.extend(functions.buf)
+
+    profile.write_int(PROFILE_TIME_NANOS, int(measurement_map['timestamp'] * 1e9))
+    if measurement_map.get('duration'):
+        profile.write_int(PROFILE_DURATION_NANOS, int(measurement_map['duration'] * 1e9))
+
+    if period_type:
+        value_type = ProtoWriter()
+        value_type.write_int(VALUE_TYPE_TYPE, ref(period_type[0]))
+        value_type.write_int(VALUE_TYPE_UNIT, ref(period_type[1]))
+        profile.write_message(PROFILE_PERIOD_TYPE, value_type)
+        profile.write_int(PROFILE_PERIOD, period)
+
+    profile.write_int(PROFILE_DEFAULT_SAMPLE_TYPE, ref(types[-1][0]))
+
+    for s in strings:
+        profile.write_string(PROFILE_STRING_TABLE, s)
+
+    return bytes(profile.buf)
+
+
+def write_profile(f, metric_map):
+    '''Writes a gzip-compressed pprof profile, as expected by pprof tools,
+    to a binary file object.'''
+
+    with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+        gz.write(encode_profile(metric_map))
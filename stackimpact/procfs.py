@@ -0,0 +1,154 @@
+from __future__ import division
+
+import os
+
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+    PAGE_SIZE = 4096
+
+
+def read_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', 'replace')
+    except Exception:
+        return None
+
+
+def parse_stat(data):
+    '''Parses the content of /proc/<pid>/stat or /proc/<pid>/task/<tid>/stat.
+    Returns the command name, the CPU time in nanoseconds, the thread count,
+    and the virtual memory size and resident set size in kilobytes.'''
+
+    # the command name may contain spaces and parentheses
+    fields = data[data.rindex(')') + 2:].split()
+
+    # fields[0] is the third field, state
+    utime = int(fields[11])
+    stime = int(fields[12])
+
+    return {
+        'name': data[data.index('(') + 1:data.rindex(')')],
+        'cpu_time': int((utime + stime) / CLOCK_TICKS * 1e9),
+        'num_threads': int(fields[17]),
+        'vm_size': int(fields[20]) // 1024,
+        'rss': int(fields[21]) * PAGE_SIZE // 1024
+    }
+
+
+def read_stat(proc_dir='/proc/self'):
+    '''Reads /proc/<pid>/stat with a single read. Returns None where the
+    file is not available.'''
+
+    data = read_file(os.path.join(proc_dir, 'stat'))
+    if data is None:
+        return None
+
+    try:
+        return parse_stat(data)
+    except Exception:
+        return None
+
+
+def read_thread_stats(proc_dir='/proc/self'):
+    '''Reads /proc/<pid>/task/<tid>/stat of each thread of the process.
+    Returns a map of thread ids to parsed stats; threads which exit while
+    being read are skipped.'''
+
+    task_dir = os.path.join(proc_dir, 'task')
+    try:
+        tids = os.listdir(task_dir)
+    except Exception:
+        return None
+
+    stats = dict()
+    for tid in tids:
+        stat = read_stat(os.path.join(task_dir, tid))
+        if stat:
+            stats[int(tid)] = stat
+
+    return stats
+
+
+def parse_fields(data):
+    '''Parses "Key: value [kB]" lines, as in /proc/<pid>/status, io and
+    smaps_rollup, into a map of integer values. Other lines are skipped.'''
+
+    fields = dict()
+    for line in data.splitlines():
+        key, sep, value = line.partition(':')
+        if not sep or ' ' in key:
+            continue
+
+        value = value.split()
+        if value:
+            try:
+                fields[key] = int(value[0])
+            except ValueError:
+                pass
+
+    return fields
+
+
+# (file, field, name) of the values read by read_process, sizes are in kilobytes
+PROCESS_FIELDS = [
+    ('status', 'VmRSS', 'current_rss'),
+    ('status', 'VmSize', 'vm_size'),
+    ('status', 'RssAnon', 'anon_rss'),
+    ('status', 'RssFile', 'file_rss'),
+    ('status', 'RssShmem', 'shmem_rss'),
+    ('status', 'VmSwap', 'swap'),
+    ('status', 'voluntary_ctxt_switches', 'voluntary_ctxt_switches'),
+    ('status', 'nonvoluntary_ctxt_switches', 'involuntary_ctxt_switches'),
+    ('io', 'rchar', 'read_chars'),
+    ('io', 'wchar', 'write_chars'),
+    ('io', 'syscr', 'read_syscalls'),
+    ('io', 'syscw', 'write_syscalls'),
+    ('io', 'read_bytes', 'read_bytes'),
+    ('io', 'write_bytes', 'write_bytes'),
+    ('smaps_rollup', 'Pss', 'pss')
+]
+
+
+def count_fds(proc_dir='/proc/self'):
+    try:
+        return len(os.listdir(os.path.join(proc_dir, 'fd')))
+    except Exception:
+        return None
+
+
+def read_process(proc_dir='/proc/self', smaps=True):
+    '''Reads the process metrics of /proc/<pid>/stat, status, io,
+    smaps_rollup and fd/, each file with a single read. Values of files
+    which are not available, e.g. io without permissions or smaps_rollup
+    before Linux 4.14, are missing from the returned map. smaps_rollup
+    walks all memory mappings, so it can be skipped.'''
+
+    process = dict()
+
+    stat = read_stat(proc_dir)
+    if stat:
+        process['cpu_time'] = stat['cpu_time']
+        process['num_threads'] = stat['num_threads']
+
+    files = dict()
+    for filename, field, name in PROCESS_FIELDS:
+        if filename == 'smaps_rollup' and not smaps:
+            continue
+
+        if filename not in files:
+            data = read_file(os.path.join(proc_dir, filename))
+            files[filename] = parse_fields(data) if data else dict()
+
+        if field in files[filename]:
+            process[name] = files[filename][field]
+
+    open_fds = count_fds(proc_dir)
+    if open_fds is not None:
+        process['open_fds'] = open_fds
+
+    return process
@@ -0,0 +1,73 @@
+from __future__ import division
+
+from .metric import Breakdown
+
+
+DELTA_REMOVED = 'removed'
+
+
+def copy_node(node):
+    node_copy = Breakdown(node.name, node.type)
+    node_copy.measurement = node.measurement
+    node_copy.num_samples = node.num_samples
+    node_copy.metadata = dict(node.metadata)
+
+    return node_copy
+
+
+def is_changed(base, current, threshold):
+    if base.metadata != current.metadata:
+        return True
+
+    if base.measurement == current.measurement:
+        return False
+
+    return abs(current.measurement - base.measurement) > threshold * abs(base.measurement)
+
+
+def compute_delta(base, current, threshold):
+    '''Returns a tree with the nodes of current that are new or changed by
+    more than threshold (relative) compared to base, including their
+    ancestors. Nodes that are in base but not in current are included with
+    the delta metadata set to removed. Returns None if nothing has changed.'''
+
+    node = copy_node(current)
+    changed = base is None or is_changed(base, current, threshold)
+
+    for name, child in current.children.items():
+        base_child = base.children.get(name) if base else None
+        child_delta = compute_delta(base_child, child, threshold)
+        if child_delta:
+            node.add_child(child_delta)
+
+    if base:
+        for name, base_child in base.children.items():
+            if name not in current.children:
+                removed_node = Breakdown(name, base_child.type)
+                removed_node.add_metadata('delta', DELTA_REMOVED)
+                node.add_child(removed_node)
+
+    if changed or len(node.children) > 0:
+        return node
+
+    return None
+
+
+def apply_delta(base, delta):
+    '''Reconstructs the tree from base and the result of compute_delta().
+    Unchanged subtrees are shared with base.'''
+
+    node = copy_node(delta)
+
+    if base:
+        for name, base_child in base.children.items():
+            node.add_child(base_child)
+
+    for name, delta_child in delta.children.items():
+        if delta_child.get_metadata('delta') == DELTA_REMOVED:
+            if name in node.children:
+                node.remove_child(delta_child)
+        else:
+            node.add_child(apply_delta(node.children.get(name), delta_child))
+
+    return node
@@ -0,0 +1,279 @@
+from __future__ import division
+
+import json
+import zlib
+import threading
+import collections
+
+from .metric import Metric, Breakdown
+from .export import iterate_stacks
+from .utils import timestamp
+
+
+class ProfileHistory(object):
+    '''Keeps the last reported profiles of each profile type, zlib-compressed,
+    and the last readings of process metrics, for local queries. Enabled by
+    the profile_history option. At most profile_history_windows profiles are
+    kept per profile type; the oldest profiles are evicted first when their
+    total compressed size exceeds profile_history_max_bytes.'''
+
+    DEFAULT_WINDOWS = 60
+    DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+    METRIC_POINTS = 720
+
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        # (category, name) -> deque of window entries, oldest first
+        self.profiles = dict()
+        self.profile_bytes = 0
+        # (category, name) -> (unit, deque of (timestamp, value))
+        self.metrics = dict()
+
+
+    def after_fork(self):
+        # the history belongs to the parent process
+        self.lock = threading.Lock()
+        self.reset()
+
+
+    def destroy(self):
+        with self.lock:
+            self.reset()
+
+
+    def enabled(self):
+        return self.agent.get_option('profile_history')
+
+
+    def record_profile(self, metric, profile, start_ts, duration):
+        '''Records the full profile of a reported profile metric. The
+        reported breakdown may be a delta, so the profile is passed in.'''
+
+        if not self.enabled() or not metric.has_measurement():
+            return
+
+        metric_map = metric.to_dict()
+        metric_map['measurement']['breakdown'] = profile.to_dict()
+
+        entry = {
+            'id': metric_map['measurement']['id'],
+            'start': start_ts,
+            'end': metric_map['measurement']['timestamp'],
+            'duration': duration,
+            'data': zlib.compress(json.dumps(metric_map).encode('utf-8'))
+        }
+
+        max_windows = self.agent.get_option('profile_history_windows', self.DEFAULT_WINDOWS)
+        max_bytes = self.agent.get_option('profile_history_max_bytes', self.DEFAULT_MAX_BYTES)
+
+        with self.lock:
+            key = (metric.category, metric.name)
+            windows = self.profiles.get(key)
+            if windows is None:
+                windows = collections.deque()
+                self.profiles[key] = windows
+
+            windows.append(entry)
+            self.profile_bytes += len(entry['data'])
+
+            if len(windows) > max_windows:
+                self.profile_bytes -= len(windows.popleft()['data'])
+
+            while self.profile_bytes > max_bytes:
+                self.evict_oldest()
+
+
+    def evict_oldest(self):
+        oldest = None
+        for windows in self.profiles.values():
+            if windows and (oldest is None or windows[0]['end'] < oldest[0]['end']):
+                oldest = windows
+
+        self.profile_bytes -= len(oldest.popleft()['data'])
+
+
+    def record_metric(self, metric):
+        if not self.enabled() or not metric.has_measurement():
+            return
+
+        with self.lock:
+            key = (metric.category, metric.name)
+            if key not in self.metrics:
+                self.metrics[key] = (metric.unit, collections.deque(maxlen=self.METRIC_POINTS))
+
+            self.metrics[key][1].append((metric.measurement.timestamp, metric.measurement.value))
+
+
+    def profile_name(self, category, name):
+        '''Returns the profile name to merge or select windows of. Profiles
+        with different names in a category, e.g. "Uncollected allocations"
+        and "Leaking allocations", have different units and intervals, so
+        a name is required when there are several.'''
+
+        if name:
+            return name
+
+        with self.lock:
+            names = sorted(key[1] for key in self.profiles if key[0] == category)
+
+        if len(names) > 1:
+            raise Exception('Category {0} has profiles {1}, select one with name (--name)'.format(
+                category, ', '.join('"' + n + '"' for n in names)))
+
+        return names[0] if names else None
+
+
+    def find_windows(self, category, name, since, until):
+        with self.lock:
+            entries = []
+            for key, windows in self.profiles.items():
+                if key[0] != category or (name and key[1] != name):
+                    continue
+
+                for entry in windows:
+                    if since and entry['end'] < since:
+                        continue
+                    if until and entry['end'] > until:
+                        continue
+                    entries.append(entry)
+
+        entries.sort(key=lambda entry: entry['end'])
+        return entries
+
+
+    def decode(self, entry):
+        metric_map = json.loads(zlib.decompress(entry['data']).decode('utf-8'))
+        metric_map['measurement']['start'] = entry['start']
+        return metric_map
+
+
+    def profiles_between(self, category, name=None, since=None, until=None):
+        '''Returns the profile metric maps of the windows ending between
+        since and until, oldest first.'''
+
+        return [self.decode(entry) for entry in self.find_windows(category, name, since, until)]
+
+
+    def merged_profile(self, category, name=None, since=None, until=None):
+        '''Returns the profiles of the windows ending between since and
+        until merged into one profile metric map, e.g. for the last 10
+        minutes. Measurements are averaged over the profiled time of the
+        windows and sample counts are summed.'''
+
+        name = self.profile_name(category, name)
+        entries = self.find_windows(category, name, since, until)
+        if not entries:
+            return None
+
+        total_duration = sum(entry['duration'] for entry in entries)
+
+        merged = None
+        merged_breakdown = None
+        for entry in entries:
+            metric_map = self.decode(entry)
+            if merged is None:
+                merged = metric_map
+                merged_breakdown = Breakdown(metric_map['measurement']['breakdown']['name'])
+                merged_breakdown.metadata = dict(metric_map['measurement']['breakdown']['metadata'])
+
+            if total_duration > 0:
+                weight = entry['duration'] / total_duration
+            else:
+                weight = 1 / len(entries)
+            merged_breakdown.merge(Breakdown.from_dict(metric_map['measurement']['breakdown']), weight)
+
+        measurement_map = merged['measurement']
+        measurement_map['value'] = merged_breakdown.measurement
+        measurement_map['breakdown'] = merged_breakdown.to_dict()
+        measurement_map['start'] = entries[0]['start']
+        measurement_map['timestamp'] = entries[-1]['end']
+        measurement_map['windows'] = len(entries)
+
+        return merged
+
+
+    def window_profile(self, category, name=None, ts=None, window_id=None):
+        '''Returns the profile of the window with the measurement id
+        window_id, or of the last window ending at or before ts.'''
+
+        name = self.profile_name(category, name)
+        entries = self.find_windows(category, name, None, ts)
+        for entry in reversed(entries):
+            if window_id is None or entry['id'] == window_id:
+                return self.decode(entry)
+
+        return None
+
+
+    def top_nodes(self, metric_map, limit=20):
+        '''Returns the call graph nodes, e.g. allocation sites, with the
+        largest self measurement in a profile, as (name, measurement) pairs.'''
+
+        totals = dict()
+        for names, value in iterate_stacks(metric_map['measurement']['breakdown'], 'measurement'):
+            totals[names[-1]] = totals.get(names[-1], 0) + value
+
+        top = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        return [item for item in top[0:limit] if item[1] > 0]
+
+
+    def metric_points(self, category=None, name=None, since=None, until=None):
+        '''Returns the recorded readings of process metrics as maps with
+        category, name, unit and a list of [timestamp, value] points.'''
+
+        with self.lock:
+            series = []
+            for key, (unit, points) in self.metrics.items():
+                if (category and key[0] != category) or (name and key[1] != name):
+                    continue
+
+                series.append({
+                    'category': key[0],
+                    'name': key[1],
+                    'unit': unit,
+                    'points': [[ts, value] for ts, value in points
+                        if (not since or ts >= since) and (not until or ts <= until)]
+                })
+
+        return series
+
+
+    def query(self, request):
+        '''Answers a query map, as sent to the capture socket. Supported
+        queries are "merged", "profiles", "top" and "metrics"; time ranges
+        are given as "minutes" back from now or as "since" and "until"
+        timestamps. Without a range, "top" looks at a single window, the
+        one with the measurement id "window_id" or the last one ending at
+        or before "until".'''
+
+        query = request.get('query', 'merged')
+        category = request.get('category') or Metric.CATEGORY_CPU_PROFILE
+        name = request.get('name')
+
+        since = request.get('since')
+        until = request.get('until')
+        if request.get('minutes'):
+            since = timestamp() - int(request['minutes'] * 60)
+
+        if query == 'merged':
+            return self.merged_profile(category, name, since, until)
+        elif query == 'profiles':
+            return self.profiles_between(category, name, since, until)
+        elif query == 'top':
+            if request.get('minutes') or request.get('since'):
+                metric_map = self.merged_profile(category, name, since, until)
+            else:
+                metric_map = self.window_profile(category, name, until, request.get('window_id'))
+            if not metric_map:
+                return []
+            return [{'name': n, 'measurement': m} for n, m in self.top_nodes(metric_map, request.get('limit', 20))]
+        elif query == 'metrics':
+            return self.metric_points(request.get('category'), name, since, until)
+        else:
+            raise Exception('Unsupported query: ' + str(query))
@@ -4,6 +4,8 @@ import sys
 import time
 import re
 import threading
+import collections
+import itertools
 
 from ..runtime import min_version, runtime_info, read_vm_size
 from ..utils import timestamp
@@ -16,8 +18,15 @@ if min_version(3, 4):
 
 class AllocationProfiler(object):
     MAX_TRACEBACK_SIZE = 25 # number of frames
+    LEAK_TRACEBACK_SIZE = 5 # number of frames
     MAX_MEMORY_OVERHEAD = 10 * 1e6 # 10MB
+    MAX_LEAK_MEMORY_OVERHEAD = 25 * 1e6 # 25MB
     MAX_PROFILED_ALLOCATIONS = 25
+    MAX_FRAME_NAMES = 10000
+    LEAK_WINDOWS = 5
+    MIN_LEAK_WINDOWS = 3
+    MIN_LEAK_WINDOW_DURATION = 30 # seconds
+    MIN_LEAK_TREND = 0.5
 
 
     def __init__(self, agent):
@@ -25,8 +34,16 @@ class AllocationProfiler(object):
         self.ready = False
         self.profile = None
         self.profile_lock = threading.Lock()
+        # (filename, lineno) -> node name, kept between windows
+        self.frame_names = dict()
         self.overhead_monitor = None
-        self.start_ts = None
+        self.tracing = False
+        self.leak_tracing = False
+        self.leak_disabled = False
+        self.span_sizes = None
+        self.leak_sizes = None
+        self.leak_ts = None
+        self.leak_windows = collections.deque(maxlen=self.LEAK_WINDOWS)
 
 
     def setup(self):
@@ -44,27 +61,71 @@ class AllocationProfiler(object):
         self.ready = True
 
 
+    def after_fork(self):
+        self.profile_lock = threading.Lock()
+        self.overhead_monitor = None
+
+        # only stop tracing started by the profiler, the application may
+        # trace allocations itself
+        if self.ready and (self.tracing or self.leak_tracing) and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.tracing = False
+        self.leak_tracing = False
+        self.leak_disabled = False
+        self.reset_leaks()
+
+
     def reset(self):
         self.profile = Breakdown('Allocation call graph', Breakdown.TYPE_CALLGRAPH)
 
 
+    def reset_leaks(self):
+        self.span_sizes = None
+        self.leak_sizes = None
+        self.leak_ts = None
+        self.leak_windows = collections.deque(maxlen=self.LEAK_WINDOWS)
+
+
     def start_profiler(self):
         self.agent.log('Activating memory allocation profiler.')
 
-        def start():
-            tracemalloc.start(self.MAX_TRACEBACK_SIZE)
-        self.agent.run_in_main_thread(start)
+        if self.agent.get_option('allocation_leak_detection') and not self.leak_disabled:
+            self.start_leak_span()
+        else:
+            self.tracing = True
 
-        self.start_ts = time.time()
+            def start():
+                tracemalloc.start(self.MAX_TRACEBACK_SIZE)
+            self.agent.run_in_main_thread(start)
 
         def monitor_overhead():
-            if tracemalloc.is_tracing() and tracemalloc.get_tracemalloc_memory() > self.MAX_MEMORY_OVERHEAD:
+            if not tracemalloc.is_tracing():
+                return
+
+            max_overhead = self.MAX_LEAK_MEMORY_OVERHEAD if self.leak_tracing else self.MAX_MEMORY_OVERHEAD
+            if tracemalloc.get_tracemalloc_memory() > max_overhead:
                 self.agent.log('Allocation profiler memory overhead limit exceeded: {0} bytes'.format(tracemalloc.get_tracemalloc_memory()))
                 self.stop_profiler()
 
         self.overhead_monitor = self.agent.schedule(0.5, 0.5, monitor_overhead)
 
 
+    def start_leak_span(self):
+        # the trace is kept between the spans, so that the live size of
+        # each call site can be compared across windows; tracemalloc has
+        # one global traceback limit, so the spans use the lower one too
+        if not self.leak_tracing:
+            def start():
+                tracemalloc.start(self.LEAK_TRACEBACK_SIZE)
+            self.leak_tracing = self.agent.run_in_main_thread(start)
+            self.reset_leaks()
+            self.span_sizes = dict()
+        elif tracemalloc.is_tracing():
+            self.span_sizes = self.callsite_sizes(tracemalloc.take_snapshot())
+        else:
+            self.span_sizes = dict()
+
+
     def stop_profiler(self):
         self.agent.log('Deactivating memory allocation profiler.')
 
@@ -73,11 +134,55 @@ class AllocationProfiler(object):
                 self.overhead_monitor.cancel()
                 self.overhead_monitor = None
 
-            if tracemalloc.is_tracing():
-                snapshot = tracemalloc.take_snapshot()
-                self.agent.log('Allocation profiler memory overhead {0} bytes'.format(tracemalloc.get_tracemalloc_memory()))
+            self.tracing = False
+
+            if not tracemalloc.is_tracing():
+                return
+
+            # the span may already have been stopped by the monitor
+            span_sizes = self.span_sizes
+            if self.leak_tracing and span_sizes is None:
+                return
+            self.span_sizes = None
+
+            snapshot = tracemalloc.take_snapshot()
+            self.agent.log('Allocation profiler memory overhead {0} bytes'.format(tracemalloc.get_tracemalloc_memory()))
+
+            if self.leak_tracing:
+                self.process_snapshot(snapshot, span_sizes)
+                self.check_leak_overhead()
+            else:
                 tracemalloc.stop()
-                self.process_snapshot(snapshot, time.time() - self.start_ts)
+                self.process_snapshot(snapshot)
+
+
+    def stop(self):
+        if not self.ready:
+            return
+
+        with self.profile_lock:
+            self.stop_leak_tracing()
+
+
+    def stop_leak_tracing(self):
+        if self.leak_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.leak_tracing = False
+        self.reset_leaks()
+
+
+    def check_leak_overhead(self):
+        memory = tracemalloc.get_tracemalloc_memory()
+        if memory > self.MAX_LEAK_MEMORY_OVERHEAD:
+            self.agent.log('Allocation leak detection memory overhead limit exceeded: {0} bytes'.format(memory))
+            self.stop_leak_tracing()
+            self.leak_disabled = True
+
+
+    def min_measurement(self):
+        # nodes under 1KB are dropped unless the profile is pruned to a
+        # node or byte budget, then only empty nodes are
+        return 1 if self.agent.has_profile_budget() else 1000
 
 
     def build_profile(self, duration):
@@ -85,9 +190,9 @@ class AllocationProfiler(object):
             self.profile.normalize(duration)
             self.profile.propagate()
             self.profile.floor()
-            self.profile.filter(2, 1000, float("inf"))
+            self.profile.filter(2, self.min_measurement(), float("inf"))
 
-            return [{
+            profile_data = [{
                 'category': Metric.CATEGORY_MEMORY_PROFILE,
                 'name': Metric.NAME_UNCOLLECTED_ALLOCATIONS,
                 'unit': Metric.UNIT_BYTE,
@@ -95,30 +200,156 @@ class AllocationProfiler(object):
                 'profile': self.profile
             }]
 
+            if self.leak_tracing:
+                self.record_leak_window()
+
+                leak_profile = self.build_leak_profile()
+                if leak_profile:
+                    profile_data.append({
+                        'category': Metric.CATEGORY_MEMORY_PROFILE,
+                        'name': Metric.NAME_LEAKING_ALLOCATIONS,
+                        'unit': Metric.UNIT_BYTE,
+                        'unit_interval': 60,
+                        'profile': leak_profile
+                    })
+
+            return profile_data
+
+
+    def record_leak_window(self):
+        '''Compares the live size of each call site in the trace with the
+        previous window. Windows shorter than MIN_LEAK_WINDOW_DURATION, e.g.
+        of captures, are merged into the next one.'''
+
+        if not tracemalloc.is_tracing():
+            return
+
+        now = time.time()
+        if self.leak_ts is not None and now - self.leak_ts < self.MIN_LEAK_WINDOW_DURATION:
+            return
+
+        sizes = dict((callsite, size) for callsite, (size, _) in self.callsite_sizes(tracemalloc.take_snapshot()).items())
+
+        if self.leak_sizes is not None:
+            growth = dict()
+            for callsite in set(sizes).union(self.leak_sizes):
+                growth[callsite] = sizes.get(callsite, 0) - self.leak_sizes.get(callsite, 0)
+            self.leak_windows.append((now - self.leak_ts, growth))
+
+        self.leak_sizes = sizes
+        self.leak_ts = now
+
+        self.check_leak_overhead()
+
+
+    def build_leak_profile(self):
+        '''Returns a call graph of the call sites whose live size grew in
+        each of the last MIN_LEAK_WINDOWS windows, at a rate which is not
+        decaying over the tracked windows, weighted by the average growth
+        rate in bytes per minute. A bounded cache does not grow once full,
+        and the growth of a cache warming up decays, so neither is
+        reported.'''
+
+        if len(self.leak_windows) < self.MIN_LEAK_WINDOWS:
+            return None
+
+        callsites = set()
+        for _, growth in self.leak_windows:
+            callsites.update(callsite for callsite, size in growth.items() if size > 0)
+
+        leak_profile = Breakdown('Leaking allocation call graph', Breakdown.TYPE_CALLGRAPH)
+
+        for callsite in callsites:
+            # bytes per second, oldest window first
+            rates = [growth.get(callsite, 0) / duration for duration, growth in self.leak_windows]
+
+            if min(rates[-self.MIN_LEAK_WINDOWS:]) <= 0:
+                continue
+
+            half = len(rates) // 2
+            older_rate = sum(rates[:half]) / half
+            newer_rate = sum(rates[-half:]) / half
+            if newer_rate < older_rate * self.MIN_LEAK_TREND:
+                continue
+
+            current_node = leak_profile
+            for frame_key in callsite:
+                current_node = current_node.find_or_add_child(self.frame_name(frame_key))
+                current_node.set_type(Breakdown.TYPE_CALLSITE)
+            current_node.increment(sum(rates) / len(rates) * 60, len(rates))
+
+        leak_profile.propagate()
+        leak_profile.floor()
+        leak_profile.filter(2, self.min_measurement(), float("inf"))
+
+        return leak_profile
+
 
     def destroy(self):
-        pass
-        
-
-    def process_snapshot(self, snapshot, duration):
-        stats = snapshot.statistics('traceback')
-
-        for stat in stats[:self.MAX_PROFILED_ALLOCATIONS]:
-            if stat.traceback:
-                skip_stack = False
-                for frame in stat.traceback:
-                    if self.agent.frame_cache.is_agent_frame(frame.filename):
-                        skip_stack = True
-                        break
-                if skip_stack:
-                    continue
-
-                current_node = self.profile
-                for frame in reversed(stat.traceback):
-                    if frame.filename == '<unknown>':
-                        continue
-
-                    frame_name = '{0}:{1}'.format(frame.filename, frame.lineno)
-                    current_node = current_node.find_or_add_child(frame_name)
-                    current_node.set_type(Breakdown.TYPE_CALLSITE)
-                current_node.increment(stat.size, stat.count)
+        if not self.ready:
+            return
+
+        with self.profile_lock:
+            self.stop_leak_tracing()
+
+
+    def frame_name(self, frame_key):
+        frame_name = self.frame_names.get(frame_key)
+        if frame_name is None:
+            frame_name = '{0}:{1}'.format(*frame_key)
+            if len(self.frame_names) < self.MAX_FRAME_NAMES:
+                self.frame_names[frame_key] = frame_name
+
+        return frame_name
+
+
+    def callsite_stats(self, snapshot):
+        '''Yields the call site, size and count of the traced allocations
+        grouped by traceback, largest first.'''
+
+        # statistics() groups the traces by traceback; the agent's tracebacks
+        # are skipped here, as Snapshot.filter_traces matches the frames of
+        # each trace in Python and is much slower on large trace tables
+        is_agent_frame = self.agent.frame_cache.is_agent_frame
+
+        for stat in snapshot.statistics('traceback'):
+            if not stat.traceback:
+                continue
+
+            frame_keys = [(frame.filename, frame.lineno) for frame in stat.traceback]
+            if any(is_agent_frame(filename) for filename, _ in frame_keys):
+                continue
+
+            callsite = tuple(frame_key for frame_key in reversed(frame_keys) if frame_key[0] != '<unknown>')
+            yield callsite, stat.size, stat.count
+
+
+    def callsite_sizes(self, snapshot):
+        sizes = dict()
+        for callsite, size, count in self.callsite_stats(snapshot):
+            total_size, total_count = sizes.get(callsite, (0, 0))
+            sizes[callsite] = (total_size + size, total_count + count)
+
+        return sizes
+
+
+    def process_snapshot(self, snapshot, span_sizes=None):
+        if span_sizes is None:
+            allocations = itertools.islice(self.callsite_stats(snapshot), self.MAX_PROFILED_ALLOCATIONS)
+        else:
+            # the trace is kept between the spans, only the growth during
+            # the span is retained by the span
+            allocations = []
+            for callsite, (size, count) in self.callsite_sizes(snapshot).items():
+                span_size, span_count = span_sizes.get(callsite, (0, 0))
+                if size > span_size:
+                    allocations.append((callsite, size - span_size, max(count - span_count, 0)))
+            allocations.sort(key=lambda allocation: allocation[1], reverse=True)
+            allocations = allocations[:self.MAX_PROFILED_ALLOCATIONS]
+
+        for callsite, size, count in allocations:
+            current_node = self.profile
+            for frame_key in callsite:
+                current_node = current_node.find_or_add_child(self.frame_name(frame_key))
+                current_node.set_type(Breakdown.TYPE_CALLSITE)
+            current_node.increment(size, count)
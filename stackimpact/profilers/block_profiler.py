@@ -7,10 +7,11 @@ import threading
 import re
 import signal
 
-from ..runtime import min_version, runtime_info
+from ..runtime import min_version, runtime_info, perf_counter_ns
 from ..metric import Metric
 from ..metric import Breakdown
 from ..frame import Frame
+from ..sample_recording import PROFILER_BLOCK
 
 if runtime_info.GEVENT:
     import gevent
@@ -28,6 +29,10 @@ class BlockProfiler(object):
         self.profile_lock = threading.Lock()
         self.prev_signal_handler = None
         self.sampler_active = False
+        self.sampling_interval = self.SAMPLING_RATE
+        self.span_start_ts = None
+        self.sample_count = 0
+        self.sample_time = 0
 
 
     def setup(self):
@@ -38,8 +43,6 @@ class BlockProfiler(object):
             self.agent.log('CPU profiler is only supported on Linux and OS X.')
             return
 
-        sample_time = self.SAMPLING_RATE * 1000
-
         main_thread_id = None
         if runtime_info.GEVENT:
             main_thread_id = gevent._threading.get_ident()
@@ -48,12 +51,13 @@ class BlockProfiler(object):
 
         def _sample(signum, signal_frame):
             if self.sampler_active:
+                self.agent.overhead_reporter.record(Metric.NAME_AGENT_DROPPED_SAMPLES, 'Block profiler', 1)
                 return
             self.sampler_active = True
 
             with self.profile_lock:
                 try:
-                    self.process_sample(signal_frame, sample_time, main_thread_id)
+                    self.process_sample(signal_frame, self.sampling_interval * 1000, main_thread_id)
                     signal_frame = None
                 except Exception:
                     self.agent.exception()
@@ -65,6 +69,10 @@ class BlockProfiler(object):
         self.ready = True
 
 
+    def stop(self):
+        pass
+
+
     def destroy(self):
         if not self.ready:
             return
@@ -72,19 +80,33 @@ class BlockProfiler(object):
         signal.signal(signal.SIGALRM, self.prev_signal_handler)
 
 
+    def after_fork(self):
+        self.profile_lock = threading.Lock()
+        self.sampler_active = False
+
+
     def reset(self):
         self.profile = Breakdown('Execution call graph', Breakdown.TYPE_CALLGRAPH)
+        self.sample_count = 0
+        self.sample_time = 0
 
 
     def start_profiler(self):
         self.agent.log('Activating block profiler.')
 
-        signal.setitimer(signal.ITIMER_REAL, self.SAMPLING_RATE, self.SAMPLING_RATE)
+        self.sampling_interval = self.agent.overhead_governor.sampling_interval(self.SAMPLING_RATE)
+        self.span_start_ts = time.time()
+        signal.setitimer(signal.ITIMER_REAL, self.sampling_interval, self.sampling_interval)
 
 
     def stop_profiler(self):
         signal.setitimer(signal.ITIMER_REAL, 0)
 
+        recorder = self.agent.sample_recorder
+        if recorder:
+            recorder.record_span(PROFILER_BLOCK, time.time() - self.span_start_ts)
+            recorder.flush()
+
         self.agent.log('Deactivating block profiler.')
 
 
@@ -92,6 +114,9 @@ class BlockProfiler(object):
         with self.profile_lock:
             self.profile.normalize(duration)
             self.profile.propagate()
+            # sample times are taken at the interval set by the overhead governor
+            if self.sample_count > 0:
+                self.profile.add_metadata('sampling_interval', self.sample_time / self.sample_count / 1000)
             self.profile.floor()
             self.profile.filter(2, 1, float("inf"))
 
@@ -106,7 +131,8 @@ class BlockProfiler(object):
 
     def process_sample(self, signal_frame, sample_time, main_thread_id):
         if self.profile:
-            start = time.clock()
+            start = perf_counter_ns()
+            recorder = self.agent.sample_recorder
 
             current_frames = sys._current_frames()
             items = current_frames.items()
@@ -116,17 +142,29 @@ class BlockProfiler(object):
 
                 stack = self.recover_stack(thread_frame)
                 if stack:
-                    current_node = self.profile
-                    for frame in reversed(stack):
-                        current_node = current_node.find_or_add_child(str(frame))
-                        current_node.set_type(Breakdown.TYPE_CALLSITE)
-                    current_node.increment(sample_time, 1)
+                    self.update_profile(self.profile, stack, sample_time)
+
+                    if recorder:
+                        recorder.record_sample(PROFILER_BLOCK, thread_id, sample_time / 1000, stack)
 
                 thread_id, thread_frame, stack = None, None, None
 
             items = None
             current_frames = None
 
+            self.agent.overhead_reporter.record_time(Metric.NAME_AGENT_SAMPLING_TIME, 'Block profiler', start)
+
+
+    def update_profile(self, profile, stack, sample_time):
+        current_node = profile
+        for frame in reversed(stack):
+            current_node = current_node.find_or_add_child(str(frame))
+            current_node.set_type(Breakdown.TYPE_CALLSITE)
+        current_node.increment(sample_time, 1)
+
+        self.sample_count += 1
+        self.sample_time += sample_time
+
 
     def recover_stack(self, thread_frame):
         stack = []
@@ -7,10 +7,11 @@ import threading
 import re
 import signal
 
-from ..runtime import min_version, runtime_info
+from ..runtime import min_version, runtime_info, perf_counter_ns
 from ..metric import Metric
 from ..metric import Breakdown
 from ..frame import Frame
+from ..sample_recording import PROFILER_CPU
 
 
 
@@ -26,6 +27,8 @@ class CPUProfiler(object):
         self.profile_lock = threading.Lock()
         self.prev_signal_handler = None
         self.sampler_active = False
+        self.sampling_interval = self.SAMPLING_RATE
+        self.span_start_ts = None
 
 
     def setup(self):
@@ -38,6 +41,7 @@ class CPUProfiler(object):
 
         def _sample(signum, signal_frame):
             if self.sampler_active:
+                self.agent.overhead_reporter.record(Metric.NAME_AGENT_DROPPED_SAMPLES, 'CPU profiler', 1)
                 return
             self.sampler_active = True
 
@@ -55,6 +59,11 @@ class CPUProfiler(object):
         self.ready = True
 
 
+    def after_fork(self):
+        self.profile_lock = threading.Lock()
+        self.sampler_active = False
+
+
     def reset(self):
         self.profile = Breakdown('Execution call graph', Breakdown.TYPE_CALLGRAPH)
 
@@ -62,12 +71,23 @@ class CPUProfiler(object):
     def start_profiler(self):
         self.agent.log('Activating CPU profiler.')
 
-        signal.setitimer(signal.ITIMER_PROF, self.SAMPLING_RATE, self.SAMPLING_RATE)
+        self.sampling_interval = self.agent.overhead_governor.sampling_interval(self.SAMPLING_RATE)
+        self.span_start_ts = time.time()
+        signal.setitimer(signal.ITIMER_PROF, self.sampling_interval, self.sampling_interval)
 
 
     def stop_profiler(self):
         signal.setitimer(signal.ITIMER_PROF, 0)
 
+        recorder = self.agent.sample_recorder
+        if recorder:
+            recorder.record_span(PROFILER_CPU, time.time() - self.span_start_ts)
+            recorder.flush()
+
+
+    def stop(self):
+        pass
+
 
     def destroy(self):
         if not self.ready:
@@ -79,8 +99,15 @@ class CPUProfiler(object):
     def build_profile(self, duration):
         with self.profile_lock:
             self.profile.propagate()
-            self.profile.evaluate_percent(duration / self.SAMPLING_RATE)
-            self.profile.filter(2, 1, 100)
+            # samples are weighted by the sampling interval, which may have
+            # been changed by the overhead governor between spans
+            if self.profile.num_samples > 0:
+                self.profile.add_metadata('sampling_interval', self.profile.measurement / self.profile.num_samples)
+            self.profile.convert_to_percent(duration)
+            # with a node or byte budget, the lowest-weight subtrees are
+            # pruned by the reporter instead
+            if not self.agent.has_profile_budget():
+                self.profile.filter(2, 1, 100)
 
             return [{
                 'category': Metric.CATEGORY_CPU_PROFILE,
@@ -93,14 +120,20 @@ class CPUProfiler(object):
 
     def process_sample(self, signal_frame):
         if self.profile:
-            start = time.clock()
+            start = perf_counter_ns()
             if signal_frame:
                 stack = self.recover_stack(signal_frame)
                 if stack:
                     self.update_profile(self.profile, stack)
 
+                    recorder = self.agent.sample_recorder
+                    if recorder:
+                        recorder.record_sample(PROFILER_CPU, threading.current_thread().ident, self.sampling_interval, stack)
+
                 stack = None
-            
+
+            self.agent.overhead_reporter.record_time(Metric.NAME_AGENT_SAMPLING_TIME, 'CPU profiler', start)
+
 
     def recover_stack(self, signal_frame):
         stack = []
@@ -135,4 +168,4 @@ class CPUProfiler(object):
             current_node = current_node.find_or_add_child(str(frame))
             current_node.set_type(Breakdown.TYPE_CALLSITE)
         
-        current_node.increment(0, 1)
+        current_node.increment(self.sampling_interval, 1)
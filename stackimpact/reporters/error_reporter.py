@@ -53,6 +53,19 @@ class ErrorReporter(object):
         unpatch(sys, 'exc_info')
 
 
+    def after_fork(self):
+        was_started = self.started
+
+        self.started = False
+        self.process_timer = None
+        self.report_timer = None
+        self.exc_queue = collections.deque()
+        self.profile_lock = threading.Lock()
+
+        if was_started:
+            self.start()
+
+
     def reset(self):
         with self.profile_lock:
             self.profile = Breakdown('Error call graph', Breakdown.TYPE_ERROR)
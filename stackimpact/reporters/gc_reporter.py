@@ -0,0 +1,216 @@
+from __future__ import division
+
+import sys
+import gc
+import time
+import threading
+import collections
+
+from ..utils import timestamp
+from ..metric import Metric
+from ..metric import Breakdown
+from ..metric import Rollup
+from ..frame import Frame
+
+
+class GCReporter(object):
+    '''Times garbage collections with gc.callbacks, available in Python 3.3+,
+    and reports the pause times of each generation. The Python stack which
+    triggered a pause longer than gc_pause_threshold milliseconds, i.e. the
+    allocation site where the collection kicked in, is added to a call graph
+    weighted by pause time.'''
+
+    MAX_QUEUED_PAUSES = 100
+    MAX_STACK_DEPTH = 25
+    DEFAULT_PAUSE_THRESHOLD = 10 # milliseconds
+
+    PAUSE_TIME_METRICS = [
+        Metric.NAME_GC_GEN0_PAUSE_TIME,
+        Metric.NAME_GC_GEN1_PAUSE_TIME,
+        Metric.NAME_GC_GEN2_PAUSE_TIME
+    ]
+
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.ready = False
+        self.started = False
+        self.process_timer = None
+        self.report_timer = None
+        self.pause_queue = collections.deque()
+        self.pause_rollups = None
+        self.pause_threshold = None
+        self.collection_start = None
+        self.profile = None
+        self.profile_start_ts = None
+        self.profile_lock = threading.Lock()
+
+
+    def setup(self):
+        if self.agent.get_option('gc_profiler_disabled'):
+            return
+
+        if not hasattr(gc, 'callbacks'):
+            self.agent.log('GC profiler is only supported in Python 3.3 or higher')
+            return
+
+        self.ready = True
+
+
+    def destroy(self):
+        if not self.ready:
+            return
+
+        self.unregister_callback()
+
+
+    def after_fork(self):
+        was_started = self.started
+
+        # gc.callbacks is inherited by the child process
+        self.unregister_callback()
+
+        self.started = False
+        self.process_timer = None
+        self.report_timer = None
+        self.pause_queue = collections.deque()
+        self.profile_lock = threading.Lock()
+
+        if was_started:
+            self.start()
+
+
+    def reset(self):
+        self.pause_rollups = [Rollup(), Rollup(), Rollup()]
+
+        with self.profile_lock:
+            self.profile = Breakdown('GC pause call graph', Breakdown.TYPE_CALLGRAPH)
+            self.profile_start_ts = timestamp()
+
+
+    def start(self):
+        if not self.ready:
+            return
+
+        if not self.agent.get_option('auto_profiling'):
+            return
+
+        if self.started:
+            return
+        self.started = True
+
+        self.reset()
+
+        self.pause_threshold = self.agent.get_option('gc_pause_threshold', self.DEFAULT_PAUSE_THRESHOLD)
+        self.collection_start = None
+        gc.callbacks.append(self.gc_callback)
+
+        self.process_timer = self.agent.schedule(1, 1, self.process)
+        self.report_timer = self.agent.schedule(60, 60, self.report)
+
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+
+        self.unregister_callback()
+
+        self.process_timer.cancel()
+        self.process_timer = None
+
+        self.report_timer.cancel()
+        self.report_timer = None
+
+
+    def unregister_callback(self):
+        if self.gc_callback in gc.callbacks:
+            gc.callbacks.remove(self.gc_callback)
+
+
+    def gc_callback(self, phase, info):
+        # called by the interpreter on the thread which triggered the
+        # collection; no locks are taken here, the thread may hold one
+        # needed by the reporting thread
+        try:
+            if phase == 'start':
+                self.collection_start = time.perf_counter()
+                return
+
+            if self.collection_start is None:
+                return
+            pause = (time.perf_counter() - self.collection_start) * 1000
+            self.collection_start = None
+
+            generation = info['generation']
+            self.pause_rollups[generation].add(pause)
+
+            if pause >= self.pause_threshold and len(self.pause_queue) < self.MAX_QUEUED_PAUSES:
+                self.pause_queue.append((pause, self.extract_stack(sys._getframe(1))))
+        except Exception:
+            self.agent.log('GC callback exception')
+
+
+    def extract_stack(self, frame):
+        stack = []
+
+        while frame is not None and len(stack) < self.MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, frame.f_lineno))
+            frame = frame.f_back
+
+        return stack
+
+
+    def process(self):
+        while True:
+            try:
+                pause, stack = self.pause_queue.popleft()
+                self.update_profile(pause, stack)
+            except IndexError:
+                return
+
+
+    def update_profile(self, pause, stack):
+        frames = []
+        for func_name, filename, lineno in stack:
+            if self.agent.frame_cache.is_agent_frame(filename):
+                return
+
+            if not self.agent.frame_cache.is_system_frame(filename):
+                frames.append(Frame(func_name, filename, lineno))
+
+        if not frames:
+            return
+
+        with self.profile_lock:
+            current_node = self.profile
+            for frame in reversed(frames):
+                current_node = current_node.find_or_add_child(str(frame))
+                current_node.set_type(Breakdown.TYPE_CALLSITE)
+
+            current_node.increment(pause, 1)
+
+
+    def report(self):
+        self.process()
+
+        for generation, rollup in enumerate(self.pause_rollups):
+            if rollup.count() == 0:
+                continue
+
+            # total pause time of the interval, the distribution is in the rollup
+            metric = Metric(self.agent, Metric.TYPE_STATE, Metric.CATEGORY_GC, self.PAUSE_TIME_METRICS[generation], Metric.UNIT_MILLISECOND)
+            metric.create_measurement(Metric.TRIGGER_TIMER, sum(rollup.samples), 60, None, rollup)
+            self.agent.message_queue.add('metric', metric.to_dict())
+            self.agent.profile_history.record_metric(metric)
+
+        with self.profile_lock:
+            self.profile.propagate()
+
+            metric = Metric(self.agent, Metric.TYPE_PROFILE, Metric.CATEGORY_GC_PROFILE, Metric.NAME_GC_PAUSES, Metric.UNIT_MILLISECOND)
+            metric.create_measurement(Metric.TRIGGER_TIMER, self.profile.measurement, 60, self.profile)
+            self.agent.message_queue.add('metric', metric.to_dict())
+            self.agent.profile_history.record_profile(metric, self.profile, self.profile_start_ts, 60)
+
+        self.reset()
@@ -0,0 +1,202 @@
+from __future__ import division
+
+import sys
+import gc
+import time
+
+from ..runtime import min_version, perf_counter_ns
+from ..utils import timestamp
+from ..metric import Metric
+from ..metric import Breakdown
+
+
+def type_name(typ):
+    module = getattr(typ, '__module__', None)
+    name = getattr(typ, '__qualname__', None) or typ.__name__
+
+    if not module or module in ('builtins', '__builtin__'):
+        return name
+
+    return '{0}.{1}'.format(module, name)
+
+
+class HeapReporter(object):
+    '''Counts the live GC-tracked objects by type every heap_profiler_interval
+    seconds and reports the types whose object counts grew the most since
+    the previous scan. With heap_profiler_sizes, shallow object sizes from
+    sys.getsizeof are summed too. Unlike the allocation profiler, no
+    tracemalloc traces are kept.
+
+    The scan is done in slices of at most MAX_SLICE_TIME seconds, between
+    which the GIL is released for SLICE_PAUSE seconds. Listing the objects
+    with gc.get_objects is not sliced; in Python 3.8+ the objects are
+    listed one generation at a time, in older versions all at once.'''
+
+    DEFAULT_INTERVAL = 60
+    SLICE_SIZE = 1000
+    MAX_SLICE_TIME = 0.01
+    SLICE_PAUSE = 0.01
+    MAX_REPORTED_TYPES = 25
+
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.started = False
+        self.report_timer = None
+        self.last_counts = None
+        self.last_sizes = None
+        self.last_scan_ts = None
+
+
+    def setup(self):
+        pass
+
+
+    def destroy(self):
+        pass
+
+
+    def after_fork(self):
+        was_started = self.started
+
+        self.started = False
+        self.report_timer = None
+
+        if was_started:
+            self.start()
+
+
+    def reset(self):
+        self.last_counts = None
+        self.last_sizes = None
+        self.last_scan_ts = None
+
+
+    def start(self):
+        if not self.agent.get_option('heap_profiler'):
+            return
+
+        if not self.agent.get_option('auto_profiling'):
+            return
+
+        if self.started:
+            return
+        self.started = True
+
+        self.reset()
+
+        interval = self.agent.get_option('heap_profiler_interval', self.DEFAULT_INTERVAL)
+        self.report_timer = self.agent.schedule(interval, interval, self.report)
+
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+
+        self.report_timer.cancel()
+        self.report_timer = None
+
+
+    def scan(self, with_sizes=False):
+        '''Returns the object counts, and sizes if requested, of the live
+        GC-tracked objects as maps of type names, or None if the reporter
+        was stopped during the scan.'''
+
+        type_counts = dict()
+        type_sizes = dict()
+        scan_time = 0
+
+        # oldest generation first, objects are only moved to older
+        # generations, so none is counted twice
+        if min_version(3, 8):
+            generations = [2, 1, 0]
+        else:
+            generations = [None]
+
+        slice_start = perf_counter_ns()
+        for generation in generations:
+            if generation is None:
+                objects = gc.get_objects()
+            else:
+                objects = gc.get_objects(generation)
+
+            # the list is consumed from the end, so references to scanned
+            # objects are released as the scan progresses
+            while objects:
+                for obj in objects[-self.SLICE_SIZE:]:
+                    typ = type(obj)
+                    type_counts[typ] = type_counts.get(typ, 0) + 1
+                    if with_sizes:
+                        type_sizes[typ] = type_sizes.get(typ, 0) + sys.getsizeof(obj, 0)
+                del objects[-self.SLICE_SIZE:]
+
+                slice_time = perf_counter_ns() - slice_start
+                if slice_time >= self.MAX_SLICE_TIME * 1e9:
+                    scan_time += slice_time
+                    time.sleep(self.SLICE_PAUSE)
+                    if not self.started:
+                        return None
+                    slice_start = perf_counter_ns()
+
+        scan_time += perf_counter_ns() - slice_start
+        self.agent.overhead_reporter.record(Metric.NAME_AGENT_PROFILE_BUILD_TIME, 'Heap profiler', scan_time / 1e6)
+
+        counts = dict()
+        sizes = dict()
+        for typ, count in type_counts.items():
+            name = type_name(typ)
+            counts[name] = counts.get(name, 0) + count
+            if with_sizes:
+                sizes[name] = sizes.get(name, 0) + type_sizes[typ]
+
+        return counts, sizes
+
+
+    def report(self):
+        with_sizes = self.agent.get_option('heap_profiler_sizes')
+
+        result = self.scan(with_sizes)
+        if result is None:
+            return
+        counts, sizes = result
+        now = timestamp()
+
+        metric = Metric(self.agent, Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_HEAP_OBJECTS, Metric.UNIT_NONE)
+        metric.create_measurement(Metric.TRIGGER_TIMER, sum(counts.values()))
+        self.agent.message_queue.add('metric', metric.to_dict())
+        self.agent.profile_history.record_metric(metric)
+
+        last_counts = self.last_counts
+        last_sizes = self.last_sizes
+        last_scan_ts = self.last_scan_ts
+        self.last_counts = counts
+        self.last_sizes = sizes
+        self.last_scan_ts = now
+
+        if last_counts is None:
+            return
+
+        growth = []
+        for name, count in counts.items():
+            count_growth = count - last_counts.get(name, 0)
+            if count_growth > 0:
+                growth.append((count_growth, name))
+        growth.sort(reverse=True)
+
+        profile = Breakdown('Heap object growth')
+        for count_growth, name in growth[:self.MAX_REPORTED_TYPES]:
+            type_node = profile.find_or_add_child(name)
+            type_node.increment(count_growth, 0)
+            type_node.add_metadata('objects', counts[name])
+            if with_sizes:
+                type_node.add_metadata('bytes', sizes[name])
+                type_node.add_metadata('bytes_growth', sizes[name] - last_sizes.get(name, 0))
+
+        profile.propagate()
+
+        duration = now - last_scan_ts
+        metric = Metric(self.agent, Metric.TYPE_PROFILE, Metric.CATEGORY_HEAP_PROFILE, Metric.NAME_HEAP_GROWTH, Metric.UNIT_NONE)
+        metric.create_measurement(Metric.TRIGGER_TIMER, profile.measurement, duration, profile)
+        self.agent.message_queue.add('metric', metric.to_dict())
+        self.agent.profile_history.record_profile(metric, profile, last_scan_ts, duration)
@@ -0,0 +1,145 @@
+from __future__ import division
+
+from ..runtime import perf_counter_ns
+from ..metric import Metric
+from ..metric import Breakdown
+
+
+class OverheadReporter(object):
+    AGGREGATE_SUM = 'sum'
+    AGGREGATE_MAX = 'max'
+    AGGREGATE_AVG = 'avg'
+
+    METRICS = {
+        Metric.NAME_AGENT_SAMPLING_TIME: (Metric.UNIT_MILLISECOND, AGGREGATE_SUM),
+        Metric.NAME_AGENT_DROPPED_SAMPLES: (Metric.UNIT_NONE, AGGREGATE_SUM),
+        Metric.NAME_AGENT_PROFILE_BUILD_TIME: (Metric.UNIT_MILLISECOND, AGGREGATE_SUM),
+        Metric.NAME_AGENT_PROFILE_NODES: (Metric.UNIT_NONE, AGGREGATE_MAX),
+        Metric.NAME_AGENT_ENCODING_TIME: (Metric.UNIT_MILLISECOND, AGGREGATE_SUM),
+        Metric.NAME_AGENT_UPLOAD_LATENCY: (Metric.UNIT_MILLISECOND, AGGREGATE_AVG),
+        Metric.NAME_AGENT_UPLOAD_SIZE: (Metric.UNIT_BYTE, AGGREGATE_SUM),
+        Metric.NAME_AGENT_QUEUED_MESSAGES: (Metric.UNIT_NONE, AGGREGATE_MAX),
+    }
+
+    # metrics spent on the CPU of the application process
+    CPU_TIME_METRICS = set([
+        Metric.NAME_AGENT_SAMPLING_TIME,
+        Metric.NAME_AGENT_PROFILE_BUILD_TIME,
+        Metric.NAME_AGENT_ENCODING_TIME,
+    ])
+
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.started = False
+        self.report_timer = None
+        self.stats = dict()
+        self.cpu_time = 0
+
+
+    def setup(self):
+        pass
+
+
+    def destroy(self):
+        pass
+
+
+    def reset(self):
+        self.stats = dict()
+
+
+    def start(self):
+        if not self.agent.get_option('overhead_metrics'):
+            return
+
+        if not self.agent.get_option('auto_profiling'):
+            return
+
+        if self.started:
+            return
+        self.started = True
+
+        self.reset()
+
+        self.report_timer = self.agent.schedule(60, 60, self.report)
+
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+
+        self.report_timer.cancel()
+        self.report_timer = None
+
+
+    def after_fork(self):
+        was_started = self.started
+
+        self.started = False
+        self.report_timer = None
+        self.reset()
+
+        if was_started:
+            self.start()
+
+
+    def record(self, name, stage, value):
+        # called from signal handlers, so no locks are used; a concurrent
+        # report may lose a value, which is acceptable for these statistics
+        if name in self.CPU_TIME_METRICS:
+            # milliseconds since agent start, not reset on report
+            self.cpu_time += value
+
+        stages = self.stats.get(name)
+        if stages is None:
+            stages = dict()
+            self.stats[name] = stages
+
+        stat = stages.get(stage)
+        if stat is None:
+            stages[stage] = [value, 1, value]
+        else:
+            stat[0] += value
+            stat[1] += 1
+            if value > stat[2]:
+                stat[2] = value
+
+
+    def record_time(self, name, stage, start_ns):
+        self.record(name, stage, (perf_counter_ns() - start_ns) / 1e6)
+
+
+    def report(self):
+        self.record(Metric.NAME_AGENT_QUEUED_MESSAGES, 'Message queue', len(self.agent.message_queue.queue))
+
+        stats = self.stats
+        self.stats = dict()
+
+        for name, stages in stats.items():
+            unit, aggregate = self.METRICS[name]
+
+            root = Breakdown(name)
+            total = 0
+            count = 0
+            for stage, stat in stages.items():
+                node = root.find_or_add_child(stage)
+                if aggregate == self.AGGREGATE_MAX:
+                    node.measurement = stat[2]
+                    root.measurement = max(root.measurement, stat[2])
+                elif aggregate == self.AGGREGATE_AVG:
+                    node.measurement = stat[0] / stat[1]
+                    total += stat[0]
+                    count += stat[1]
+                else:
+                    node.measurement = stat[0]
+                    root.measurement += stat[0]
+                node.num_samples = stat[1]
+
+            if aggregate == self.AGGREGATE_AVG and count > 0:
+                root.measurement = total / count
+
+            metric = Metric(self.agent, Metric.TYPE_STATE, Metric.CATEGORY_AGENT, name, unit)
+            metric.create_measurement(Metric.TRIGGER_TIMER, root.measurement, 60, root)
+            self.agent.message_queue.add('metric', metric.to_dict())
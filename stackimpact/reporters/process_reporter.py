@@ -3,24 +3,87 @@ from __future__ import division
 import re
 import os
 import gc
+import time
 import threading
 import multiprocessing
 
 
-from ..runtime import runtime_info, min_version, read_cpu_time, read_max_rss, read_current_rss, read_vm_size
-from ..metric import Metric
+from ..runtime import runtime_info, min_version, read_cpu_time, read_max_rss
+from ..metric import Metric, Breakdown, Rollup
+from ..procfs import read_stat, read_process, read_thread_stats
+from ..cgroup import detect as detect_cgroup
+
+
+THREAD_NAME_SUFFIX_REGEXP = re.compile(r'[-_.]?\d+$')
+THREAD_TARGET_REGEXP = re.compile(r' \(.*\)$')
+
+
+def thread_pool_name(name):
+    '''Returns the name of a thread without numeric suffixes, e.g.
+    ThreadPoolExecutor-0_3 becomes ThreadPoolExecutor and Thread-5 (run)
+    becomes Thread, so that threads of a pool are grouped together.'''
+
+    name = THREAD_TARGET_REGEXP.sub('', name)
+    while True:
+        stripped = THREAD_NAME_SUFFIX_REGEXP.sub('', name)
+        if stripped == name or not stripped:
+            return name
+        name = stripped
+
 
 class ProcessReporter(object):
 
+    PROC_METRICS = [
+        (Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_CURRENT_RSS, Metric.UNIT_KILOBYTE, 'current_rss'),
+        (Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_VM_SIZE, Metric.UNIT_KILOBYTE, 'vm_size'),
+        (Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_ANON_RSS, Metric.UNIT_KILOBYTE, 'anon_rss'),
+        (Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_FILE_RSS, Metric.UNIT_KILOBYTE, 'file_rss'),
+        (Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_SHMEM_RSS, Metric.UNIT_KILOBYTE, 'shmem_rss'),
+        (Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_PSS, Metric.UNIT_KILOBYTE, 'pss'),
+        (Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_SWAP, Metric.UNIT_KILOBYTE, 'swap'),
+        (Metric.TYPE_COUNTER, Metric.CATEGORY_CPU, Metric.NAME_VOLUNTARY_CTX_SWITCHES, Metric.UNIT_NONE, 'voluntary_ctxt_switches'),
+        (Metric.TYPE_COUNTER, Metric.CATEGORY_CPU, Metric.NAME_INVOLUNTARY_CTX_SWITCHES, Metric.UNIT_NONE, 'involuntary_ctxt_switches'),
+        (Metric.TYPE_COUNTER, Metric.CATEGORY_IO, Metric.NAME_BYTES_READ, Metric.UNIT_BYTE, 'read_chars'),
+        (Metric.TYPE_COUNTER, Metric.CATEGORY_IO, Metric.NAME_BYTES_WRITTEN, Metric.UNIT_BYTE, 'write_chars'),
+        (Metric.TYPE_COUNTER, Metric.CATEGORY_IO, Metric.NAME_STORAGE_BYTES_READ, Metric.UNIT_BYTE, 'read_bytes'),
+        (Metric.TYPE_COUNTER, Metric.CATEGORY_IO, Metric.NAME_STORAGE_BYTES_WRITTEN, Metric.UNIT_BYTE, 'write_bytes'),
+        (Metric.TYPE_COUNTER, Metric.CATEGORY_IO, Metric.NAME_READ_SYSCALLS, Metric.UNIT_NONE, 'read_syscalls'),
+        (Metric.TYPE_COUNTER, Metric.CATEGORY_IO, Metric.NAME_WRITE_SYSCALLS, Metric.UNIT_NONE, 'write_syscalls'),
+        (Metric.TYPE_STATE, Metric.CATEGORY_RUNTIME, Metric.NAME_OPEN_FDS, Metric.UNIT_NONE, 'open_fds')
+    ]
+
     def __init__(self, agent):
         self.agent = agent
         self.started = False
         self.metrics = None
         self.report_timer = None
+        self.sample_timer = None
+        self.rollups = None
+        self.last_sample = None
+        self.cgroup = None
+        self.cpu_quota = None
+        self.thread_cpu_times = None
+        self.thread_cpu_ts = None
 
 
     def setup(self):
-        pass
+        if runtime_info.OS_LINUX:
+            self.cgroup = detect_cgroup()
+            if self.cgroup:
+                self.cpu_quota = self.cgroup.cpu_quota()
+
+
+    def available_cpus(self):
+        '''Returns the CPU quota of the cgroup, e.g. of a container, if
+        limited, otherwise the number of CPUs.'''
+
+        if self.cpu_quota:
+            return self.cpu_quota
+
+        try:
+            return multiprocessing.cpu_count()
+        except Exception:
+            return 1
 
 
     def destroy(self):
@@ -31,6 +94,20 @@ class ProcessReporter(object):
         pass
 
 
+    def after_fork(self):
+        # counters of the parent process are not valid in the child
+        was_started = self.started
+
+        self.started = False
+        self.report_timer = None
+        self.sample_timer = None
+        self.last_sample = None
+        self.thread_cpu_times = None
+
+        if was_started:
+            self.start()
+
+
     def start(self):
         if not self.agent.get_option('auto_profiling'):
             return
@@ -43,6 +120,10 @@ class ProcessReporter(object):
 
         self.report_timer = self.agent.schedule(60, 60, self.report)
 
+        sampling_interval = self.agent.get_option('process_sampling_interval')
+        if sampling_interval:
+            self.sample_timer = self.agent.schedule(sampling_interval, sampling_interval, self.sample)
+
 
     def stop(self):
         if not self.started:
@@ -52,12 +133,59 @@ class ProcessReporter(object):
         self.report_timer.cancel()
         self.report_timer = None
 
+        if self.sample_timer:
+            self.sample_timer.cancel()
+            self.sample_timer = None
+
 
     def reset(self):
         self.metrics = {}
+        self.thread_cpu_times = None
+        self.reset_rollups()
+
+
+    def reset_rollups(self):
+        self.rollups = {
+            Metric.NAME_CPU_USAGE: Rollup(),
+            Metric.NAME_CURRENT_RSS: Rollup(),
+            Metric.NAME_VM_SIZE: Rollup(),
+            Metric.NAME_THREAD_COUNT: Rollup()
+        }
+
+
+    def sample(self):
+        # a single read of /proc/self/stat per sample on Linux
+        now = time.time()
+        stat = read_stat() if runtime_info.OS_LINUX else None
+
+        if stat:
+            cpu_time = stat['cpu_time']
+        elif not runtime_info.OS_WIN:
+            cpu_time = read_cpu_time()
+        else:
+            cpu_time = None
+
+        rollups = self.rollups
+
+        if cpu_time is not None:
+            if self.last_sample and now > self.last_sample[0]:
+                cpu_usage = (cpu_time - self.last_sample[1]) / ((now - self.last_sample[0]) * 1e9) * 100
+                cpu_usage = cpu_usage / self.available_cpus()
+                rollups[Metric.NAME_CPU_USAGE].add(cpu_usage)
+            self.last_sample = (now, cpu_time)
+
+        if stat:
+            rollups[Metric.NAME_CURRENT_RSS].add(stat['rss'])
+            rollups[Metric.NAME_VM_SIZE].add(stat['vm_size'])
+
+        rollups[Metric.NAME_THREAD_COUNT].add(threading.active_count())
 
 
     def report(self):
+        # cgroup, e.g. of a container; the CPU quota is needed for CPU usage
+        if self.cgroup:
+            self.report_cgroup()
+
         # CPU
         if not runtime_info.OS_WIN:
             cpu_time = read_cpu_time()
@@ -65,10 +193,7 @@ class ProcessReporter(object):
                 cpu_time_metric = self.report_metric(Metric.TYPE_COUNTER, Metric.CATEGORY_CPU, Metric.NAME_CPU_TIME, Metric.UNIT_NANOSECOND, cpu_time)
                 if cpu_time_metric.has_measurement():
                     cpu_usage = (cpu_time_metric.measurement.value / (60 * 1e9)) * 100
-                    try:
-                        cpu_usage = cpu_usage / multiprocessing.cpu_count()
-                    except Exception:
-                        pass
+                    cpu_usage = cpu_usage / self.available_cpus()
 
                     self.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_CPU, Metric.NAME_CPU_USAGE, Metric.UNIT_PERCENT, cpu_usage)
 
@@ -80,13 +205,14 @@ class ProcessReporter(object):
                 self.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_MAX_RSS, Metric.UNIT_KILOBYTE, max_rss)
 
         if runtime_info.OS_LINUX:
-            current_rss = read_current_rss()
-            if current_rss != None:
-                self.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_CURRENT_RSS, Metric.UNIT_KILOBYTE, current_rss)
+            # one read of each /proc/self file
+            process = read_process()
+
+            for typ, category, name, unit, key in self.PROC_METRICS:
+                if key in process:
+                    self.report_metric(typ, category, name, unit, process[key])
 
-            vm_size = read_vm_size()
-            if vm_size != None:
-                self.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_VM_SIZE, Metric.UNIT_KILOBYTE, vm_size)
+            self.report_thread_cpu()
 
 
         # GC stats
@@ -110,6 +236,77 @@ class ProcessReporter(object):
         thread_count = threading.active_count()
         self.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_RUNTIME, Metric.NAME_THREAD_COUNT, Metric.UNIT_NONE, thread_count)
 
+        self.reset_rollups()
+
+
+    def report_cgroup(self):
+        self.cpu_quota = self.cgroup.cpu_quota()
+        if self.cpu_quota:
+            self.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_CPU, Metric.NAME_CPU_QUOTA, Metric.UNIT_NONE, self.cpu_quota)
+
+        throttling = self.cgroup.cpu_throttling()
+        if throttling:
+            self.report_metric(Metric.TYPE_COUNTER, Metric.CATEGORY_CPU, Metric.NAME_THROTTLED_PERIODS, Metric.UNIT_NONE, throttling['throttled_periods'])
+            self.report_metric(Metric.TYPE_COUNTER, Metric.CATEGORY_CPU, Metric.NAME_THROTTLED_TIME, Metric.UNIT_NANOSECOND, throttling['throttled_time'])
+
+        memory_current = self.cgroup.memory_current()
+        if memory_current is not None:
+            self.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_CGROUP_MEMORY_USAGE, Metric.UNIT_KILOBYTE, memory_current // 1024)
+
+        memory_max = self.cgroup.memory_max()
+        if memory_max is not None:
+            self.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_CGROUP_MEMORY_LIMIT, Metric.UNIT_KILOBYTE, memory_max // 1024)
+
+        # share of the last 60 seconds some tasks were stalled
+        for resource, category, name in [('cpu', Metric.CATEGORY_CPU, Metric.NAME_CPU_PRESSURE), ('memory', Metric.CATEGORY_MEMORY, Metric.NAME_MEMORY_PRESSURE)]:
+            pressure = self.cgroup.pressure(resource)
+            if pressure and 'avg60' in pressure.get('some', {}):
+                self.report_metric(Metric.TYPE_STATE, category, name, Metric.UNIT_PERCENT, pressure['some']['avg60'])
+
+
+    def report_thread_cpu(self):
+        stats = read_thread_stats()
+        if stats is None:
+            return
+        now = time.time()
+
+        last_times = self.thread_cpu_times
+        last_ts = self.thread_cpu_ts
+        self.thread_cpu_times = dict((tid, stat['cpu_time']) for tid, stat in stats.items())
+        self.thread_cpu_ts = now
+
+        if last_times is None or now <= last_ts:
+            return
+
+        # native thread ids are available in Python 3.8+, other threads are
+        # named after the kernel thread name
+        names = dict()
+        for thread in threading.enumerate():
+            native_id = getattr(thread, 'native_id', None)
+            if native_id:
+                names[native_id] = thread.name
+
+        breakdown = Breakdown('Thread CPU usage')
+        elapsed = (now - last_ts) * 1e9
+        for tid, stat in stats.items():
+            # threads started since the last report used all their CPU time in the interval
+            cpu_usage = (stat['cpu_time'] - last_times.get(tid, 0)) / elapsed * 100
+            if cpu_usage <= 0:
+                continue
+
+            name = names.get(tid, stat['name'])
+            pool_node = breakdown.find_or_add_child(thread_pool_name(name))
+            thread_node = pool_node.find_or_add_child('{0} ({1})'.format(name, tid))
+            thread_node.increment(cpu_usage, 1)
+
+        breakdown.propagate()
+
+        # percent of one CPU
+        metric = Metric(self.agent, Metric.TYPE_STATE, Metric.CATEGORY_CPU, Metric.NAME_THREAD_CPU_USAGE, Metric.UNIT_PERCENT)
+        metric.create_measurement(Metric.TRIGGER_TIMER, breakdown.measurement, None, breakdown)
+        self.agent.message_queue.add('metric', metric.to_dict())
+        self.agent.profile_history.record_metric(metric)
+
 
     def report_metric(self, typ, category, name, unit, value):
         key = typ + category + name
@@ -120,10 +317,16 @@ class ProcessReporter(object):
         else:
             metric = self.metrics[key]
 
-        metric.create_measurement(Metric.TRIGGER_TIMER, value)
+        # samples taken between reports, if enabled
+        rollup = self.rollups.get(name) if typ == Metric.TYPE_STATE else None
+        if rollup is not None and rollup.count() == 0:
+            rollup = None
+
+        metric.create_measurement(Metric.TRIGGER_TIMER, value, None, None, rollup)
 
         if metric.has_measurement():
             self.agent.message_queue.add('metric', metric.to_dict())
+            self.agent.profile_history.record_metric(metric)
 
         return metric
 
@@ -7,11 +7,12 @@ import threading
 import re
 import random
 
-from ..runtime import min_version, runtime_info
+from ..runtime import min_version, runtime_info, perf_counter_ns
 from ..utils import timestamp
 from ..metric import Metric
 from ..metric import Breakdown
 from ..frame import Frame
+from ..profile_delta import copy_node, compute_delta, apply_delta
 
 
 class ProfilerConfig(object):
@@ -27,7 +28,10 @@ class ProfilerConfig(object):
 
 
 class ProfileReporter:
-  
+    DELTA_THRESHOLD = 0.05
+    DELTA_KEYFRAME_INTERVAL = 10
+
+
     def __init__(self, agent, profiler, config):
         self.agent = agent
         self.profiler = profiler
@@ -43,6 +47,8 @@ class ProfileReporter:
         self.span_active = False
         self.span_start_ts = None
         self.span_trigger = None
+        self.delta_bases = dict()
+        self.delta_counts = dict()
 
 
     def setup(self):
@@ -89,12 +95,33 @@ class ProfileReporter:
             self.report_timer = None
 
         self.stop_profiling()
+        self.profiler.stop()
 
 
     def destroy(self):
         self.profiler.destroy()
 
 
+    def after_fork(self):
+        # timers do not exist in the child process and the profile of
+        # the parent process should not be reported again
+        was_started = self.started
+
+        self.started = False
+        self.span_timer = None
+        self.span_timeout = None
+        self.random_timer = None
+        self.report_timer = None
+        self.span_active = False
+        self.delta_bases = dict()
+        self.delta_counts = dict()
+
+        self.profiler.after_fork()
+
+        if was_started:
+            self.start()
+
+
     def reset(self):
         self.profiler.reset()
         self.profile_start_ts = timestamp()
@@ -119,6 +146,10 @@ class ProfileReporter:
             self.agent.log(self.config.log_prefix + ': profiler lock exists.')
             return False
 
+        if self.agent.overhead_governor.should_skip():
+            self.agent.log(self.config.log_prefix + ': skipped by overhead governor.')
+            return False
+
         self.agent.profiler_active = True
         self.agent.log(self.config.log_prefix + ': started.')
 
@@ -130,7 +161,8 @@ class ProfileReporter:
             return False
 
         if with_timeout:
-            self.span_timeout = self.agent.delay(self.config.max_span_duration, self.stop_profiling)
+            span_duration = self.agent.overhead_governor.span_duration(self.config.max_span_duration)
+            self.span_timeout = self.agent.delay(span_duration, self.stop_profiling)
 
         self.span_count = self.span_count + 1
         self.span_active = True
@@ -161,6 +193,64 @@ class ProfileReporter:
         self.agent.log(self.config.log_prefix + ': stopped.')
 
 
+    def capture(self, duration):
+        '''Records a profile for duration seconds outside of the profiling
+        schedule and returns the profile data. The profile of the current
+        reporting window is reported first. Blocks the calling thread.'''
+
+        if not self.started:
+            return None
+
+        if self.agent.profiler_active:
+            self.agent.log(self.config.log_prefix + ': profiler lock exists.')
+            return None
+
+        self.report()
+        self.reset()
+
+        self.agent.profiler_active = True
+        self.agent.log(self.config.log_prefix + ': capture started.')
+
+        span_start_ts = time.time()
+        try:
+            self.profiler.start_profiler()
+            try:
+                time.sleep(duration)
+            finally:
+                self.profiler.stop_profiler()
+
+            profile_data = self.profiler.build_profile(time.time() - span_start_ts)
+        finally:
+            self.agent.profiler_active = False
+            self.reset()
+
+        self.agent.log(self.config.log_prefix + ': capture stopped.')
+
+        return profile_data
+
+
+    def capture_report(self, duration, reason):
+        '''Captures a profile and reports it, e.g. when a profile trigger
+        fires. The reason is added to the profile metadata.'''
+
+        start_ts = timestamp()
+        profile_data = self.capture(duration)
+        if not profile_data:
+            return False
+
+        for data in profile_data:
+            self.prune_profile(data['profile'])
+            data['profile'].add_metadata('capture_reason', reason)
+
+            metric = Metric(self.agent, Metric.TYPE_PROFILE, data['category'], data['name'], data['unit'])
+            metric.create_measurement(Metric.TRIGGER_API, data['profile'].measurement, data['unit_interval'], data['profile'])
+            self.agent.message_queue.add('metric', metric.to_dict())
+
+            self.agent.profile_history.record_profile(metric, data['profile'], start_ts, duration)
+
+        return True
+
+
     def report(self, with_interval=False):
         if not self.started:
           return
@@ -177,11 +267,69 @@ class ProfileReporter:
 
         self.agent.log(self.config.log_prefix + ': reporting profile.')
 
+        start = perf_counter_ns()
         profile_data = self.profiler.build_profile(self.profile_duration)
+        self.agent.overhead_reporter.record_time(Metric.NAME_AGENT_PROFILE_BUILD_TIME, self.config.log_prefix, start)
 
         for data in profile_data:
+          self.prune_profile(data['profile'])
+          self.agent.overhead_reporter.record(Metric.NAME_AGENT_PROFILE_NODES, self.config.log_prefix, data['profile'].count_nodes())
+
           metric = Metric(self.agent, Metric.TYPE_PROFILE, data['category'], data['name'], data['unit'])
-          metric.create_measurement(self.span_trigger, data['profile'].measurement, data['unit_interval'], data['profile'])
-          self.agent.message_queue.add('metric', metric.to_dict())
+          sink = self.agent.message_queue.sink
+          if self.agent.get_option('delta_profiles') and getattr(sink, 'STATEFUL', False):
+            self.report_delta(metric, data)
+          else:
+            metric.create_measurement(self.span_trigger, data['profile'].measurement, data['unit_interval'], data['profile'])
+            self.agent.message_queue.add('metric', metric.to_dict())
+
+          self.agent.profile_history.record_profile(metric, data['profile'], self.profile_start_ts, self.profile_duration)
 
         self.reset()
+
+
+    def prune_profile(self, profile):
+        if not self.agent.has_profile_budget():
+            return
+
+        pruned_nodes = profile.prune(self.agent.get_option('max_profile_nodes'), self.agent.get_option('max_profile_bytes'))
+        if pruned_nodes > 0:
+            self.agent.log(self.config.log_prefix + ': pruned {0} nodes.'.format(pruned_nodes))
+
+
+    def report_delta(self, metric, data):
+        name = data['name']
+        profile = data['profile']
+
+        threshold = self.agent.get_option('delta_threshold', self.DELTA_THRESHOLD)
+        keyframe_interval = self.agent.get_option('delta_keyframe_interval', self.DELTA_KEYFRAME_INTERVAL)
+
+        # the base is the last profile acknowledged by the dashboard
+        base = self.delta_bases.get(name)
+        count = self.delta_counts.get(name, 0)
+
+        if base and count < keyframe_interval:
+            base_profile, base_id = base
+
+            breakdown = compute_delta(base_profile, profile, threshold)
+            if not breakdown:
+                breakdown = copy_node(profile)
+
+            # the dashboard reconstructs this profile from the base and the delta
+            reconstructed = apply_delta(base_profile, breakdown)
+            breakdown.add_metadata('delta_base', base_id)
+
+            self.delta_counts[name] = count + 1
+        else:
+            breakdown = profile
+            reconstructed = profile
+
+            self.delta_counts[name] = 0
+
+        metric.create_measurement(self.span_trigger, profile.measurement, data['unit_interval'], breakdown)
+        measurement_id = metric.measurement.id
+
+        def ack():
+            self.delta_bases[name] = (reconstructed, measurement_id)
+
+        self.agent.message_queue.add('metric', metric.to_dict(), ack)
@@ -31,6 +31,17 @@ class SpanReporter(object):
         pass
 
 
+    def after_fork(self):
+        was_started = self.started
+
+        self.started = False
+        self.report_timer = None
+        self.span_lock = threading.Lock()
+
+        if was_started:
+            self.start()
+
+
     def reset(self):
         self.span_counters = dict()
 
@@ -58,6 +69,8 @@ class SpanReporter(object):
     
 
     def record_span(self, name, duration):
+        self.agent.anomaly_triggers.record_span(name, duration)
+
         if not self.started:
             return
 
@@ -74,6 +87,15 @@ class SpanReporter(object):
 
     def report(self):
         for name, counter in self.span_counters.items():
+            # the aggregator evaluates p95 from the samples of all processes
+            if self.agent.get_option('aggregator_socket'):
+                self.agent.message_queue.add('span', {
+                    'name': counter.name,
+                    'samples': counter.reservoir,
+                    'count': counter.num_samples
+                })
+                continue
+
             counter.evaluate_p95();
 
             metric = Metric(self.agent, Metric.TYPE_STATE, Metric.CATEGORY_SPAN, counter.name, Metric.UNIT_MILLISECOND)
@@ -27,6 +27,16 @@ except ImportError:
     pass
 
 
+if hasattr(time, 'perf_counter_ns'):
+    perf_counter_ns = time.perf_counter_ns
+elif hasattr(time, 'perf_counter'):
+    def perf_counter_ns():
+        return int(time.perf_counter() * 1e9)
+else:
+    def perf_counter_ns():
+        return int(time.time() * 1e9)
+
+
 VM_RSS_REGEXP = re.compile('VmRSS:\s+(\d+)\s+kB')
 VM_SIZE_REGEXP = re.compile('VmSize:\s+(\d+)\s+kB')
 
@@ -0,0 +1,262 @@
+from __future__ import division
+
+import time
+import struct
+import threading
+import itertools
+import collections
+
+from .frame import Frame
+
+
+MAGIC = b'SIREC\x01'
+
+RECORD_FRAME = 1
+RECORD_SAMPLE = 2
+RECORD_SPAN = 3
+
+PROFILER_CPU = 1
+PROFILER_BLOCK = 2
+
+
+def write_varint(buf, value):
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def read_varint(buf, pos):
+    value = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return value, pos
+        shift += 7
+
+
+def write_string(buf, s):
+    data = s.encode('utf-8')
+    write_varint(buf, len(data))
+    buf.extend(data)
+
+
+def read_string(buf, pos):
+    length, pos = read_varint(buf, pos)
+    return bytes(buf[pos:pos + length]).decode('utf-8'), pos + length
+
+
+class SampleRecorder(object):
+    '''Writes the raw samples of the CPU and block profilers to a file.
+    Frames are interned and written once as (id, filename, function, line)
+    records; a sample record holds the profiler, the time since the previous
+    sample, the thread id, the sample weight in microseconds and the frame
+    ids of the stack, leaf first. All integers are varints.'''
+
+    BUFFER_SIZE = 64 * 1024
+
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        # complete records waiting to be written; appends and pops of a
+        # deque are atomic, so a flush never splits a record
+        self.records = collections.deque()
+        self.buffered_bytes = 0
+        self.write_lock = threading.Lock()
+        self.frame_ids = dict()
+        self.next_frame_id = itertools.count()
+        self.last_ts = None
+
+
+    def open(self):
+        self.file = open(self.path, 'wb')
+        self.last_ts = time.time()
+        self.file.write(MAGIC + struct.pack('<d', self.last_ts))
+
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+    def record_sample(self, profiler, thread_id, weight, stack):
+        record = bytearray()
+
+        frame_ids = []
+        new_frames = []
+        for frame in stack:
+            key = (frame.filename, frame.func_name, frame.lineno)
+            frame_id = self.frame_ids.get(key)
+            if frame_id is None:
+                # a sample may be recorded from a signal handler while
+                # another one is being recorded, so ids come from a counter
+                frame_id = next(self.next_frame_id)
+                new_frames.append((key, frame_id))
+
+                record.append(RECORD_FRAME)
+                write_varint(record, frame_id)
+                write_string(record, frame.filename)
+                write_string(record, frame.func_name)
+                write_varint(record, frame.lineno or 0)
+            frame_ids.append(frame_id)
+
+        ts = time.time()
+
+        record.append(RECORD_SAMPLE)
+        record.append(profiler)
+        write_varint(record, max(int((ts - self.last_ts) * 1e6), 0))
+        write_varint(record, thread_id)
+        write_varint(record, int(weight * 1e6))
+        write_varint(record, len(frame_ids))
+        for frame_id in frame_ids:
+            write_varint(record, frame_id)
+
+        self.last_ts = ts
+
+        self.add_record(record)
+
+        # frames are only referenced by later samples once their records are buffered
+        for key, frame_id in new_frames:
+            self.frame_ids[key] = frame_id
+
+        if self.buffered_bytes >= self.BUFFER_SIZE:
+            # called from signal handlers, which must not wait for the lock
+            self.flush(False)
+
+
+    def record_span(self, profiler, duration):
+        record = bytearray()
+        record.append(RECORD_SPAN)
+        record.append(profiler)
+        write_varint(record, int(duration * 1e6))
+
+        self.add_record(record)
+
+
+    def add_record(self, record):
+        self.records.append(record)
+        self.buffered_bytes += len(record)
+
+
+    def flush(self, blocking=True):
+        if not self.write_lock.acquire(blocking):
+            return
+
+        try:
+            records = []
+            while True:
+                try:
+                    records.append(self.records.popleft())
+                except IndexError:
+                    break
+            self.buffered_bytes = 0
+
+            if self.file and records:
+                self.file.write(b''.join(records))
+                self.file.flush()
+        finally:
+            self.write_lock.release()
+
+
+def read_recording(path):
+    '''Yields ('sample', profiler, timestamp, thread_id, weight, stack) and
+    ('span', profiler, duration) tuples. Weights and durations are in
+    seconds, stacks are lists of Frame objects, leaf first.'''
+
+    with open(path, 'rb') as f:
+        buf = bytearray(f.read())
+
+    if bytes(buf[0:len(MAGIC)]) != MAGIC:
+        raise Exception('Invalid sample recording: ' + path)
+
+    pos = len(MAGIC)
+    ts = struct.unpack('<d', bytes(buf[pos:pos + 8]))[0]
+    pos += 8
+
+    frames = dict()
+
+    while pos < len(buf):
+        record_type = buf[pos]
+        pos += 1
+
+        if record_type == RECORD_FRAME:
+            frame_id, pos = read_varint(buf, pos)
+            filename, pos = read_string(buf, pos)
+            func_name, pos = read_string(buf, pos)
+            lineno, pos = read_varint(buf, pos)
+            frames[frame_id] = Frame(func_name, filename, lineno)
+
+        elif record_type == RECORD_SAMPLE:
+            profiler = buf[pos]
+            pos += 1
+            ts_delta, pos = read_varint(buf, pos)
+            thread_id, pos = read_varint(buf, pos)
+            weight, pos = read_varint(buf, pos)
+            stack_len, pos = read_varint(buf, pos)
+            stack = []
+            for i in range(0, stack_len):
+                frame_id, pos = read_varint(buf, pos)
+                stack.append(frames[frame_id])
+
+            ts += ts_delta / 1e6
+            yield ('sample', profiler, ts, thread_id, weight / 1e6, stack)
+
+        elif record_type == RECORD_SPAN:
+            profiler = buf[pos]
+            pos += 1
+            duration, pos = read_varint(buf, pos)
+            yield ('span', profiler, duration / 1e6)
+
+        else:
+            raise Exception('Invalid sample recording record type: {0}'.format(record_type))
+
+
+def replay(agent, path):
+    '''Feeds a recording through the profilers and reports the resulting
+    profiles to the message queue of a started agent, as fast as possible.
+    The agent should be started with auto_profiling disabled. Returns the
+    number of samples and the time spent updating and reporting profiles.'''
+
+    reporters = {
+        PROFILER_CPU: agent.cpu_reporter,
+        PROFILER_BLOCK: agent.block_reporter
+    }
+
+    for reporter in reporters.values():
+        reporter.start()
+        reporter.reset()
+
+    num_samples = 0
+
+    start = time.time()
+    for record in read_recording(path):
+        reporter = reporters[record[1]]
+        profiler = reporter.profiler
+
+        if record[0] == 'span':
+            reporter.profile_duration += record[2]
+        elif record[1] == PROFILER_CPU:
+            profiler.sampling_interval = record[4]
+            profiler.update_profile(profiler.profile, record[5])
+            num_samples += 1
+        else:
+            profiler.update_profile(profiler.profile, record[5], record[4] * 1000)
+            num_samples += 1
+    update_time = time.time() - start
+
+    start = time.time()
+    for reporter in reporters.values():
+        reporter.report()
+        reporter.stop()
+    report_time = time.time() - start
+
+    return {
+        'samples': num_samples,
+        'update_time': update_time,
+        'report_time': report_time
+    }
@@ -0,0 +1,190 @@
+import os
+import time
+import json
+import zlib
+import struct
+import threading
+
+from ..api_request import APIRequest
+from ..metric import Metric
+from ..pprof import write_profile
+
+
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+FORMAT_PPROF = 'pprof'
+
+# local sinks have no dashboard to enable the agent
+LOCAL_CONFIG = {
+    'agent_enabled': 'yes',
+    'profiling_disabled': 'no'
+}
+
+
+def build_records(agent, payload):
+    '''Returns a record for each message of the payload with the fields of
+    a dashboard request, the message topic and content.'''
+
+    body = APIRequest(agent).build_body(None)
+    del body['payload']
+
+    records = []
+    for message in payload['messages']:
+        record = dict(body)
+        record['topic'] = message['topic']
+        record['content'] = message['content']
+        records.append(record)
+
+    return records
+
+
+def encode_record(record, file_format):
+    data = json.dumps(record, separators=(',', ':')).encode('utf-8')
+
+    if file_format == FORMAT_BINARY:
+        data = zlib.compress(data)
+        return struct.pack('>I', len(data)) + data
+    else:
+        return data + b'\n'
+
+
+def read_records(path, file_format=FORMAT_JSON):
+    '''Yields the records of a file written by FileSink.'''
+
+    with open(path, 'rb') as f:
+        if file_format == FORMAT_BINARY:
+            while True:
+                header = f.read(4)
+                if len(header) < 4:
+                    break
+                length = struct.unpack('>I', header)[0]
+                yield json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line.decode('utf-8'))
+
+
+def is_profile(metric_map):
+    if not isinstance(metric_map, dict) or metric_map.get('type') != Metric.TYPE_PROFILE:
+        return False
+
+    measurement_map = metric_map.get('measurement')
+    return bool(measurement_map and measurement_map.get('breakdown'))
+
+
+class FileSink(object):
+    '''Writes messages to a file as JSON lines or, in the binary format, as
+    length-prefixed zlib-compressed JSON records. When the file would exceed
+    max_bytes, it is rotated to path.1, path.2 and so on, keeping
+    backup_count files. The file is synced to disk at most every
+    fsync_interval seconds and on close. A {pid} placeholder in the path is
+    replaced by the process id.
+
+    In the pprof format, each profile is written to a separate gzipped
+    profile.proto file named path.category.timestamp.id.pb.gz and other
+    messages to the path as JSON lines. The oldest profile files are
+    removed when they take more than (backup_count + 1) * max_bytes.'''
+
+    STATEFUL = False
+    MAX_BYTES = 10 * 1024 * 1024
+    BACKUP_COUNT = 5
+    FSYNC_INTERVAL = 5
+
+
+    def __init__(self, agent, path, file_format=FORMAT_JSON, max_bytes=None, backup_count=None, fsync_interval=None):
+        if file_format not in (FORMAT_JSON, FORMAT_BINARY, FORMAT_PPROF):
+            raise Exception('Unsupported sink format: ' + str(file_format))
+
+        self.agent = agent
+        self.path = path.replace('{pid}', str(os.getpid()))
+        self.file_format = file_format
+        self.max_bytes = max_bytes if max_bytes is not None else self.MAX_BYTES
+        self.backup_count = backup_count if backup_count is not None else self.BACKUP_COUNT
+        self.fsync_interval = fsync_interval if fsync_interval is not None else self.FSYNC_INTERVAL
+        self.file = None
+        self.size = 0
+        self.last_fsync_ts = 0
+        self.write_lock = threading.Lock()
+        self.profile_files = []
+
+
+    def open(self):
+        self.file = open(self.path, 'ab')
+        self.size = os.path.getsize(self.path)
+        self.last_fsync_ts = time.time()
+
+
+    def load_config(self):
+        return LOCAL_CONFIG
+
+
+    def upload(self, payload):
+        with self.write_lock:
+            if not self.file:
+                self.open()
+
+            for record in build_records(self.agent, payload):
+                if self.file_format == FORMAT_PPROF and is_profile(record['content']):
+                    self.write_profile(record['content'])
+                    continue
+
+                data = encode_record(record, self.file_format)
+
+                if self.size > 0 and self.size + len(data) > self.max_bytes:
+                    self.rotate()
+
+                self.file.write(data)
+                self.size += len(data)
+
+            self.file.flush()
+
+            if time.time() - self.last_fsync_ts >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                self.last_fsync_ts = time.time()
+
+        return {}
+
+
+    def write_profile(self, metric_map):
+        measurement_map = metric_map['measurement']
+        path = '{0}.{1}.{2}.{3}.pb.gz'.format(self.path, metric_map['category'], measurement_map['timestamp'], measurement_map['id'][0:8])
+
+        with open(path, 'wb') as f:
+            write_profile(f, metric_map)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.profile_files.append((path, os.path.getsize(path)))
+
+        max_total = (self.backup_count + 1) * self.max_bytes
+        while len(self.profile_files) > 1 and sum(size for _, size in self.profile_files) > max_total:
+            old_path, _ = self.profile_files.pop(0)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+
+
+    def rotate(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = '{0}.{1}'.format(self.path, i)
+                if os.path.exists(src):
+                    os.rename(src, '{0}.{1}'.format(self.path, i + 1))
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+        self.open()
+
+
+    def close(self):
+        with self.write_lock:
+            if self.file:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
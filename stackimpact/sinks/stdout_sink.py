@@ -0,0 +1,30 @@
+import sys
+
+from .file_sink import LOCAL_CONFIG, FORMAT_JSON, build_records, encode_record
+
+
+class StdoutSink(object):
+    '''Writes messages to the standard output as JSON lines.'''
+
+    STATEFUL = False
+
+
+    def __init__(self, agent):
+        self.agent = agent
+
+
+    def load_config(self):
+        return LOCAL_CONFIG
+
+
+    def upload(self, payload):
+        out = sys.stdout
+        for record in build_records(self.agent, payload):
+            out.write(encode_record(record, FORMAT_JSON).decode('utf-8'))
+        out.flush()
+
+        return {}
+
+
+    def close(self):
+        pass
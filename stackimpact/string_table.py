@@ -0,0 +1,138 @@
+import re
+
+from .utils import generate_uuid
+
+
+FRAME_NAME_REGEXP = re.compile(r'^(.+) \((.+):(\d+)\)$')
+CALLSITE_NAME_REGEXP = re.compile(r'^(.+):(\d+)$')
+
+
+class StringTable(object):
+    '''Maps strings to indices. New entries are sent with each upload and
+    committed once the upload succeeds, so that a table kept for the whole
+    session only sends strings the dashboard has not seen yet.'''
+
+    MAX_SIZE = 100000
+
+
+    def __init__(self):
+        self.session_id = None
+        self.strings = None
+        self.index = None
+        self.committed = 0
+
+        self.reset()
+
+
+    def reset(self):
+        self.session_id = generate_uuid()
+        self.strings = []
+        self.index = dict()
+        self.committed = 0
+
+
+    def ref(self, s):
+        i = self.index.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.strings.append(s)
+            self.index[s] = i
+
+        return i
+
+
+    def commit(self):
+        self.committed = len(self.strings)
+
+        if self.committed > self.MAX_SIZE:
+            self.reset()
+
+
+    def rollback(self):
+        for s in self.strings[self.committed:]:
+            del self.index[s]
+        del self.strings[self.committed:]
+
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'offset': self.committed,
+            'strings': self.strings[self.committed:]
+        }
+
+
+def encode_name(name, table):
+    match = FRAME_NAME_REGEXP.match(name)
+    if match:
+        func_name, filename, lineno = match.groups()
+        # only use the split form if it reproduces the name exactly
+        if '{0} ({1}:{2})'.format(func_name, filename, int(lineno)) == name:
+            return [table.ref(func_name), table.ref(filename), int(lineno)]
+
+    match = CALLSITE_NAME_REGEXP.match(name)
+    if match:
+        filename, lineno = match.groups()
+        if '{0}:{1}'.format(filename, int(lineno)) == name:
+            return [table.ref(filename), int(lineno)]
+
+    return table.ref(name)
+
+
+def decode_name(ref, strings):
+    if isinstance(ref, list):
+        if len(ref) == 3:
+            return '{0} ({1}:{2})'.format(strings[ref[0]], strings[ref[1]], ref[2])
+        else:
+            return '{0}:{1}'.format(strings[ref[0]], ref[1])
+
+    return strings[ref]
+
+
+def encode_breakdown(node_map, table):
+    '''Converts a Breakdown.to_dict() tree into the compact format, where
+    each node is a list [name, measurement, num_samples, children] followed
+    by metadata if it is not empty. The name is a string index, or a
+    [function, file, line] or [file, line] list for frame names.'''
+
+    node = [
+        encode_name(node_map['name'], table),
+        node_map['measurement'],
+        node_map['num_samples'],
+        [encode_breakdown(child_map, table) for child_map in node_map['children']]
+    ]
+
+    if node_map['metadata']:
+        node.append(node_map['metadata'])
+
+    return node
+
+
+def decode_breakdown(node, strings):
+    return {
+        'name': decode_name(node[0], strings),
+        'metadata': node[4] if len(node) > 4 else {},
+        'measurement': node[1],
+        'num_samples': node[2],
+        'children': [decode_breakdown(child, strings) for child in node[3]]
+    }
+
+
+def encode_metric(metric_map, table):
+    '''Returns a shallow copy of a Metric.to_dict() map with the
+    measurement breakdown, if any, in the compact format.'''
+
+    if not isinstance(metric_map, dict):
+        return metric_map
+
+    measurement_map = metric_map.get('measurement')
+    if not measurement_map or not measurement_map.get('breakdown'):
+        return metric_map
+
+    measurement_map = dict(measurement_map)
+    measurement_map['breakdown'] = encode_breakdown(measurement_map['breakdown'], table)
+
+    metric_map = dict(metric_map)
+    metric_map['measurement'] = measurement_map
+
+    return metric_map
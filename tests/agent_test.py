@@ -3,6 +3,8 @@ import sys
 import threading
 import random
 import time
+import os
+import json
 
 import stackimpact
 from stackimpact.runtime import runtime_info, min_version
@@ -184,5 +186,53 @@ class AgentTestCase(unittest.TestCase):
         agent.destroy()
         
 
+    def test_fork(self):
+        if runtime_info.OS_WIN or not hasattr(os, 'register_at_fork'):
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True
+        )
+
+        agent.span_reporter.start()
+        agent.message_queue.add('t1', {'m1': 1})
+        agent.message_queue.queue_lock.acquire()
+
+        parent_run_id = agent.run_id
+        parent_span_timer = agent.span_reporter.report_timer
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            result = {
+                'run_id_changed': agent.run_id != parent_run_id,
+                'queue_empty': len(agent.message_queue.queue) == 0,
+                'lock_free': agent.message_queue.queue_lock.acquire(False),
+                'upload_thread_alive': agent.message_queue.upload_thread.is_alive(),
+                'span_timer_replaced': agent.span_reporter.report_timer is not parent_span_timer
+            }
+            os.write(write_fd, json.dumps(result).encode('utf-8'))
+            os._exit(0)
+
+        agent.message_queue.queue_lock.release()
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        result = json.loads(os.read(read_fd, 4096).decode('utf-8'))
+        os.close(read_fd)
+
+        self.assertTrue(result['run_id_changed'])
+        self.assertTrue(result['queue_empty'])
+        self.assertTrue(result['lock_free'])
+        self.assertTrue(result['upload_thread_alive'])
+        self.assertTrue(result['span_timer_replaced'])
+        self.assertEqual(len(agent.message_queue.queue), 1)
+
+        agent.destroy()
+
+
 if __name__ == '__main__':
     unittest.main()
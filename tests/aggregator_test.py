@@ -0,0 +1,99 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import time
+
+import stackimpact
+from stackimpact.agent import Agent
+from stackimpact.aggregator import Aggregator, evaluate_p95
+from stackimpact.metric import Metric, Breakdown
+from stackimpact.runtime import runtime_info
+
+from test_server import TestServer
+
+
+class AggregatorTestCase(unittest.TestCase):
+
+    def test_aggregate(self):
+        if runtime_info.OS_WIN:
+            return
+
+        server = TestServer(5010)
+        server.set_response_data('{"agent_enabled":"yes"}')
+        server.start()
+
+        socket_path = os.path.join(tempfile.mkdtemp(), 'aggregator.sock')
+
+        aggregator = Aggregator(Agent())
+        aggregator.start(socket_path,
+            dashboard_address = 'http://localhost:5010',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True)
+        server.join()
+
+        for i in range(0, 50):
+            if aggregator.config:
+                break
+            time.sleep(0.1)
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5010',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            aggregator_socket = socket_path,
+            debug = True
+        )
+
+        agent.config_loader.load()
+        self.assertTrue(agent.config.is_agent_enabled())
+
+        for i in range(0, 2):
+            root = Breakdown('root')
+            root.find_or_add_child('func1 (file1.py:1)').increment(10, 1)
+            root.find_or_add_child('func' + str(i + 2) + ' (file1.py:2)').increment(5, 1)
+            root.propagate()
+
+            metric = Metric(agent, Metric.TYPE_PROFILE, Metric.CATEGORY_CPU_PROFILE, Metric.NAME_MAIN_THREAD_CPU_USAGE, Metric.UNIT_PERCENT)
+            metric.create_measurement(Metric.TRIGGER_TIMER, root.measurement, None, root)
+            agent.message_queue.add('metric', metric.to_dict())
+
+            metric = Metric(agent, Metric.TYPE_STATE, Metric.CATEGORY_RUNTIME, Metric.NAME_THREAD_COUNT, Metric.UNIT_NONE)
+            metric.create_measurement(Metric.TRIGGER_TIMER, 5 + i)
+            agent.message_queue.add('metric', metric.to_dict())
+
+            agent.message_queue.add('span', {'name': 'span1', 'samples': [1, 2, 3], 'count': 3})
+
+            self.assertTrue(agent.message_queue.flush(timeout=5))
+            self.assertEqual(len(agent.message_queue.queue), 0)
+
+        aggregator.aggregate()
+
+        messages = [m['content'] for m in aggregator.agent.message_queue.queue]
+        profile = [m for m in messages if m['type'] == Metric.TYPE_PROFILE][0]
+        self.assertEqual(profile['measurement']['value'], 30)
+        breakdown = Breakdown.from_dict(profile['measurement']['breakdown'])
+        self.assertEqual(breakdown.find_child('func1 (file1.py:1)').measurement, 20)
+        self.assertEqual(breakdown.find_child('func3 (file1.py:2)').measurement, 5)
+
+        thread_count = [m for m in messages if m['name'] == Metric.NAME_THREAD_COUNT][0]
+        self.assertEqual(thread_count['measurement']['value'], 6)
+
+        span = [m for m in messages if m['name'] == 'span1'][0]
+        self.assertEqual(span['measurement']['value'], 3)
+
+        agent.destroy()
+        aggregator.stop()
+
+
+    def test_evaluate_p95(self):
+        self.assertEqual(evaluate_p95([(list(range(1, 101)), 100)]), 95)
+        self.assertEqual(evaluate_p95([([1] * 10, 1000), ([100] * 10, 10)]), 1)
+        self.assertEqual(evaluate_p95([]), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+import time
+import threading
+
+import stackimpact
+from stackimpact.runtime import runtime_info
+from stackimpact.metric import Metric
+from stackimpact.anomaly_triggers import Trigger
+
+
+class AnomalyTriggersTestCase(unittest.TestCase):
+
+    def test_trigger_check(self):
+        trigger = Trigger({'metric': 'cpu_usage', 'above': 80, 'for_seconds': 10, 'cooldown': 100})
+
+        self.assertFalse(trigger.check(90, 0))
+        self.assertFalse(trigger.check(90, 5))
+        # the condition has to hold for 10 seconds
+        self.assertFalse(trigger.check(50, 8))
+        self.assertFalse(trigger.check(90, 10))
+        self.assertTrue(trigger.check(90, 20))
+
+        # cooldown
+        self.assertFalse(trigger.check(90, 40))
+        self.assertTrue(trigger.check(90, 130))
+
+        with self.assertRaises(Exception):
+            Trigger({'metric': 'span_p99', 'above': 100})
+
+
+    def test_span_p99(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            profile_triggers = [{'metric': 'span_p99', 'span': 'span1', 'above': 100, 'profiler': 'block'}],
+            debug = True
+        )
+
+        captures = []
+        agent.block_reporter.capture_report = lambda duration, reason: captures.append(reason)
+
+        agent.anomaly_triggers.start()
+
+        for i in range(100):
+            agent.anomaly_triggers.record_span('span1', 0.01)
+        agent.anomaly_triggers.record_span('span2', 1)
+        agent.anomaly_triggers.check()
+        time.sleep(0.1)
+        self.assertEqual(captures, [])
+
+        for i in range(10):
+            agent.anomaly_triggers.record_span('span1', 0.5)
+        agent.anomaly_triggers.check()
+        time.sleep(0.1)
+        self.assertEqual(captures, ['span_p99(span1) > 100'])
+
+        agent.destroy()
+
+
+    def test_rss_growth_windows(self):
+        if runtime_info.OS_WIN:
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            profile_triggers = [
+                {'metric': 'rss_growth', 'above': 50, 'for_seconds': 10},
+                {'metric': 'rss_growth', 'above': 5, 'for_seconds': 60}
+            ],
+            debug = True
+        )
+
+        triggers = agent.anomaly_triggers
+        triggers.start()
+        self.assertEqual(triggers.rss_window, 60)
+
+        # 100MB over the first 50 seconds, flat for the last 10
+        now = time.time()
+        for ts, rss in [(now - 70, 0), (now - 60, 0), (now - 50, 0), (now - 10, 102400), (now, 102400)]:
+            triggers.rss_samples.append((ts, rss))
+        self.assertEqual(triggers.read_rss_growth(now, 10), 0)
+        self.assertEqual(triggers.read_rss_growth(now, 60), 100)
+
+        # samples are kept for the longest window
+        triggers.sample_rss(now + 1)
+        self.assertEqual(triggers.rss_samples[0][0], now - 60)
+
+        agent.destroy()
+
+
+    def test_shared_capture_lock(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            debug = True
+        )
+
+        captures = []
+        def capture_report(duration, reason):
+            captures.append(threading.current_thread().daemon)
+        agent.block_reporter.capture_report = capture_report
+
+        trigger = Trigger({'metric': 'span_p99', 'span': 'span1', 'above': 100, 'profiler': 'block'})
+
+        # a capture requested by signal or socket is in progress
+        with agent.capture_lock:
+            agent.anomaly_triggers.fire(trigger, 200)
+        time.sleep(0.1)
+        self.assertEqual(captures, [])
+
+        agent.anomaly_triggers.fire(trigger, 200)
+        time.sleep(0.1)
+        self.assertEqual(captures, [True])
+        self.assertTrue(agent.capture_lock.acquire(False))
+        agent.capture_lock.release()
+
+        agent.destroy()
+
+
+    def test_cpu_usage_capture(self):
+        if runtime_info.OS_WIN:
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            profile_triggers = [{'metric': 'cpu_usage', 'above': 0, 'for_seconds': 0, 'duration': 1}],
+            profile_trigger_interval = 0.2,
+            debug = True
+        )
+
+        messages = []
+        def add_mock(topic, message, ack_func=None):
+            messages.append(message)
+        agent.message_queue.add = add_mock
+
+        agent.cpu_reporter.start()
+        agent.anomaly_triggers.start()
+
+        def cpu_work_main_thread():
+            timeout = time.time() + 5
+            while not messages and time.time() < timeout:
+                text = "text1" + str(time.time())
+        cpu_work_main_thread()
+
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['name'], Metric.NAME_MAIN_THREAD_CPU_USAGE)
+        self.assertEqual(messages[0]['measurement']['trigger'], Metric.TRIGGER_API)
+        self.assertEqual(messages[0]['measurement']['breakdown']['metadata']['capture_reason'], 'cpu_usage > 0')
+        self.assertTrue('cpu_work_main_thread' in str(messages[0]['measurement']['breakdown']))
+
+        agent.destroy()
+
+
+if __name__ == '__main__':
+    unittest.main()
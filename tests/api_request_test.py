@@ -6,6 +6,8 @@ import socket
 
 import stackimpact
 from stackimpact.api_request import APIRequest
+from stackimpact.runtime import min_version
+from stackimpact.metric import Breakdown
 
 from test_server import TestServer
 
@@ -47,5 +49,36 @@ class ApiRequestTestCase(unittest.TestCase):
         server.join()
 
 
+    def test_post_chunked(self):
+        server = TestServer(5002)
+        server.start()
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5002',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            upload_compression_level = 1,
+            debug = True
+        )
+
+        root = Breakdown('root')
+        for i in range(0, 10000):
+            root.find_or_add_child('child' + str(i)).increment(i, 1)
+        root.propagate()
+
+        api_request = APIRequest(agent)
+        api_request.BUFFER_SIZE = 1024
+
+        api_request.post('test', {'profile': root})
+        data = json.loads(server.get_request_data())
+        self.assertEqual(data['payload']['profile'], root.to_dict())
+        if min_version(3, 6):
+            self.assertTrue(server.is_request_chunked())
+
+        agent.destroy()
+        server.join()
+
+
 if __name__ == '__main__':
     unittest.main()
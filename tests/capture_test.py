@@ -0,0 +1,158 @@
+import unittest
+import os
+import json
+import time
+import signal
+import threading
+import tempfile
+
+import stackimpact
+from stackimpact.runtime import runtime_info
+from stackimpact.metric import Metric
+from stackimpact.capture import request_capture, request_history
+
+
+class CaptureTestCase(unittest.TestCase):
+
+    def test_capture_socket(self):
+        if runtime_info.OS_WIN:
+            return
+
+        capture_dir = tempfile.mkdtemp()
+        socket_path = os.path.join(capture_dir, 'capture-{pid}.sock')
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            capture_socket = socket_path,
+            capture_dir = capture_dir,
+            debug = True
+        )
+        agent.cpu_reporter.start()
+
+        result = dict()
+        def request():
+            try:
+                result['path'] = request_capture(socket_path.replace('{pid}', str(os.getpid())), 'cpu', 1, 'json')
+            except Exception as e:
+                result['error'] = str(e)
+
+        request_t = threading.Thread(target=request)
+        request_t.start()
+
+        def cpu_work_main_thread():
+            while request_t.is_alive():
+                text = "text1" + str(time.time())
+        cpu_work_main_thread()
+
+        request_t.join()
+
+        self.assertFalse('error' in result, result.get('error'))
+        self.assertTrue(result['path'].startswith(capture_dir))
+
+        with open(result['path']) as f:
+            metric_map = json.load(f)
+
+        self.assertEqual(metric_map['name'], Metric.NAME_MAIN_THREAD_CPU_USAGE)
+        self.assertEqual(metric_map['measurement']['trigger'], Metric.TRIGGER_API)
+        self.assertTrue('cpu_work_main_thread' in str(metric_map['measurement']['breakdown']))
+
+        with self.assertRaises(Exception):
+            request_capture(socket_path.replace('{pid}', str(os.getpid())), 'unknown', 1, 'json')
+
+        agent.destroy()
+
+        self.assertFalse(os.path.exists(socket_path.replace('{pid}', str(os.getpid()))))
+
+
+    def test_history_during_capture(self):
+        if runtime_info.OS_WIN:
+            return
+
+        capture_dir = tempfile.mkdtemp()
+        socket_path = os.path.join(capture_dir, 'capture.sock')
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            capture_socket = socket_path,
+            capture_dir = capture_dir,
+            profile_history = True,
+            debug = True
+        )
+        agent.cpu_reporter.start()
+
+        result = dict()
+        def request():
+            result['path'] = request_capture(socket_path, 'cpu', 3, 'json')
+
+        request_t = threading.Thread(target=request)
+        request_t.start()
+
+        timeout = time.time() + 5
+        while not agent.profiler_active and time.time() < timeout:
+            time.sleep(0.01)
+        self.assertTrue(agent.profiler_active)
+
+        # the capture does not hold up other requests
+        start = time.time()
+        self.assertEqual(request_history(socket_path, {'query': 'metrics'}), [])
+        self.assertTrue(time.time() - start < 1)
+        self.assertTrue(request_t.is_alive())
+
+        request_t.join()
+        self.assertTrue(result['path'].startswith(capture_dir))
+
+        agent.destroy()
+
+
+    def test_capture_signal(self):
+        if runtime_info.OS_WIN:
+            return
+
+        capture_dir = tempfile.mkdtemp()
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            capture_signal = True,
+            capture_dir = capture_dir,
+            debug = True
+        )
+        agent.capture_controller.DEFAULT_SECONDS = 1
+        agent.cpu_reporter.start()
+
+        os.kill(os.getpid(), signal.SIGUSR1)
+
+        timeout = time.time() + 10
+        while not os.listdir(capture_dir) and time.time() < timeout:
+            text = "text1" + str(time.time())
+        # wait for the file to be written
+        time.sleep(0.5)
+
+        files = os.listdir(capture_dir)
+        self.assertEqual(len(files), 1)
+        self.assertTrue('-cpu-' in files[0])
+
+        prev_handler = agent.capture_controller.prev_signal_handler
+        agent.destroy()
+
+        # no captures are started after destroy
+        self.assertEqual(signal.getsignal(signal.SIGUSR1), prev_handler)
+        self.assertFalse(agent.capture_controller.signal_registered)
+        self.assertEqual(agent.cpu_reporter.capture(1), None)
+        with self.assertRaises(Exception):
+            agent.capture_controller.capture('cpu', 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import tempfile
+
+from stackimpact.cgroup import detect, parse_pressure
+
+
+def write_tree(root, files):
+    for path, data in files.items():
+        path = os.path.join(root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+
+
+class CgroupTestCase(unittest.TestCase):
+
+    def test_v2(self):
+        root = tempfile.mkdtemp()
+        write_tree(root, {
+            'proc_cgroup': '0::/system.slice/app.service\n',
+            'cgroup/cgroup.controllers': 'cpu memory io\n',
+            'cgroup/system.slice/app.service/cpu.max': '200000 100000\n',
+            'cgroup/system.slice/app.service/cpu.stat': 'usage_usec 5000000\nuser_usec 4000000\nsystem_usec 1000000\nnr_periods 1000\nnr_throttled 250\nthrottled_usec 3000000\n',
+            'cgroup/system.slice/app.service/memory.current': '104857600\n',
+            'cgroup/system.slice/app.service/memory.max': '536870912\n',
+            'cgroup/system.slice/app.service/memory.pressure': 'some avg10=1.50 avg60=2.25 avg300=0.50 total=123456\nfull avg10=0.00 avg60=0.10 avg300=0.00 total=1234\n',
+            'cgroup/system.slice/app.service/cpu.pressure': 'some avg10=10.00 avg60=12.50 avg300=5.00 total=987654\n'
+        })
+
+        cgroup = detect(os.path.join(root, 'cgroup'), os.path.join(root, 'proc_cgroup'))
+        self.assertEqual(cgroup.version, 2)
+        self.assertEqual(cgroup.cpu_quota(), 2)
+        self.assertEqual(cgroup.cpu_throttling(), {'periods': 1000, 'throttled_periods': 250, 'throttled_time': 3000000000})
+        self.assertEqual(cgroup.memory_current(), 104857600)
+        self.assertEqual(cgroup.memory_max(), 536870912)
+        self.assertEqual(cgroup.pressure('memory')['some']['avg60'], 2.25)
+        self.assertEqual(cgroup.pressure('cpu')['some']['avg60'], 12.5)
+
+
+    def test_v2_unlimited(self):
+        root = tempfile.mkdtemp()
+        write_tree(root, {
+            'proc_cgroup': '0::/\n',
+            'cgroup/cgroup.controllers': 'cpu memory\n',
+            'cgroup/cpu.max': 'max 100000\n',
+            'cgroup/memory.max': 'max\n'
+        })
+
+        cgroup = detect(os.path.join(root, 'cgroup'), os.path.join(root, 'proc_cgroup'))
+        self.assertEqual(cgroup.cpu_quota(), None)
+        self.assertEqual(cgroup.memory_max(), None)
+        self.assertEqual(cgroup.cpu_throttling(), None)
+
+
+    def test_v1(self):
+        root = tempfile.mkdtemp()
+        write_tree(root, {
+            'proc_cgroup': '11:memory:/docker/abc\n4:cpu,cpuacct:/docker/abc\n1:name=systemd:/docker/abc\n',
+            # the container cgroup is mounted as root of the hierarchies
+            'cgroup/cpu,cpuacct/cpu.cfs_quota_us': '50000\n',
+            'cgroup/cpu,cpuacct/cpu.cfs_period_us': '100000\n',
+            'cgroup/cpu,cpuacct/cpu.stat': 'nr_periods 100\nnr_throttled 10\nthrottled_time 2000000\n',
+            'cgroup/memory/memory.usage_in_bytes': '1048576\n',
+            'cgroup/memory/memory.limit_in_bytes': '9223372036854771712\n'
+        })
+
+        cgroup = detect(os.path.join(root, 'cgroup'), os.path.join(root, 'proc_cgroup'))
+        self.assertEqual(cgroup.version, 1)
+        self.assertEqual(cgroup.cpu_quota(), 0.5)
+        self.assertEqual(cgroup.cpu_throttling(), {'periods': 100, 'throttled_periods': 10, 'throttled_time': 2000000})
+        self.assertEqual(cgroup.memory_current(), 1048576)
+        self.assertEqual(cgroup.memory_max(), None)
+        self.assertEqual(cgroup.pressure('memory'), None)
+
+
+    def test_missing(self):
+        root = tempfile.mkdtemp()
+        self.assertEqual(detect(os.path.join(root, 'cgroup'), os.path.join(root, 'proc_cgroup')), None)
+
+
+    def test_parse_pressure(self):
+        pressure = parse_pressure('some avg10=0.00 avg60=0.00 avg300=0.00 total=0\n')
+        self.assertEqual(pressure, {'some': {'avg10': 0.0, 'avg60': 0.0, 'avg300': 0.0, 'total': 0.0}})
+
+
+if __name__ == '__main__':
+    unittest.main()
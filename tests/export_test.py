@@ -0,0 +1,85 @@
+import unittest
+import json
+
+try:
+    # python 2
+    from StringIO import StringIO
+except ImportError:
+    # python 3
+    from io import StringIO
+
+import stackimpact
+from stackimpact.metric import Metric, Breakdown
+from stackimpact.export import iterate_stacks, write_folded, speedscope_profile
+
+
+def create_metric(agent, category=Metric.CATEGORY_CPU_PROFILE):
+    root = Breakdown('Execution call graph', Breakdown.TYPE_CALLGRAPH)
+    child1 = root.find_or_add_child('main (app.py:10)')
+    child1.increment(3, 6)
+    child2 = child1.find_or_add_child('work (app.py:20)')
+    child2.increment(2, 4)
+    child3 = child1.find_or_add_child('sleep (lib.py:5)')
+    child3.increment(0, 1)
+    root.propagate()
+    root.add_metadata('sampling_interval', 0.01)
+
+    metric = Metric(agent, Metric.TYPE_PROFILE, category, 'Test profile', Metric.UNIT_NONE)
+    metric.create_measurement(Metric.TRIGGER_TIMER, root.measurement, None, root)
+
+    return metric.to_dict()
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stackimpact._agent = None
+        self.agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True
+        )
+
+
+    def tearDown(self):
+        self.agent.destroy()
+
+
+    def test_iterate_stacks(self):
+        metric_map = create_metric(self.agent)
+
+        stacks = dict((';'.join(names), value) for names, value in iterate_stacks(metric_map['measurement']['breakdown'], 'num_samples'))
+        self.assertEqual(stacks, {
+            'main (app.py:10)': 6,
+            'main (app.py:10);work (app.py:20)': 4,
+            'main (app.py:10);sleep (lib.py:5)': 1
+        })
+
+
+    def test_write_folded(self):
+        out = StringIO()
+        write_folded(out, create_metric(self.agent, Metric.CATEGORY_BLOCK_PROFILE))
+
+        lines = sorted(out.getvalue().splitlines())
+        self.assertEqual(lines, [
+            'main (app.py:10) 3',
+            'main (app.py:10);work (app.py:20) 2'
+        ])
+
+
+    def test_speedscope_profile(self):
+        speedscope = speedscope_profile(create_metric(self.agent))
+        json.dumps(speedscope)
+
+        profile = speedscope['profiles'][0]
+        self.assertEqual(profile['unit'], 'nanoseconds')
+        self.assertEqual(len(profile['samples']), 3)
+        self.assertAlmostEqual(profile['endValue'], 11 * 1e7)
+
+        frames = speedscope['shared']['frames']
+        self.assertEqual(frames[profile['samples'][0][0]], {'name': 'main', 'file': 'app.py', 'line': 10})
+
+
+if __name__ == '__main__':
+    unittest.main()
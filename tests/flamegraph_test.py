@@ -0,0 +1,58 @@
+import unittest
+import random
+import xml.etree.ElementTree as ET
+
+try:
+    # python 2
+    from StringIO import StringIO
+except ImportError:
+    # python 3
+    from io import StringIO
+
+import stackimpact
+from stackimpact.metric import Metric, Breakdown
+from stackimpact.flamegraph import write_flamegraph
+
+
+class FlamegraphTestCase(unittest.TestCase):
+
+    def test_write_flamegraph(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True
+        )
+
+        rnd = random.Random(1)
+
+        # 100k nodes
+        root = Breakdown('Execution call graph', Breakdown.TYPE_CALLGRAPH)
+        num_nodes = 1
+        while num_nodes < 100000:
+            node = root
+            for d in range(0, 20):
+                name = 'func{0} (file{1}.py:{2}) <&>'.format(rnd.randint(0, 50), d, d)
+                if not node.find_child(name):
+                    num_nodes += 1
+                node = node.find_or_add_child(name)
+            node.increment(0, rnd.randint(1, 100))
+        root.propagate()
+
+        metric = Metric(agent, Metric.TYPE_PROFILE, Metric.CATEGORY_CPU_PROFILE, Metric.NAME_MAIN_THREAD_CPU_USAGE, Metric.UNIT_PERCENT)
+        metric.create_measurement(Metric.TRIGGER_TIMER, 100, None, root)
+
+        out = StringIO()
+        write_flamegraph(out, metric.to_dict())
+
+        svg = ET.fromstring(out.getvalue())
+        rects = svg.findall('.//{http://www.w3.org/2000/svg}g/{http://www.w3.org/2000/svg}rect')
+        self.assertTrue(len(rects) > 100)
+        self.assertTrue(len(rects) < 100000)
+
+        agent.destroy()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import sys
+import json
+import zlib
+import random
+
+from stackimpact.metric import Breakdown
+from stackimpact.json_encoder import iterencode, gzip_stream
+
+
+class JSONEncoderTestCase(unittest.TestCase):
+
+    def test_iterencode(self):
+        obj = {
+            'a': [1, 2.5, None, True, False, {'b': 'text "quoted" é'}],
+            'c': {},
+            'd': [[[]]],
+            'e': -10
+        }
+
+        out = ''.join(iterencode(obj, 4))
+        self.assertEqual(json.loads(out), obj)
+
+        self.assertEqual(''.join(iterencode(None)), 'null')
+        self.assertEqual(''.join(iterencode([])), '[]')
+
+
+    def test_iterencode_breakdown(self):
+        root = Breakdown('root')
+        child1 = root.find_or_add_child('child1')
+        child1.add_metadata('k', 'v')
+        child1.find_or_add_child('child2').increment(5, 2)
+        root.find_or_add_child('child3').increment(1, 1)
+        root.propagate()
+
+        out = ''.join(iterencode({'profile': root}))
+        self.assertEqual(json.loads(out), {'profile': root.to_dict()})
+
+
+    def test_gzip_stream(self):
+        chunks = ['{"a":' + str(random.randint(0, 1000000)) + '}' for i in range(0, 100000)]
+
+        blocks = list(gzip_stream(iter(chunks), 1, 1024))
+        self.assertTrue(len(blocks) > 1)
+
+        data = zlib.decompress(b''.join(blocks), 16 + zlib.MAX_WBITS)
+        self.assertEqual(data.decode('utf-8'), ''.join(chunks))
+
+
+if __name__ == '__main__':
+    unittest.main()
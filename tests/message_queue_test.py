@@ -1,9 +1,13 @@
 import unittest
 import sys
 import json
+import time
+import threading
 
 import stackimpact
 from stackimpact.utils import timestamp
+from stackimpact.metric import Metric, Breakdown
+from stackimpact.string_table import decode_breakdown
 
 from test_server import TestServer
 
@@ -36,7 +40,7 @@ class MessageQueueTest(unittest.TestCase):
 
         agent.message_queue.queue[0]['added_at'] = timestamp() - 20 * 60
 
-        agent.message_queue.flush()
+        self.assertTrue(agent.message_queue.flush(timeout=5))
 
         data = json.loads(server.get_request_data())
         self.assertEqual(data['payload']['messages'][0]['content']['m2'], 2)
@@ -68,11 +72,176 @@ class MessageQueueTest(unittest.TestCase):
         }        
         agent.message_queue.add('t1', m)
 
-        agent.message_queue.flush()
+        agent.message_queue.flush(timeout=5)
         self.assertEqual(len(agent.message_queue.queue), 2)
 
         agent.destroy()
         server.join()
 
+
+    def test_flush_compact(self):
+        server = TestServer(5009)
+        server.start()
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5009',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            compact_payload = True,
+            compact_payload_session = True,
+            debug = True
+        )
+
+        root = Breakdown('root')
+        root.find_or_add_child('func1 (/path/file1.py:1)').increment(1, 1)
+        root.propagate()
+
+        metric = Metric(agent, Metric.TYPE_PROFILE, Metric.CATEGORY_CPU_PROFILE, Metric.NAME_MAIN_THREAD_CPU_USAGE, Metric.UNIT_PERCENT)
+        metric.create_measurement(Metric.TRIGGER_TIMER, root.measurement, None, root)
+        agent.message_queue.add('metric', metric.to_dict())
+
+        self.assertTrue(agent.message_queue.flush(timeout=5))
+
+        data = json.loads(server.get_request_data())
+        string_table = data['payload']['string_table']
+        self.assertEqual(string_table['offset'], 0)
+
+        breakdown = data['payload']['messages'][0]['content']['measurement']['breakdown']
+        self.assertEqual(decode_breakdown(breakdown, string_table['strings']), root.to_dict())
+        self.assertEqual(agent.message_queue.string_table.committed, len(string_table['strings']))
+
+        agent.destroy()
+        server.join()
+
+
+    def test_flush_custom_sink(self):
+        class CustomSink(object):
+            def __init__(self):
+                self.payloads = []
+
+            def upload(self, payload):
+                self.payloads.append(payload)
+
+            def load_config(self):
+                return {'agent_enabled': 'yes'}
+
+            def close(self):
+                pass
+
+        sink = CustomSink()
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            sink = sink,
+            compact_payload = True,
+            delta_profiles = True,
+            debug = True
+        )
+
+        agent.cpu_reporter.start()
+        agent.cpu_reporter.profile_duration = 1
+        agent.cpu_reporter.report()
+
+        self.assertTrue(agent.message_queue.flush(timeout=5))
+
+        self.assertEqual(len(sink.payloads), 1)
+        message = sink.payloads[0]['messages'][0]
+        self.assertEqual(message['content']['name'], Metric.NAME_MAIN_THREAD_CPU_USAGE)
+        # plain, full profiles without a string table
+        self.assertFalse('string_table' in sink.payloads[0])
+        self.assertEqual(message['content']['measurement']['breakdown']['name'], 'Execution call graph')
+
+        agent.destroy()
+
+
+    def test_flush_nonblocking(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5007',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True
+        )
+
+        started = threading.Event()
+        release = threading.Event()
+        def blocked_upload():
+            started.set()
+            release.wait()
+        agent.message_queue.submit(blocked_upload)
+        started.wait()
+
+        for i in range(0, agent.message_queue.MAX_PENDING_UPLOADS):
+            self.assertTrue(agent.message_queue.submit(lambda: None))
+
+        agent.message_queue.add('t1', {'m1': 1})
+
+        start = time.time()
+        agent.message_queue.flush()
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(agent.message_queue.dropped_uploads, 1)
+        self.assertFalse(agent.message_queue.wait(0.1))
+
+        release.set()
+        self.assertTrue(agent.message_queue.wait(5))
+
+        agent.destroy()
+
+
+    def test_stop_full_queue(self):
+        class CustomSink(object):
+            def __init__(self):
+                self.closed = threading.Event()
+
+            def upload(self, payload):
+                pass
+
+            def load_config(self):
+                return {'agent_enabled': 'yes'}
+
+            def close(self):
+                self.closed.set()
+
+        sink = CustomSink()
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            sink = sink,
+            debug = True
+        )
+
+        started = threading.Event()
+        release = threading.Event()
+        uploads = []
+        def blocked_upload():
+            started.set()
+            release.wait()
+            uploads.append(sink.closed.is_set())
+        agent.message_queue.submit(blocked_upload)
+        started.wait()
+
+        for i in range(0, agent.message_queue.MAX_PENDING_UPLOADS):
+            self.assertTrue(agent.message_queue.submit(lambda: uploads.append(None)))
+
+        # the sink is not closed under the running upload
+        agent.message_queue.stop()
+        self.assertFalse(sink.closed.wait(0.2))
+
+        release.set()
+        self.assertTrue(sink.closed.wait(5))
+        self.assertEqual(uploads, [False])
+
+        agent.destroy()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -56,6 +56,43 @@ class MetricTestCase(unittest.TestCase):
         self.assertFalse(child2.find_child('child2child1'))
 
 
+    def test_profile_prune(self):
+        root = Breakdown('root')
+        for i in range(1, 11):
+            child = root.find_or_add_child('child' + str(i))
+            for j in range(1, 11):
+                child.find_or_add_child('child' + str(i) + '_' + str(j)).increment(i * j, 1)
+        root.propagate()
+
+        total = root.measurement
+        self.assertEqual(root.count_nodes(), 111)
+
+        self.assertEqual(root.prune(max_nodes = 15), 96)
+        self.assertEqual(root.count_nodes(), 15)
+        self.assertEqual(root.measurement, total)
+        self.assertTrue(root.find_child('child10').find_child('child10_10'))
+        self.assertFalse(root.find_child('child1'))
+        self.assertEqual(root.get_metadata('pruned_nodes'), 96)
+
+        self.assertTrue(root.get_metadata('pruned_measurement') > 0)
+
+        self.assertEqual(root.prune(max_bytes = 1000000), 0)
+        self.assertEqual(root.prune(max_bytes = 100), 14)
+        self.assertEqual(root.count_nodes(), 1)
+
+        # a lighter node which fits is kept after a heavier one which does not
+        root = Breakdown('root')
+        root.find_or_add_child('a' * 200).increment(10, 1)
+        root.find_or_add_child('b').increment(5, 1)
+        root.find_or_add_child('c').increment(1, 1)
+        root.propagate()
+
+        self.assertEqual(root.prune(max_bytes = 200), 2)
+        self.assertTrue(root.find_child('b'))
+        self.assertFalse(root.find_child('c'))
+        self.assertEqual(root.measurement, 16)
+
+
     def test_profile_depth(self):
         root = Breakdown("root")
 
@@ -0,0 +1,114 @@
+import unittest
+import time
+import threading
+
+import stackimpact
+from stackimpact.runtime import runtime_info
+
+
+class OverheadGovernorTestCase(unittest.TestCase):
+
+    def test_adjust(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            max_cpu_overhead = 1,
+            debug = True
+        )
+
+        governor = agent.overhead_governor
+
+        governor.adjust(2, 1)
+        self.assertEqual(governor.factor, 2)
+        self.assertEqual(governor.sampling_interval(0.01), 0.02)
+        self.assertEqual(governor.span_duration(5), 2.5)
+
+        for i in range(0, 5):
+            governor.adjust(2, 1)
+        self.assertEqual(governor.factor, governor.MAX_FACTOR)
+        self.assertTrue(governor.should_skip())
+        self.assertEqual(governor.span_duration(5), 1)
+        self.assertFalse(agent.cpu_reporter.start_profiling(True, False))
+
+        governor.adjust(0.1, 1)
+        self.assertFalse(governor.should_skip())
+        governor.adjust(0.1, 1)
+        self.assertEqual(governor.factor, governor.MAX_FACTOR / 2)
+
+        governor.adjust(0.8, 1)
+        self.assertEqual(governor.factor, governor.MAX_FACTOR / 2)
+
+        agent.destroy()
+
+
+    def test_update(self):
+        if runtime_info.OS_WIN:
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            max_cpu_overhead = 1,
+            debug = True
+        )
+
+        governor = agent.overhead_governor
+        governor.update()
+
+        for i in range(0, 1000000):
+            str(i)
+        agent.overhead_reporter.cpu_time += 1000
+
+        governor.update()
+        self.assertTrue(governor.overhead > 1)
+        self.assertEqual(governor.factor, 2)
+
+        agent.destroy()
+
+
+    def test_normalized_profile(self):
+        if runtime_info.OS_WIN:
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            debug = True
+        )
+
+        agent.overhead_governor.factor = 4
+        profiler = agent.cpu_reporter.profiler
+        profiler.reset()
+
+        def record():
+            profiler.start_profiler()
+            time.sleep(1)
+            profiler.stop_profiler()
+
+        record_t = threading.Thread(target=record)
+        record_t.start()
+
+        def cpu_work_main_thread():
+            while record_t.is_alive():
+                text = "text1" + str(time.time())
+        cpu_work_main_thread()
+
+        record_t.join()
+
+        profile = profiler.build_profile(1)[0]['profile']
+        self.assertAlmostEqual(profile.get_metadata('sampling_interval'), 0.04)
+        # the main thread was busy during the whole span
+        self.assertTrue(profile.measurement > 50 and profile.measurement < 150)
+
+        agent.destroy()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+import os
+import gzip
+import tempfile
+
+import stackimpact
+from stackimpact.metric import Metric, Breakdown
+from stackimpact.pprof import encode_profile, write_profile
+from stackimpact.sinks.file_sink import FileSink, read_records
+
+
+def read_varint(buf, pos):
+    value = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return value, pos
+        shift += 7
+
+
+def decode_message(buf):
+    # returns a dict of field number to the list of values
+    fields = dict()
+    pos = 0
+    while pos < len(buf):
+        tag, pos = read_varint(buf, pos)
+        if tag & 7 == 0:
+            value, pos = read_varint(buf, pos)
+        else:
+            length, pos = read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        fields.setdefault(tag >> 3, []).append(value)
+
+    return fields
+
+
+def decode_packed(buf):
+    values = []
+    pos = 0
+    while pos < len(buf):
+        value, pos = read_varint(buf, pos)
+        values.append(value)
+
+    return values
+
+
+class PprofTestCase(unittest.TestCase):
+
+    def create_metric(self, agent):
+        root = Breakdown('Execution call graph', Breakdown.TYPE_CALLGRAPH)
+        child1 = root.find_or_add_child('main (app.py:10)')
+        child1.increment(0, 6)
+        child2 = child1.find_or_add_child('work (app.py:20)')
+        child2.increment(0, 4)
+        child3 = child1.find_or_add_child('sleep (lib.py:5)')
+        child3.increment(0, 1)
+        root.propagate()
+        root.add_metadata('sampling_interval', 0.01)
+
+        metric = Metric(agent, Metric.TYPE_PROFILE, Metric.CATEGORY_CPU_PROFILE, Metric.NAME_MAIN_THREAD_CPU_USAGE, Metric.UNIT_PERCENT)
+        metric.create_measurement(Metric.TRIGGER_TIMER, root.measurement, None, root)
+
+        return metric.to_dict()
+
+
+    def test_encode_profile(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True
+        )
+
+        profile = decode_message(bytearray(encode_profile(self.create_metric(agent))))
+
+        strings = [bytes(s).decode('utf-8') for s in profile[6]]
+        self.assertEqual(strings[0], '')
+
+        sample_types = [decode_message(t) for t in profile[1]]
+        self.assertEqual([(strings[t[1][0]], strings[t[2][0]]) for t in sample_types], [('samples', 'count'), ('cpu', 'nanoseconds')])
+
+        functions = dict()
+        for f in profile[5]:
+            f = decode_message(f)
+            functions[f[1][0]] = (strings[f[2][0]], strings[f[4][0]])
+
+        locations = dict()
+        for l in profile[4]:
+            l = decode_message(l)
+            line = decode_message(l[4][0])
+            locations[l[1][0]] = functions[line[1][0]] + (line[2][0],)
+
+        samples = dict()
+        for s in profile[2]:
+            s = decode_message(s)
+            stack = tuple(locations[i][0] for i in decode_packed(s[1][0]))
+            samples[stack] = decode_packed(s[2][0])
+
+        self.assertEqual(samples[('work', 'main')], [4, 40000000])
+        self.assertEqual(samples[('sleep', 'main')], [1, 10000000])
+        self.assertEqual(samples[('main',)], [6, 60000000])
+        self.assertEqual(locations[1][1:], ('app.py', 10))
+
+        self.assertEqual(profile[12][0], 10000000)
+
+        agent.destroy()
+
+
+    def test_file_sink(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True
+        )
+
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'profiles')
+
+        sink = FileSink(agent, path, 'pprof')
+        sink.upload({'messages': [{'topic': 'metric', 'content': self.create_metric(agent)}, {'topic': 't1', 'content': {'m1': 1}}]})
+        sink.close()
+
+        self.assertEqual(len(list(read_records(path))), 1)
+
+        profile_files = [f for f in os.listdir(tmp_dir) if f.endswith('.pb.gz')]
+        self.assertEqual(len(profile_files), 1)
+        self.assertTrue(profile_files[0].startswith('profiles.cpu-profile.'))
+
+        with gzip.open(os.path.join(tmp_dir, profile_files[0]), 'rb') as f:
+            profile = decode_message(bytearray(f.read()))
+        self.assertEqual(len(profile[2]), 3)
+
+        agent.destroy()
+
+
+if __name__ == '__main__':
+    unittest.main()
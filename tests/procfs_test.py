@@ -0,0 +1,74 @@
+import unittest
+import os
+import tempfile
+
+from stackimpact.runtime import runtime_info
+from stackimpact.procfs import parse_stat, read_stat, parse_fields, read_process, CLOCK_TICKS, PAGE_SIZE
+
+
+class ProcfsTestCase(unittest.TestCase):
+
+    def test_parse_stat(self):
+        data = '1234 (python (worker) 1) S 1 1234 1234 0 -1 4194560 5000 0 0 0 250 50 0 0 20 0 7 0 100 104857600 2560 18446744073709551615 0 0 0 0 0 0 0 16781312 134234626 0 0 0 17 3 0 0 0 0 0\n'
+
+        stat = parse_stat(data)
+        self.assertEqual(stat['name'], 'python (worker) 1')
+        self.assertEqual(stat['cpu_time'], int(300 / CLOCK_TICKS * 1e9))
+        self.assertEqual(stat['num_threads'], 7)
+        self.assertEqual(stat['vm_size'], 102400)
+        self.assertEqual(stat['rss'], 2560 * PAGE_SIZE // 1024)
+
+
+    def test_read_stat(self):
+        if not runtime_info.OS_LINUX:
+            return
+
+        stat = read_stat()
+        self.assertTrue(stat['rss'] > 0)
+        self.assertTrue(stat['num_threads'] >= 1)
+
+        self.assertEqual(read_stat('/nonexistent'), None)
+
+
+    def test_parse_fields(self):
+        fields = parse_fields('Name:\tpython\nVmRSS:\t    1300 kB\nvoluntary_ctxt_switches:\t12\n')
+        self.assertEqual(fields, {'VmRSS': 1300, 'voluntary_ctxt_switches': 12})
+
+        fields = parse_fields('55822b4fd000-7ffc23b6d000 ---p 00000000 00:00 0 [rollup]\nPss:  481 kB\n')
+        self.assertEqual(fields, {'Pss': 481})
+
+
+    def test_read_process(self):
+        proc_dir = tempfile.mkdtemp()
+
+        files = {
+            'stat': '1234 (python) S 1 1234 1234 0 -1 4194560 5000 0 0 0 250 50 0 0 20 0 7 0 100 104857600 2560 0\n',
+            'status': 'VmSize:\t  102400 kB\nVmRSS:\t   10240 kB\nRssAnon:\t    8192 kB\nRssFile:\t    2048 kB\nRssShmem:\t       0 kB\nVmSwap:\t     512 kB\nvoluntary_ctxt_switches:\t100\nnonvoluntary_ctxt_switches:\t5\n',
+            'io': 'rchar: 1000\nwchar: 2000\nsyscr: 10\nsyscw: 20\nread_bytes: 4096\nwrite_bytes: 8192\ncancelled_write_bytes: 0\n'
+        }
+        for name, data in files.items():
+            with open(os.path.join(proc_dir, name), 'w') as f:
+                f.write(data)
+
+        os.mkdir(os.path.join(proc_dir, 'fd'))
+        for fd in ('0', '1', '2'):
+            open(os.path.join(proc_dir, 'fd', fd), 'w').close()
+
+        process = read_process(proc_dir)
+        self.assertEqual(process['num_threads'], 7)
+        self.assertEqual(process['current_rss'], 10240)
+        self.assertEqual(process['anon_rss'], 8192)
+        self.assertEqual(process['file_rss'], 2048)
+        self.assertEqual(process['swap'], 512)
+        self.assertEqual(process['voluntary_ctxt_switches'], 100)
+        self.assertEqual(process['involuntary_ctxt_switches'], 5)
+        self.assertEqual(process['read_chars'], 1000)
+        self.assertEqual(process['write_syscalls'], 20)
+        self.assertEqual(process['write_bytes'], 8192)
+        self.assertEqual(process['open_fds'], 3)
+        # no smaps_rollup
+        self.assertFalse('pss' in process)
+
+
+if __name__ == '__main__':
+    unittest.main()
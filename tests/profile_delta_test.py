@@ -0,0 +1,52 @@
+import unittest
+import sys
+
+from stackimpact.metric import Breakdown
+from stackimpact.profile_delta import compute_delta, apply_delta
+
+
+def build_tree(values):
+    root = Breakdown('root')
+    for path, value in values.items():
+        node = root
+        for name in path.split('/'):
+            node = node.find_or_add_child(name)
+        node.increment(value, 1)
+    root.propagate()
+    return root
+
+
+class ProfileDeltaTestCase(unittest.TestCase):
+
+    def test_delta(self):
+        base = build_tree({'a/b': 100, 'a/c': 50, 'd/e': 10, 'f': 5})
+        current = build_tree({'a/b': 101, 'a/c': 70, 'd/e': 10, 'g/h': 1})
+
+        delta = compute_delta(base, current, 0.05)
+
+        a = delta.find_child('a')
+        self.assertTrue(a)
+        self.assertFalse(a.find_child('b'))
+        self.assertEqual(a.find_child('c').measurement, 70)
+        self.assertFalse(delta.find_child('d'))
+        self.assertEqual(delta.find_child('f').get_metadata('delta'), 'removed')
+        self.assertEqual(delta.find_child('g').find_child('h').measurement, 1)
+
+        reconstructed = apply_delta(base, delta)
+        self.assertEqual(reconstructed.find_child('a').find_child('b').measurement, 100)
+        self.assertEqual(reconstructed.find_child('a').find_child('c').measurement, 70)
+        self.assertEqual(reconstructed.find_child('d').find_child('e').measurement, 10)
+        self.assertFalse(reconstructed.find_child('f'))
+        self.assertEqual(reconstructed.find_child('g').find_child('h').measurement, 1)
+        self.assertEqual(base.find_child('f').measurement, 5)
+
+
+    def test_no_change(self):
+        base = build_tree({'a/b': 100})
+        current = build_tree({'a/b': 100})
+
+        self.assertEqual(compute_delta(base, current, 0), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+import os
+import tempfile
+
+import stackimpact
+from stackimpact.runtime import runtime_info
+from stackimpact.metric import Metric, Breakdown
+from stackimpact.capture import request_history
+
+
+class ProfileHistoryTestCase(unittest.TestCase):
+
+    def record(self, agent, values, duration, metric_name=Metric.NAME_UNCOLLECTED_ALLOCATIONS):
+        root = Breakdown('root')
+        for name, value in values.items():
+            child = root.find_or_add_child('func1 (file1.py:10)').find_or_add_child(name)
+            child.measurement = value
+            child.num_samples = 1
+        root.propagate()
+
+        metric = Metric(agent, Metric.TYPE_PROFILE, Metric.CATEGORY_MEMORY_PROFILE, metric_name, Metric.UNIT_BYTE)
+        metric.create_measurement(Metric.TRIGGER_TIMER, root.measurement, 1, root)
+        agent.profile_history.record_profile(metric, root, metric.measurement.timestamp - 60, duration)
+        return metric
+
+
+    def test_merged_and_top(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            profile_history = True,
+            debug = True
+        )
+
+        history = agent.profile_history
+
+        self.record(agent, {'file1.py:20': 100, 'file1.py:30': 10}, 10)
+        metric2 = self.record(agent, {'file1.py:20': 40, 'file1.py:40': 200}, 30)
+
+        profiles = history.profiles_between(Metric.CATEGORY_MEMORY_PROFILE)
+        self.assertEqual(len(profiles), 2)
+
+        merged = history.merged_profile(Metric.CATEGORY_MEMORY_PROFILE, since=0)
+        self.assertEqual(merged['measurement']['windows'], 2)
+        # averaged over the profiled time
+        self.assertAlmostEqual(merged['measurement']['value'], (110 * 10 + 240 * 30) / 40)
+
+        top = history.top_nodes(merged, 2)
+        self.assertEqual(top[0][0], 'file1.py:40')
+        self.assertAlmostEqual(top[0][1], 150)
+        self.assertEqual(top[1][0], 'file1.py:20')
+        self.assertAlmostEqual(top[1][1], 55)
+
+        window = history.window_profile(Metric.CATEGORY_MEMORY_PROFILE, window_id=metric2.measurement.id)
+        self.assertEqual(window['measurement']['value'], 240)
+
+        top = history.query({'query': 'top', 'category': Metric.CATEGORY_MEMORY_PROFILE, 'limit': 1})
+        self.assertEqual(top, [{'name': 'file1.py:40', 'measurement': 200}])
+
+        agent.destroy()
+
+
+    def test_profile_names(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            profile_history = True,
+            debug = True
+        )
+
+        history = agent.profile_history
+
+        self.record(agent, {'file1.py:20': 100}, 10)
+        self.record(agent, {'file1.py:30': 6000}, 10, Metric.NAME_LEAKING_ALLOCATIONS)
+
+        # profiles of different names are not merged
+        with self.assertRaises(Exception) as cm:
+            history.merged_profile(Metric.CATEGORY_MEMORY_PROFILE, since=0)
+        self.assertTrue(Metric.NAME_LEAKING_ALLOCATIONS in str(cm.exception))
+
+        with self.assertRaises(Exception):
+            history.query({'query': 'top', 'category': Metric.CATEGORY_MEMORY_PROFILE})
+
+        merged = history.merged_profile(Metric.CATEGORY_MEMORY_PROFILE, Metric.NAME_LEAKING_ALLOCATIONS, since=0)
+        self.assertEqual(merged['measurement']['value'], 6000)
+        self.assertEqual(len(history.profiles_between(Metric.CATEGORY_MEMORY_PROFILE)), 2)
+
+        agent.destroy()
+
+
+    def test_memory_cap(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            profile_history = True,
+            profile_history_windows = 5,
+            debug = True
+        )
+
+        history = agent.profile_history
+
+        for i in range(10):
+            self.record(agent, {'file1.py:' + str(i): i}, 10)
+        self.assertEqual(len(history.profiles_between(Metric.CATEGORY_MEMORY_PROFILE)), 5)
+
+        agent.options['profile_history_max_bytes'] = history.profile_bytes // 2
+        self.record(agent, {'file1.py:20': 1}, 10)
+        self.assertTrue(history.profile_bytes <= agent.options['profile_history_max_bytes'])
+        self.assertTrue(len(history.profiles_between(Metric.CATEGORY_MEMORY_PROFILE)) < 5)
+
+        agent.destroy()
+
+
+    def test_socket_query(self):
+        if runtime_info.OS_WIN:
+            return
+
+        socket_path = os.path.join(tempfile.mkdtemp(), 'capture.sock')
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            profile_history = True,
+            capture_socket = socket_path,
+            debug = True
+        )
+
+        self.record(agent, {'file1.py:20': 100}, 10)
+
+        agent.process_reporter.reset()
+        agent.process_reporter.report_metric(Metric.TYPE_STATE, Metric.CATEGORY_RUNTIME, Metric.NAME_THREAD_COUNT, Metric.UNIT_NONE, 3)
+
+        merged = request_history(socket_path, {'query': 'merged', 'category': Metric.CATEGORY_MEMORY_PROFILE, 'minutes': 10})
+        self.assertEqual(merged['measurement']['value'], 100)
+
+        series = request_history(socket_path, {'query': 'metrics', 'name': Metric.NAME_THREAD_COUNT})
+        self.assertEqual(len(series), 1)
+        self.assertEqual(series[0]['points'][0][1], 3)
+
+        agent.destroy()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,11 @@ import time
 import unittest
 import random
 import threading
+import collections
 
 import stackimpact
 from stackimpact.runtime import min_version, runtime_info
+from stackimpact.metric import Metric
 
 
 class AllocationProfilerTestCase(unittest.TestCase):
@@ -62,8 +64,189 @@ class AllocationProfilerTestCase(unittest.TestCase):
         #print(str(profile))
 
         self.assertTrue('allocation_profiler_test.py' in str(profile))
+        self.assertFalse(agent.frame_cache.agent_dir in str(profile))
+
+        # node names are kept for the next windows
+        profiler = agent.allocation_reporter.profiler
+        self.assertTrue(any(filename.endswith('allocation_profiler_test.py') for filename, _ in profiler.frame_names))
+
+        agent.destroy()
+
+
+    def test_profile_budget(self):
+        if runtime_info.OS_WIN or not min_version(3, 4):
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            debug = True
+        )
+
+        profiler = agent.allocation_reporter.profiler
+
+        def build_profile():
+            profiler.reset()
+            node = profiler.profile.find_or_add_child('app.py:10')
+            node.find_or_add_child('large.py:20').increment(100000, 1)
+            node.find_or_add_child('small.py:30').increment(500, 1)
+            return profiler.build_profile(1)[0]['profile'].find_child('app.py:10')
+
+        # nodes under 1KB per second are dropped
+        self.assertEqual(build_profile().find_child('small.py:30'), None)
+
+        # unless the node budget decides
+        agent.options['max_profile_nodes'] = 100
+        self.assertTrue(build_profile().find_child('small.py:30'))
+
+        agent.destroy()
+
+
+    def test_after_fork(self):
+        if runtime_info.OS_WIN or not min_version(3, 4):
+            return
+
+        import tracemalloc
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            debug = True
+        )
+
+        profiler = agent.allocation_reporter.profiler
+
+        # tracing started by the application is kept in the child
+        tracemalloc.start()
+        try:
+            profiler.after_fork()
+            self.assertTrue(tracemalloc.is_tracing())
+
+            # tracing of an active profiling span is stopped
+            profiler.tracing = True
+            profiler.after_fork()
+            self.assertFalse(tracemalloc.is_tracing())
+            self.assertFalse(profiler.tracing)
+
+            # so is the trace kept for leak detection
+            tracemalloc.start()
+            profiler.leak_tracing = True
+            profiler.after_fork()
+            self.assertFalse(tracemalloc.is_tracing())
+            self.assertFalse(profiler.leak_tracing)
+        finally:
+            tracemalloc.stop()
+
+        agent.destroy()
+
+
+    def test_leak_profile(self):
+        if runtime_info.OS_WIN or not min_version(3, 4):
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            debug = True
+        )
+
+        profiler = agent.allocation_reporter.profiler
+
+        leak = (('app.py', 10), ('leak.py', 20))
+        cache = (('app.py', 10), ('cache.py', 30))
+        temporary = (('app.py', 10), ('handler.py', 40))
+
+        # live size growth per call site of 10 second windows
+        windows = [
+            {leak: 100000, cache: 800000, temporary: 50000},
+            {leak: 110000, cache: 200000, temporary: -50000},
+            {leak: 90000, cache: 50000, temporary: 50000},
+            {leak: 100000, cache: 10000, temporary: -50000},
+            {leak: 100000, cache: 5000}
+        ]
+        for growth in windows:
+            profiler.leak_windows.append((10, growth))
+
+        leak_profile = profiler.build_leak_profile()
+        leak_node = leak_profile.find_child('app.py:10').find_child('leak.py:20')
+        # 100KB per 10 seconds
+        self.assertEqual(leak_node.measurement, 600000)
+        self.assertEqual(leak_profile.find_child('app.py:10').find_child('cache.py:30'), None)
+        self.assertEqual(leak_profile.find_child('app.py:10').find_child('handler.py:40'), None)
+
+        agent.destroy()
+
+
+    def test_leak_detection(self):
+        if runtime_info.OS_WIN or not min_version(3, 4):
+            return
+
+        import tracemalloc
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            allocation_leak_detection = True,
+            debug = True
+        )
+
+        profiler = agent.allocation_reporter.profiler
+        profiler.MIN_LEAK_WINDOW_DURATION = 0
+
+        cache = collections.deque(maxlen=2000)
+        leaked = []
+
+        def cache_items():
+            for i in range(5000):
+                cache.append(bytearray(500))
+
+        def leak_items():
+            for i in range(200):
+                leaked.append(bytearray(500))
+
+        cache_items()
+
+        for i in range(6):
+            # allocations between the spans count as well
+            cache_items()
+            leak_items()
+
+            profiler.reset()
+            profiler.start_profiler()
+            cache_items()
+            leak_items()
+            profiler.stop_profiler()
+            profile_data = profiler.build_profile(1)
+
+            self.assertTrue(tracemalloc.is_tracing())
+
+        self.assertEqual(profile_data[1]['name'], Metric.NAME_LEAKING_ALLOCATIONS)
+        self.assertEqual(profile_data[1]['unit_interval'], 60)
+
+        cache_line = cache_items.__code__.co_firstlineno + 2
+        leak_line = leak_items.__code__.co_firstlineno + 2
+
+        # the cache is in the trace, but its live size does not grow
+        self.assertTrue(any((__file__, cache_line) in callsite for callsite in profiler.leak_sizes))
+
+        leak_profile = str(profile_data[1]['profile'].to_dict())
+        self.assertTrue('allocation_profiler_test.py:{0}'.format(leak_line) in leak_profile)
+        self.assertFalse('allocation_profiler_test.py:{0}'.format(cache_line) in leak_profile)
 
         agent.destroy()
+        self.assertFalse(tracemalloc.is_tracing())
 
 
 if __name__ == '__main__':
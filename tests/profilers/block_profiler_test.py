@@ -107,6 +107,7 @@ class BlockProfilerTestCase(unittest.TestCase):
         self.assertTrue('lock_wait' in str(profile))
         self.assertTrue('event_wait' in str(profile))
         self.assertTrue('url_wait' in str(profile))
+        self.assertAlmostEqual(profile['metadata']['sampling_interval'], 0.05)
 
         agent.destroy()
 
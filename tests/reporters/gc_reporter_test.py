@@ -0,0 +1,59 @@
+
+import unittest
+import gc
+
+import stackimpact
+from stackimpact.metric import Metric
+
+
+class GCReporterTestCase(unittest.TestCase):
+
+    def test_record_pauses(self):
+        if not hasattr(gc, 'callbacks'):
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            gc_pause_threshold = 0,
+            debug = True
+        )
+        agent.gc_reporter.start()
+
+        messages = []
+        def add_mock(topic, message, ack_func=None):
+            messages.append(message)
+        agent.message_queue.add = add_mock
+
+        def allocate_containers():
+            objects = []
+            for i in range(100000):
+                objects.append([i])
+            return objects
+        allocate_containers()
+        gc.collect()
+
+        agent.gc_reporter.report()
+        agent.destroy()
+
+        self.assertFalse(agent.gc_reporter.gc_callback in gc.callbacks)
+
+        metrics = dict((m['name'], m) for m in messages)
+
+        gen0 = metrics[Metric.NAME_GC_GEN0_PAUSE_TIME]['measurement']
+        self.assertTrue(gen0['rollup']['count'] > 0)
+        self.assertTrue(gen0['value'] >= gen0['rollup']['max'])
+
+        gen2 = metrics[Metric.NAME_GC_GEN2_PAUSE_TIME]['measurement']
+        self.assertTrue(gen2['rollup']['count'] >= 1)
+
+        pauses = metrics[Metric.NAME_GC_PAUSES]
+        self.assertEqual(pauses['category'], Metric.CATEGORY_GC_PROFILE)
+        self.assertTrue('allocate_containers' in str(pauses['measurement']['breakdown']))
+        self.assertTrue('test_record_pauses' in str(pauses['measurement']['breakdown']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+
+import unittest
+
+import stackimpact
+from stackimpact.metric import Metric
+from stackimpact.reporters.heap_reporter import type_name
+
+
+class LeakyObject(object):
+    pass
+
+
+class HeapReporterTestCase(unittest.TestCase):
+
+    def test_type_name(self):
+        self.assertEqual(type_name(dict), 'dict')
+        self.assertEqual(type_name(LeakyObject), __name__ + '.LeakyObject')
+
+
+    def test_report_growth(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            heap_profiler = True,
+            heap_profiler_sizes = True,
+            debug = True
+        )
+        agent.heap_reporter.start()
+
+        messages = []
+        def add_mock(topic, message, ack_func=None):
+            messages.append(message)
+        agent.message_queue.add = add_mock
+
+        # first scan is the baseline
+        agent.heap_reporter.report()
+        self.assertEqual([m['name'] for m in messages], [Metric.NAME_HEAP_OBJECTS])
+
+        leaked = [LeakyObject() for i in range(50000)]
+        agent.heap_reporter.report()
+
+        agent.destroy()
+
+        metrics = dict((m['name'], m) for m in messages)
+        profile = metrics[Metric.NAME_HEAP_GROWTH]
+        self.assertEqual(profile['category'], Metric.CATEGORY_HEAP_PROFILE)
+
+        nodes = profile['measurement']['breakdown']['children']
+        node = [n for n in nodes if n['name'] == __name__ + '.LeakyObject'][0]
+        self.assertTrue(node['measurement'] >= 50000)
+        self.assertTrue(node['metadata']['objects'] >= 50000)
+        self.assertTrue(node['metadata']['bytes_growth'] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
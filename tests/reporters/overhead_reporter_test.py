@@ -0,0 +1,52 @@
+import unittest
+import sys
+
+import stackimpact
+from stackimpact.runtime import perf_counter_ns
+from stackimpact.metric import Metric
+
+
+class OverheadReporterTestCase(unittest.TestCase):
+
+    def test_report(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            overhead_metrics = True,
+            debug = True
+        )
+        agent.overhead_reporter.start()
+
+        messages = []
+        def add_mock(topic, message, ack_func=None):
+            messages.append(message)
+        agent.message_queue.add = add_mock
+
+        reporter = agent.overhead_reporter
+        reporter.record_time(Metric.NAME_AGENT_SAMPLING_TIME, 'CPU profiler', perf_counter_ns())
+        reporter.record(Metric.NAME_AGENT_SAMPLING_TIME, 'CPU profiler', 2)
+        reporter.record(Metric.NAME_AGENT_SAMPLING_TIME, 'Block profiler', 3)
+        reporter.record(Metric.NAME_AGENT_PROFILE_NODES, 'CPU profiler', 10)
+        reporter.record(Metric.NAME_AGENT_PROFILE_NODES, 'CPU profiler', 5)
+        reporter.record(Metric.NAME_AGENT_UPLOAD_LATENCY, 'upload', 10)
+        reporter.record(Metric.NAME_AGENT_UPLOAD_LATENCY, 'upload', 20)
+        reporter.report()
+
+        metrics = dict((m['name'], m['measurement']) for m in messages)
+
+        sampling_time = metrics[Metric.NAME_AGENT_SAMPLING_TIME]
+        self.assertTrue(sampling_time['value'] >= 5 and sampling_time['value'] < 6)
+        self.assertEqual(len(sampling_time['breakdown']['children']), 2)
+
+        self.assertEqual(metrics[Metric.NAME_AGENT_PROFILE_NODES]['value'], 10)
+        self.assertEqual(metrics[Metric.NAME_AGENT_UPLOAD_LATENCY]['value'], 15)
+        self.assertTrue(Metric.NAME_AGENT_QUEUED_MESSAGES in metrics)
+        self.assertEqual(reporter.stats, {})
+
+        agent.destroy()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,15 @@
 import time
 import unittest
 import sys
+import os
+import tempfile
+import threading
 
 import stackimpact
 from stackimpact.runtime import runtime_info, min_version
 from stackimpact.metric import Metric
+from stackimpact.cgroup import Cgroup
+from stackimpact.reporters.process_reporter import thread_pool_name
 
 
 class ProcessReporterTestCase(unittest.TestCase):
@@ -36,6 +41,10 @@ class ProcessReporterTestCase(unittest.TestCase):
         if runtime_info.OS_LINUX:
             self.is_valid(metrics, Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_CURRENT_RSS, 0, float("inf"))
             self.is_valid(metrics, Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_VM_SIZE, 0, float("inf"))
+            self.is_valid(metrics, Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_ANON_RSS, 0, float("inf"))
+            self.is_valid(metrics, Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_SWAP, 0, float("inf"))
+            self.is_valid(metrics, Metric.TYPE_COUNTER, Metric.CATEGORY_CPU, Metric.NAME_VOLUNTARY_CTX_SWITCHES, 0, float("inf"))
+            self.is_valid(metrics, Metric.TYPE_STATE, Metric.CATEGORY_RUNTIME, Metric.NAME_OPEN_FDS, 1, float("inf"))
 
         self.is_valid(metrics, Metric.TYPE_STATE, Metric.CATEGORY_GC, Metric.NAME_GC_COUNT, 0, float("inf"))
         if min_version(3, 4):
@@ -48,6 +57,129 @@ class ProcessReporterTestCase(unittest.TestCase):
         agent.destroy()
 
 
+    def test_sample_rollup(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            process_sampling_interval = 0.05,
+            debug = True
+        )
+        agent.process_reporter.start()
+
+        # CPU usage is reported from the second report
+        agent.process_reporter.report()
+        time.sleep(0.5)
+        agent.process_reporter.report()
+
+        metrics = agent.process_reporter.metrics
+
+        thread_count = metrics[Metric.TYPE_STATE + Metric.CATEGORY_RUNTIME + Metric.NAME_THREAD_COUNT]
+        rollup = thread_count.to_dict()['measurement']['rollup']
+        self.assertTrue(rollup['count'] >= 5)
+        self.assertTrue(rollup['min'] <= rollup['avg'] <= rollup['max'])
+        self.assertEqual(sum(rollup['histogram']), rollup['count'])
+
+        if runtime_info.OS_LINUX:
+            current_rss = metrics[Metric.TYPE_STATE + Metric.CATEGORY_MEMORY + Metric.NAME_CURRENT_RSS]
+            rollup = current_rss.to_dict()['measurement']['rollup']
+            self.assertTrue(rollup['last'] > 0)
+
+            cpu_usage = metrics[Metric.TYPE_STATE + Metric.CATEGORY_CPU + Metric.NAME_CPU_USAGE]
+            self.assertTrue(cpu_usage.to_dict()['measurement']['rollup']['count'] >= 4)
+
+        # rollups are reset after each report
+        self.assertEqual(agent.process_reporter.rollups[Metric.NAME_THREAD_COUNT].count(), 0)
+
+        agent.destroy()
+
+
+    def test_cgroup(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True
+        )
+
+        cgroup_dir = tempfile.mkdtemp()
+        for name, data in [('cpu.cfs_quota_us', '50000'), ('cpu.cfs_period_us', '100000'), ('cpu.stat', 'nr_periods 100\nnr_throttled 10\nthrottled_time 2000000\n'), ('memory.usage_in_bytes', '1048576')]:
+            with open(os.path.join(cgroup_dir, name), 'w') as f:
+                f.write(data)
+
+        agent.process_reporter.cgroup = Cgroup(1, cgroup_dir, cgroup_dir)
+        agent.process_reporter.start()
+        agent.process_reporter.report()
+
+        # CPU usage is relative to the quota
+        self.assertEqual(agent.process_reporter.available_cpus(), 0.5)
+
+        metrics = agent.process_reporter.metrics
+        self.is_valid(metrics, Metric.TYPE_STATE, Metric.CATEGORY_CPU, Metric.NAME_CPU_QUOTA, 0.5, 0.5)
+        self.is_valid(metrics, Metric.TYPE_COUNTER, Metric.CATEGORY_CPU, Metric.NAME_THROTTLED_PERIODS, 0, float("inf"))
+        self.is_valid(metrics, Metric.TYPE_STATE, Metric.CATEGORY_MEMORY, Metric.NAME_CGROUP_MEMORY_USAGE, 1024, 1024)
+
+        agent.destroy()
+
+
+    def test_thread_pool_name(self):
+        self.assertEqual(thread_pool_name('ThreadPoolExecutor-0_3'), 'ThreadPoolExecutor')
+        self.assertEqual(thread_pool_name('Thread-5 (run)'), 'Thread')
+        self.assertEqual(thread_pool_name('worker.12'), 'worker')
+        self.assertEqual(thread_pool_name('MainThread'), 'MainThread')
+        self.assertEqual(thread_pool_name('123'), '123')
+
+
+    def test_thread_cpu(self):
+        if not runtime_info.OS_LINUX or not min_version(3, 8):
+            return
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            debug = True
+        )
+
+        messages = []
+        def add_mock(topic, message, ack_func=None):
+            messages.append(message)
+        agent.message_queue.add = add_mock
+
+        agent.process_reporter.start()
+        agent.process_reporter.report()
+
+        done = threading.Event()
+        def cpu_work():
+            while not done.is_set():
+                text = "text1" + str(time.time())
+
+        workers = [threading.Thread(target=cpu_work, name='busy-worker-' + str(i)) for i in range(2)]
+        for t in workers:
+            t.start()
+        time.sleep(0.5)
+
+        agent.process_reporter.report()
+
+        done.set()
+        for t in workers:
+            t.join()
+
+        thread_cpu = [m for m in messages if m['name'] == Metric.NAME_THREAD_CPU_USAGE]
+        self.assertEqual(len(thread_cpu), 1)
+
+        breakdown = thread_cpu[0]['measurement']['breakdown']
+        pools = dict((c['name'], c) for c in breakdown['children'])
+        self.assertTrue('busy-worker' in pools)
+        self.assertEqual(len(pools['busy-worker']['children']), 2)
+        self.assertTrue(pools['busy-worker']['measurement'] > 10)
+
+        agent.destroy()
+
+
     def is_valid(self, metrics, typ, category, name, min_value, max_value):
         key = typ + category + name
 
@@ -0,0 +1,96 @@
+import unittest
+import sys
+
+import stackimpact
+from stackimpact.metric import Metric, Breakdown
+from stackimpact.reporters.profile_reporter import ProfileReporter, ProfilerConfig
+
+
+class TestProfiler(object):
+
+    def __init__(self):
+        self.ready = True
+        self.profile = None
+        self.values = None
+
+    def setup(self):
+        pass
+
+    def destroy(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def reset(self):
+        self.profile = None
+
+    def build_profile(self, duration):
+        self.profile = Breakdown('root')
+        for name, value in self.values.items():
+            self.profile.find_or_add_child(name).increment(value, 1)
+        self.profile.propagate()
+
+        return [{
+            'category': Metric.CATEGORY_CPU_PROFILE,
+            'name': Metric.NAME_MAIN_THREAD_CPU_USAGE,
+            'unit': Metric.UNIT_PERCENT,
+            'unit_interval': None,
+            'profile': self.profile
+        }]
+
+
+class ProfileReporterTestCase(unittest.TestCase):
+
+    def test_report_delta(self):
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            delta_profiles = True,
+            delta_keyframe_interval = 2,
+            debug = True
+        )
+
+        messages = []
+        def add_mock(topic, message, ack_func=None):
+            messages.append(message)
+            ack_func()
+        agent.message_queue.add = add_mock
+
+        config = ProfilerConfig()
+        config.log_prefix = 'Test profiler'
+        config.report_interval = 120
+        config.report_only = True
+        profiler = TestProfiler()
+        reporter = ProfileReporter(agent, profiler, config)
+        reporter.start()
+
+        def breakdown(i):
+            return messages[i]['measurement']['breakdown']
+
+        profiler.values = {'a': 10, 'b': 20}
+        reporter.report()
+        self.assertFalse('delta_base' in breakdown(0)['metadata'])
+        self.assertEqual(len(breakdown(0)['children']), 2)
+
+        profiler.values = {'a': 10, 'b': 30}
+        reporter.report()
+        self.assertEqual(breakdown(1)['metadata']['delta_base'], messages[0]['measurement']['id'])
+        self.assertEqual([c['name'] for c in breakdown(1)['children']], ['b'])
+
+        profiler.values = {'a': 10, 'b': 30}
+        reporter.report()
+        self.assertEqual(breakdown(2)['metadata']['delta_base'], messages[1]['measurement']['id'])
+        self.assertEqual(breakdown(2)['children'], [])
+
+        reporter.report()
+        self.assertFalse('delta_base' in breakdown(3)['metadata'])
+
+        agent.destroy()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import os
+import time
+import threading
+import tempfile
+
+import stackimpact
+from stackimpact.runtime import runtime_info
+from stackimpact.frame import Frame
+from stackimpact.metric import Metric
+from stackimpact.sample_recording import SampleRecorder, read_recording, replay, write_varint, read_varint, PROFILER_CPU, PROFILER_BLOCK
+
+
+class SampleRecordingTestCase(unittest.TestCase):
+
+    def test_varint(self):
+        buf = bytearray()
+        values = [0, 1, 127, 128, 300, 2 ** 40, 2 ** 64 - 1]
+        for value in values:
+            write_varint(buf, value)
+
+        pos = 0
+        for value in values:
+            decoded, pos = read_varint(buf, pos)
+            self.assertEqual(decoded, value)
+        self.assertEqual(pos, len(buf))
+
+
+    def test_read_recording(self):
+        path = os.path.join(tempfile.mkdtemp(), 'samples.rec')
+
+        stack = [Frame('func2', 'file1.py', 20), Frame('func1', 'file1.py', 10)]
+
+        recorder = SampleRecorder(path)
+        recorder.open()
+        recorder.record_sample(PROFILER_CPU, 1, 0.01, stack)
+        recorder.record_sample(PROFILER_BLOCK, 2, 0.05, stack[1:])
+        recorder.record_span(PROFILER_CPU, 2.5)
+        recorder.close()
+
+        records = list(read_recording(path))
+        self.assertEqual(len(records), 3)
+
+        self.assertEqual(records[0][0:2], ('sample', PROFILER_CPU))
+        self.assertEqual(records[0][3], 1)
+        self.assertAlmostEqual(records[0][4], 0.01)
+        self.assertEqual([str(f) for f in records[0][5]], ['func2 (file1.py:20)', 'func1 (file1.py:10)'])
+
+        self.assertEqual(records[1][0:2], ('sample', PROFILER_BLOCK))
+        self.assertEqual(records[1][3], 2)
+        self.assertEqual([str(f) for f in records[1][5]], ['func1 (file1.py:10)'])
+
+        self.assertEqual(records[2], ('span', PROFILER_CPU, 2.5))
+
+
+    def test_concurrent_flush(self):
+        path = os.path.join(tempfile.mkdtemp(), 'samples.rec')
+
+        recorder = SampleRecorder(path)
+        recorder.open()
+
+        done = threading.Event()
+        def flush_loop():
+            while not done.is_set():
+                recorder.flush()
+        t = threading.Thread(target=flush_loop)
+        t.start()
+
+        # every sample introduces a new frame
+        num_samples = 20000
+        try:
+            for i in range(num_samples):
+                stack = [Frame('func' + str(i), 'file1.py', i), Frame('main', 'file1.py', 1)]
+                recorder.record_sample(PROFILER_CPU, 1, 0.01, stack)
+        finally:
+            done.set()
+            t.join()
+        recorder.close()
+
+        records = list(read_recording(path))
+        self.assertEqual(len(records), num_samples)
+        self.assertEqual(str(records[-1][5][0]), 'func{0} (file1.py:{0})'.format(num_samples - 1))
+
+
+    def test_record_and_replay(self):
+        if runtime_info.OS_WIN:
+            return
+
+        path = os.path.join(tempfile.mkdtemp(), 'samples.rec')
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            sample_recording_file = path,
+            debug = True
+        )
+
+        agent.cpu_reporter.profiler.reset()
+
+        def record():
+            agent.cpu_reporter.profiler.start_profiler()
+            time.sleep(1)
+            agent.cpu_reporter.profiler.stop_profiler()
+
+        record_t = threading.Thread(target=record)
+        record_t.start()
+
+        def cpu_work_main_thread():
+            while record_t.is_alive():
+                text = "text1" + str(time.time())
+        cpu_work_main_thread()
+
+        record_t.join()
+
+        agent.destroy()
+
+        stackimpact._agent = None
+        agent = stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            debug = True
+        )
+
+        messages = []
+        def add_mock(topic, message, ack_func=None):
+            messages.append(message)
+        agent.message_queue.add = add_mock
+
+        stats = replay(agent, path)
+        self.assertTrue(stats['samples'] > 10)
+
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['name'], Metric.NAME_MAIN_THREAD_CPU_USAGE)
+        self.assertTrue('cpu_work_main_thread' in str(messages[0]['measurement']['breakdown']))
+        self.assertTrue(messages[0]['measurement']['value'] > 50)
+
+        agent.destroy()
+
+
+if __name__ == '__main__':
+    unittest.main()
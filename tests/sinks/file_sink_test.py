@@ -0,0 +1,83 @@
+import unittest
+import os
+import json
+import tempfile
+
+import stackimpact
+from stackimpact.sinks.file_sink import FileSink, read_records, FORMAT_JSON, FORMAT_BINARY
+
+
+class FileSinkTestCase(unittest.TestCase):
+
+    def start_agent(self, **kwargs):
+        stackimpact._agent = None
+        return stackimpact.start(
+            dashboard_address = 'http://localhost:5001',
+            agent_key = 'key1',
+            app_name = 'TestPythonApp',
+            auto_profiling = False,
+            debug = True,
+            **kwargs
+        )
+
+
+    def test_upload(self):
+        agent = self.start_agent()
+
+        for file_format in (FORMAT_JSON, FORMAT_BINARY):
+            path = os.path.join(tempfile.mkdtemp(), 'profiles-{pid}.log')
+
+            sink = FileSink(agent, path, file_format)
+            sink.upload({'messages': [{'topic': 't1', 'content': {'m1': 1}}, {'topic': 't1', 'content': {'m2': 2}}]})
+            sink.close()
+
+            path = path.replace('{pid}', str(os.getpid()))
+            records = list(read_records(path, file_format))
+            self.assertEqual(len(records), 2)
+            self.assertEqual(records[0]['topic'], 't1')
+            self.assertEqual(records[0]['app_name'], 'TestPythonApp')
+            self.assertEqual(records[1]['content'], {'m2': 2})
+
+        agent.destroy()
+
+
+    def test_rotate(self):
+        agent = self.start_agent()
+
+        path = os.path.join(tempfile.mkdtemp(), 'profiles.log')
+
+        sink = FileSink(agent, path, max_bytes=2000, backup_count=2)
+        for i in range(0, 20):
+            sink.upload({'messages': [{'topic': 't1', 'content': {'i': i, 'data': 'x' * 500}}]})
+        sink.close()
+
+        self.assertTrue(os.path.getsize(path) <= 2000)
+        self.assertTrue(os.path.exists(path + '.1'))
+        self.assertTrue(os.path.exists(path + '.2'))
+        self.assertFalse(os.path.exists(path + '.3'))
+
+        records = list(read_records(path))
+        self.assertEqual(records[-1]['content']['i'], 19)
+
+        agent.destroy()
+
+
+    def test_message_queue(self):
+        path = os.path.join(tempfile.mkdtemp(), 'profiles.log')
+
+        agent = self.start_agent(sink = 'file', sink_file = path)
+
+        self.assertEqual(agent.message_queue.sink.load_config()['agent_enabled'], 'yes')
+
+        agent.message_queue.add('t1', {'m1': 1})
+        self.assertTrue(agent.message_queue.flush(timeout=5))
+
+        agent.destroy()
+
+        records = list(read_records(path))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['content'], {'m1': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
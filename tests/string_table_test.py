@@ -0,0 +1,65 @@
+import unittest
+import sys
+import json
+import zlib
+
+from stackimpact.metric import Breakdown
+from stackimpact.frame import Frame
+from stackimpact.string_table import StringTable, encode_breakdown, decode_breakdown
+
+
+class StringTableTestCase(unittest.TestCase):
+
+    def test_encode_decode(self):
+        root = Breakdown('root')
+        child1 = root.find_or_add_child(str(Frame('func1', '/path/to/file1.py', 10)))
+        child1.add_metadata('k', 'v')
+        child2 = child1.find_or_add_child(str(Frame('func2', '/path/to/file1.py', 20)))
+        child2.find_or_add_child('/path/to/file2.py:30').increment(5, 1)
+        child2.find_or_add_child('ValueError: (a:1)').increment(1, 1)
+        root.propagate()
+
+        table = StringTable()
+        compact_map = encode_breakdown(root.to_dict(), table)
+
+        self.assertEqual(table.strings.count('/path/to/file1.py'), 1)
+        self.assertEqual(decode_breakdown(compact_map, table.strings), root.to_dict())
+
+
+    def test_session(self):
+        table = StringTable()
+        table.ref('a')
+        table.ref('b')
+        table.commit()
+
+        table.ref('a')
+        table.ref('c')
+        self.assertEqual(table.to_dict()['offset'], 2)
+        self.assertEqual(table.to_dict()['strings'], ['c'])
+
+        table.rollback()
+        self.assertEqual(table.strings, ['a', 'b'])
+        self.assertEqual(table.ref('d'), 2)
+
+
+    def test_payload_size(self):
+        root = Breakdown('root')
+        for i in range(0, 200):
+            node = root
+            for j in range(0, 20):
+                frame = Frame('func' + str(j), '/usr/lib/python3/site-packages/package/module' + str(j) + '.py', i + j)
+                node = node.find_or_add_child(str(frame))
+            node.increment(i, 1)
+        root.propagate()
+
+        table = StringTable()
+        compact_map = encode_breakdown(root.to_dict(), table)
+        compact_json = json.dumps({'p': compact_map, 's': table.to_dict()})
+        full_json = json.dumps({'p': root.to_dict()})
+
+        self.assertTrue(len(compact_json) * 4 < len(full_json))
+        self.assertTrue(len(zlib.compress(compact_json.encode('utf-8'))) < len(zlib.compress(full_json.encode('utf-8'))))
+
+
+if __name__ == '__main__':
+    unittest.main()
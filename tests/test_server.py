@@ -29,6 +29,9 @@ class TestServer(threading.Thread):
     def get_request_data(self):
         return RequestHandler.request_data
 
+    def is_request_chunked(self):
+        return RequestHandler.request_chunked
+
     def set_response_data(self, response_data):
         RequestHandler.response_data = response_data
 
@@ -43,6 +46,7 @@ class RequestHandler(BaseHTTPRequestHandler):
     delay = None
     handler_func = None
     request_data = None
+    request_chunked = None
     response_data = '{}'
     response_code = 200
 
@@ -65,12 +69,31 @@ class RequestHandler(BaseHTTPRequestHandler):
             time.sleep(self.delay)
 
         self.request_url = self.path
-        content_len = int(self.headers.get('content-length'))
-
-        decompressed_data = gzip.GzipFile(fileobj=BytesIO(self.rfile.read(content_len))).read()
+        if self.headers.get('transfer-encoding') == 'chunked':
+            RequestHandler.request_chunked = True
+            body = self.read_chunked()
+        else:
+            RequestHandler.request_chunked = False
+            content_len = int(self.headers.get('content-length'))
+            body = self.rfile.read(content_len)
+
+        decompressed_data = gzip.GzipFile(fileobj=BytesIO(body)).read()
         RequestHandler.request_data = decompressed_data.decode('utf-8')
 
         self.send_response(RequestHandler.response_code)
         self.send_header('Content-Type', 'application/json')
         self.end_headers()
         self.wfile.write(RequestHandler.response_data.encode('utf-8'))
+
+
+    def read_chunked(self):
+        body = BytesIO()
+        while True:
+            chunk_len = int(self.rfile.readline().strip(), 16)
+            if chunk_len == 0:
+                self.rfile.readline()
+                break
+            body.write(self.rfile.read(chunk_len))
+            self.rfile.readline()
+
+        return body.getvalue()